@@ -5,15 +5,21 @@ Analyzes posts and generates script suggestions using Google AI (Gemini 2.5 Pro)
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 import os
-from google import genai
-from google.genai import types
-from typing import Optional
-import base64
+from typing import Optional, List
 import re
 import time
 import json
-from psycopg2.extras import RealDictCursor
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from psycopg2.extras import RealDictCursor, execute_values
 from database import get_db_connection
+import gemini
+import analysis_cache
+import prompt_cache
+import sse
+import mediaprep
+import analysis_parser
+import responsecache
 
 router = APIRouter(prefix="/api/analysis", tags=["analysis"])
 
@@ -23,26 +29,33 @@ from apiconfig import get_api_key
 def get_google_key():
         return get_api_key("GOOGLE_API_KEY") or os.getenv("GOOGLE_API_KEY", "")
 
+# 分析使用的模型（同时作为分析缓存 key 的一部分）
+ANALYSIS_MODEL = 'gemini-2.5-pro'
+
+# 批量分析：单次最多帖子数、工作线程数（实际 Gemini 并发受 gemini.MAX_CONCURRENCY_PER_KEY 限制）、
+# 每攒够多少条结果批量写入一次 popular 表
+BATCH_MAX_POSTS = int(os.getenv("ANALYSIS_BATCH_MAX_POSTS", "50"))
+BATCH_MAX_WORKERS = int(os.getenv("ANALYSIS_BATCH_MAX_WORKERS", "8"))
+BATCH_WRITE_SIZE = 10
+
 class AnalysisRequest(BaseModel):
     post_id: str
     user_id: int
+    force_refresh: bool = False  # 跳过共享缓存，强制重新分析
+
+class BatchAnalysisRequest(BaseModel):
+    post_ids: List[str]
+    user_id: int
+    force_refresh: bool = False
 
 class AnalysisResponse(BaseModel):
     success: bool
     message: str
     data: Optional[dict] = None
 
-def get_prompt_template_image_sidecar(caption: str) -> str:
-    """
-    获取 Image/Sidecar 类型的提示词（内置）
-    
-    Args:
-        caption: 竞品文案
-    
-    Returns:
-        完整的提示词
-    """
-    return f"""## (C) Capacity & Role (角色与能力)
+# Image/Sidecar 类型提示词中固定不变的部分（角色、品牌信息、红线、输出格式），
+# 作为 system_instruction / 缓存上下文发送，每次请求只发送 get_prompt_input_image_sidecar() 生成的变化部分
+IMAGE_SIDECAR_SYSTEM_PROMPT = """## (C) Capacity & Role (角色与能力)
 你是一名顶级的社交媒体内容策略师，同时也是专精于中东（MENA）市场的品牌文化专家。你擅长"逆向工程"解构竞品内容，并能将任何创意策略"安全地"本地化，使其100%符合我方的品牌视觉规范和中东的文化红线。
 
 ## (I) Insight & Context (洞察与上下文)
@@ -67,14 +80,7 @@ def get_prompt_template_image_sidecar(caption: str) -> str:
     * **活动:** 用"家庭聚会/听音乐"代替"派对/舞会/摇滚"。
 
 **3. 竞品帖子 (Competitor Input):**
-* **[INPUT] 竞品文案原文:**
-```
-{caption}
-```
-* **[INPUT] 竞品图片/视觉描述:**
-```
-[已通过图片上传]
-```
+* 竞品文案原文和竞品图片在用户消息的 [INPUT] 中提供。
 
 ## (R) Request & Task (请求与任务)
 请严格遵守上述 (I) 中的所有规范，执行以下两项任务：
@@ -124,17 +130,44 @@ def get_prompt_template_image_sidecar(caption: str) -> str:
 * **输出约束:** 你的分析和脚本内容请使用**中文**生成，**并严格按照中文的排版输出，中文必须向左对齐**（脚本中的"帖子文案"部分除外，该部分需提供中文和阿拉伯语）（不要输出开场白，每次输出只允许按照输出格式进行输出）。"""
 
 
-def get_prompt_template_video(caption: str) -> str:
+def get_prompt_input_image_sidecar(caption: str) -> str:
     """
-    获取 Video 类型的提示词（内置）
+    获取 Image/Sidecar 类型提示词中随帖子变化的部分（竞品文案）
+    
+    Args:
+        caption: 竞品文案
+    
+    Returns:
+        用户消息中的输入部分
+    """
+    return f"""**3. 竞品帖子 (Competitor Input):**
+* **[INPUT] 竞品文案原文:**
+```
+{caption}
+```
+* **[INPUT] 竞品图片/视觉描述:**
+```
+[已通过图片上传]
+```
+"""
+
+
+def get_prompt_template_image_sidecar(caption: str) -> str:
+    """
+    获取 Image/Sidecar 类型的提示词（内置）
     
     Args:
         caption: 竞品文案
     
     Returns:
-        完整的提示词
+        完整的提示词（固定部分 + 输入部分）
     """
-    return f"""## (C) Capacity & Role (角色与能力)
+    return IMAGE_SIDECAR_SYSTEM_PROMPT + "\n\n" + get_prompt_input_image_sidecar(caption)
+
+
+# Video 类型提示词中固定不变的部分（角色、品牌信息、红线、输出格式），
+# 作为 system_instruction / 缓存上下文发送，每次请求只发送 get_prompt_input_video() 生成的变化部分
+VIDEO_SYSTEM_PROMPT = """## (C) Capacity & Role (角色与能力)
 你是一名顶级的社交媒体分析师，专精于中东（MENA）市场的短视频（Reels）内容生态。你拥有敏锐的洞察力，能够"逆向工程"解构任何视频帖子的爆款逻辑，将其拆解为底层的策略元素。
 
 ## (I) Insight & Context (洞察与上下文)
@@ -148,14 +181,7 @@ def get_prompt_template_video(caption: str) -> str:
 * **转化策略 (Conversion Strategy / CTA):** 视频本身（尤其是结尾）引导转化的方式。
 
 **2. 竞品帖子 (Competitor Input):**
-* **[INPUT] 竞品文案原文:**
-```
-{caption}
-```
-* **[INPUT] 竞品视频内容描述:**
-```
-[已通过视频上传]
-```
+* 竞品文案原文和竞品视频在用户消息的 [INPUT] 中提供。
 
 ## (R) Request & Task (请求与任务)
 请严格按照 (S) 中定义的结构，对 (I) 中输入的竞品帖子进行详细分析。
@@ -189,6 +215,41 @@ def get_prompt_template_video(caption: str) -> str:
 * **语言:** 你的所有分析报告必须使用**中文**撰写。
 * **输出:** （不要输出开场白，每次输出只允许按照指定格式输出）"""
 
+
+def get_prompt_input_video(caption: str) -> str:
+    """
+    获取 Video 类型提示词中随帖子变化的部分（竞品文案）
+    
+    Args:
+        caption: 竞品文案
+    
+    Returns:
+        用户消息中的输入部分
+    """
+    return f"""**2. 竞品帖子 (Competitor Input):**
+* **[INPUT] 竞品文案原文:**
+```
+{caption}
+```
+* **[INPUT] 竞品视频内容描述:**
+```
+[已通过视频上传]
+```
+"""
+
+
+def get_prompt_template_video(caption: str) -> str:
+    """
+    获取 Video 类型的提示词（内置）
+    
+    Args:
+        caption: 竞品文案
+    
+    Returns:
+        完整的提示词（固定部分 + 输入部分）
+    """
+    return VIDEO_SYSTEM_PROMPT + "\n\n" + get_prompt_input_video(caption)
+
 def parse_analysis_result_image_sidecar(response_text: str) -> dict:
     """
     解析 Image/Sidecar 类型的分析结果
@@ -374,13 +435,19 @@ def parse_analysis_result_video(response_text: str) -> dict:
     
     return result
 
-def analyze_with_google_ai_multimodal(prompt: str, media_parts: list) -> str:
+def analyze_with_google_ai_multimodal(prompt: str, media_parts: list,
+                                      system_instruction: Optional[str] = None,
+                                      cache_label: str = "analysis",
+                                      response_schema: Optional[dict] = None) -> str:
     """
     使用 Google AI (Gemini 2.5 Pro) 分析多模态内容
     
     Args:
-        prompt: 提示词文本
+        prompt: 提示词文本（传入 system_instruction 时只包含变化部分）
         media_parts: 媒体部分列表（图片或视频）
+        system_instruction: 固定不变的提示词前缀，作为缓存上下文发送
+        cache_label: 上下文缓存统计标签
+        response_schema: 结构化输出的 JSON schema（为空时输出 Markdown）
     
     Returns:
         分析结果文本
@@ -389,8 +456,8 @@ def analyze_with_google_ai_multimodal(prompt: str, media_parts: list) -> str:
         if not get_google_key():
             raise Exception("Google AI API密钥未配置")
         
-        # 创建客户端
-        client = genai.Client(api_key=get_google_key())
+        # 复用该 API Key 的客户端
+        client = gemini.get_client(get_google_key())
         
         # 准备内容：媒体在前，提示词在后
         contents = media_parts + [prompt]
@@ -404,10 +471,20 @@ def analyze_with_google_ai_multimodal(prompt: str, media_parts: list) -> str:
         for attempt in range(max_retries):
             try:
                 print(f"尝试 {attempt + 1}/{max_retries}...")
-                response = client.models.generate_content(
-                    model='gemini-2.5-pro',
-                    contents=contents,
-                )
+                # 同一 API Key 的并发调用数受限，超出时排队等待
+                with gemini.concurrency_slot(get_google_key()):
+                    if system_instruction:
+                        response = prompt_cache.generate_content(
+                            client, get_google_key(), ANALYSIS_MODEL,
+                            system_instruction, contents, cache_label,
+                            response_schema=response_schema
+                        )
+                    else:
+                        response = client.models.generate_content(
+                            model=ANALYSIS_MODEL,
+                            contents=contents,
+                            config=prompt_cache.structured_output_config(response_schema),
+                        )
                 
                 print(f"✅ 分析完成: {len(response.text)} 字符")
                 return response.text.strip()
@@ -427,6 +504,532 @@ def analyze_with_google_ai_multimodal(prompt: str, media_parts: list) -> str:
         print(f"❌ Google AI 分析错误: {str(e)}")
         raise Exception(f"Google AI 分析失败: {str(e)}")
 
+def stream_with_google_ai_multimodal(prompt: str, media_parts: list,
+                                     system_instruction: str, cache_label: str):
+    """
+    analyze_with_google_ai_multimodal 的流式版本，逐块返回生成的文本
+    
+    只有在尚未输出任何内容时失败才会重试（已推送给前端的内容无法撤回）
+    
+    Yields:
+        str: 文本片段
+    """
+    google_key = get_google_key()
+    if not google_key:
+        raise Exception("Google AI API密钥未配置")
+    
+    client = gemini.get_client(google_key)
+    contents = media_parts + [prompt]
+    
+    print(f"正在使用 Gemini 2.5 Pro 流式分析... (媒体数量: {len(media_parts)})")
+    
+    max_retries = 3
+    for attempt in range(max_retries):
+        emitted = False
+        try:
+            with gemini.concurrency_slot(google_key):
+                for chunk in prompt_cache.generate_content_stream(
+                    client, google_key, ANALYSIS_MODEL,
+                    system_instruction, contents, cache_label
+                ):
+                    if chunk.text:
+                        emitted = True
+                        yield chunk.text
+            return
+        except Exception as retry_error:
+            print(f"❌ 尝试 {attempt + 1} 失败: {str(retry_error)}")
+            if emitted or attempt == max_retries - 1:
+                raise Exception(f"Google AI 分析失败: {str(retry_error)}")
+            wait_time = (attempt + 1) * 2
+            print(f"⏳ 等待 {wait_time} 秒后重试...")
+            time.sleep(wait_time)
+
+class SectionStreamParser:
+    """
+    流式输出的增量解析
+    
+    每当文本中出现下一个分节标记时，用完整解析函数重新解析已收到的文本，
+    返回此前尚未推送、且已经完整的字段；流结束时 finish() 返回全部字段。
+    标记之间不会重新解析，解析次数与分节数相同，而不是与 token 数相同。
+    """
+    
+    # (分节标记, 该标记出现后即完整的字段)，标记按顺序匹配
+    MARKERS = {
+        "image_sidecar": [
+            (re.compile(r'【二、'), ["jianyi1", "success"]),
+            (re.compile(r'\n\s*2\.\s*\*?\*?帖子文案'), ["jianyi1.5"]),
+            (re.compile(r'\n\s*3\.\s*\*?\*?图片生成提示词'), ["jianyi2"]),
+        ],
+        "video": [
+            (re.compile(r'【三、'), ["success"]),
+        ],
+    }
+    
+    # 多图提示词：出现第 N 张的标题时，前 N-1 张已完整
+    PROMPT_ITEM_PATTERN = re.compile(r'第[一二三四五六七八九十\d]+张图片提示词[:：]')
+    
+    def __init__(self, post_type: str):
+        self.post_type = post_type
+        self.markers = self.MARKERS["video" if post_type == "Video" else "image_sidecar"]
+        self.text = ""
+        self.next_marker = 0
+        self.search_from = 0
+        self.emitted = set()
+        self.prompt_items = 0
+    
+    def _parse(self) -> dict:
+        if self.post_type == "Video":
+            return parse_analysis_result_video(self.text)
+        return parse_analysis_result_image_sidecar(self.text)
+    
+    def feed(self, chunk: str) -> list:
+        """
+        追加文本片段
+        
+        Returns:
+            list: [(字段名, 值), ...] 本次新完成的字段
+        """
+        # 从上一片段末尾稍前的位置开始搜索，兼容标记被拆分在两个片段中
+        start = max(self.search_from, len(self.text) - 32)
+        self.text += chunk
+        
+        completed = []
+        while self.next_marker < len(self.markers):
+            pattern, fields = self.markers[self.next_marker]
+            match = pattern.search(self.text, start)
+            if not match:
+                break
+            self.next_marker += 1
+            self.search_from = start = match.end()
+            completed.extend(fields)
+        
+        updates = []
+        if completed:
+            parsed = self._parse()
+            for field in completed:
+                if parsed.get(field):
+                    self.emitted.add(field)
+                    updates.append((field, parsed[field]))
+        
+        # 提示词部分开始后，按"第X张图片提示词"推送已完整的提示词
+        if self.next_marker == len(self.markers) and self.post_type == "Sidecar":
+            items = len(self.PROMPT_ITEM_PATTERN.findall(self.text, self.search_from))
+            if items - 1 > self.prompt_items:
+                prompt_array = self._parse().get('prompt_array') or []
+                if len(prompt_array) >= items - 1:
+                    self.prompt_items = items - 1
+                    updates.append(("prompt_array", prompt_array[:self.prompt_items]))
+        
+        return updates
+    
+    def finish(self):
+        """
+        流结束，返回 (完整解析结果, 剩余未推送的字段)
+        """
+        parsed = parse_analysis_result(self.post_type, self.text)
+        remaining = [
+            (field, value) for field, value in parsed.items()
+            if field not in self.emitted and value
+        ]
+        return parsed, remaining
+
+def get_template_version(post_type: str) -> str:
+    """
+    提示词模板版本（模板内容的哈希），模板修改后版本自动变化，旧缓存随之失效
+    """
+    if post_type in ["Image", "Sidecar"]:
+        template = get_prompt_template_image_sidecar("{caption}")
+    else:
+        template = get_prompt_template_video("{caption}")
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+def compute_post_media_hash(post: dict) -> str:
+    """
+    计算帖子全部媒体的组合哈希（预处理参数 + 封面 + 多图 + 视频，按顺序）
+    """
+    digest = hashlib.sha256(mediaprep.settings_signature().encode("utf-8"))
+    for field in ['display_url_base64', 'video_url_base64']:
+        if post.get(field):
+            digest.update(gemini.media_hash(post[field]).encode("utf-8"))
+    if post.get('images_base64'):
+        images_list = json.loads(post['images_base64']) if isinstance(post['images_base64'], str) else post['images_base64']
+        for img_base64 in images_list:
+            digest.update(gemini.media_hash(img_base64).encode("utf-8") if img_base64 else b"-")
+    return digest.hexdigest()
+
+def is_complete_result(post_type: str, parsed_result: dict) -> bool:
+    """解析结果是否完整（不完整的结果不写入缓存，避免复用解析失败的结果）"""
+    if post_type == "Video":
+        return bool(parsed_result.get('jianyi3'))
+    return bool(parsed_result.get('jianyi1') and parsed_result.get('jianyi2'))
+
+def build_media_parts(post: dict) -> list:
+    """
+    根据帖子类型准备媒体数据（先经过 mediaprep 缩放/转码，再内联或上传）
+    - Image: display_url_base64
+    - Sidecar: display_url_base64 + images_base64[]
+    - Video: video_url_base64
+    """
+    google_key = get_google_key()
+    if not google_key:
+        raise HTTPException(status_code=500, detail="Google AI API密钥未配置")
+    
+    post_type = post['post_type']
+    media_parts = []
+    
+    def add_part(data_base64: str, mime_type: str, label: str):
+        media_parts.append(gemini.media_part_from_base64(google_key, data_base64, mime_type))
+        print(f"✅ 添加{label}: {gemini.estimate_decoded_size(data_base64)/1024/1024:.2f} MB ({mime_type})")
+    
+    if post_type == "Image":
+        # Image 类型: display_url_base64
+        if not post['display_url_base64']:
+            raise HTTPException(status_code=400, detail="Image 类型缺少 display_url_base64")
+        
+        add_part(*mediaprep.prepare_image(post['display_url_base64']), "封面图")
+    
+    elif post_type == "Sidecar":
+        # Sidecar 类型: display_url_base64 + images_base64[]
+        # 顺序：先 display，再 images（按顺序）
+        if not post['display_url_base64']:
+            raise HTTPException(status_code=400, detail="Sidecar 类型缺少 display_url_base64")
+        
+        images_list = []
+        if post['images_base64']:
+            images_list = json.loads(post['images_base64']) if isinstance(post['images_base64'], str) else post['images_base64']
+        
+        # 图片较多时可能拼接为一张联系表（MEDIA_CONTACT_SHEET_THRESHOLD）
+        prepared = mediaprep.prepare_images([post['display_url_base64']] + images_list)
+        for idx, (data_base64, mime_type) in enumerate(prepared):
+            add_part(data_base64, mime_type, "封面图" if idx == 0 else f"图片 {idx}")
+    
+    elif post_type == "Video":
+        # Video 类型: video_url_base64
+        if not post['video_url_base64']:
+            raise HTTPException(status_code=400, detail="Video 类型缺少 video_url_base64")
+        
+        # 长视频先生成低码率代理；大视频走 Files API 上传，同一视频在有效期内复用已上传的文件
+        add_part(*mediaprep.prepare_video(post['video_url_base64']), "视频")
+    
+    return media_parts
+
+def parse_analysis_result(post_type: str, analysis_result: str) -> dict:
+    """
+    根据帖子类型解析分析结果
+    依次尝试 JSON 结构化输出、单次扫描的 Markdown 解析，最后退回正则解析
+    """
+    if post_type in ["Image", "Sidecar"]:
+        parsed_result = analysis_parser.parse(post_type, analysis_result, parse_analysis_result_image_sidecar)
+        print(f"✅ jianyi1: {len(parsed_result['jianyi1'])} 字符")
+        print(f"✅ success: {len(parsed_result['success'])} 字符")
+        print(f"✅ jianyi1.5: {len(parsed_result['jianyi1.5'])} 字符")
+        print(f"✅ jianyi2: {len(parsed_result['jianyi2'])} 字符")
+        print(f"✅ prompt: {len(parsed_result['prompt']) if parsed_result['prompt'] else 0} 字符")
+        if parsed_result['prompt_array']:
+            print(f"✅ prompt_array: {len(parsed_result['prompt_array'])} 个提示词")
+            for i, p in enumerate(parsed_result['prompt_array'], 1):
+                print(f"   - 第{i}张: {len(p)} 字符")
+    elif post_type == "Video":
+        parsed_result = analysis_parser.parse(post_type, analysis_result, parse_analysis_result_video)
+        print(f"✅ jianyi3: {len(parsed_result['jianyi3'])} 字符")
+        print(f"✅ success: {len(parsed_result['success'])} 字符")
+    
+    return parsed_result
+
+def save_to_popular(cur, user_id: int, post: dict, parsed_result: dict):
+    """
+    保存分析结果到 popular 表（已存在则更新）
+    """
+    post_type = post['post_type']
+    
+    # 检查记录是否已存在
+    cur.execute("""
+        SELECT id FROM popular WHERE user_id = %s AND post_id = %s
+    """, (user_id, post['post_id']))
+    
+    existing = cur.fetchone()
+    
+    if existing:
+        # 更新现有记录
+        if post_type == "Image":
+            cur.execute("""
+                UPDATE popular 
+                SET jianyi1 = %s,
+                    success = %s,
+                    "jianyi1.5" = %s,
+                    jianyi2 = %s,
+                    prompt = %s,
+                    prompt_array = NULL,
+                    display_url_base64 = %s::jsonb,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND post_id = %s
+            """, (
+                parsed_result['jianyi1'],
+                parsed_result['success'],
+                parsed_result['jianyi1.5'],
+                parsed_result['jianyi2'],
+                parsed_result['prompt'],
+                json.dumps(post['display_url_base64']) if post['display_url_base64'] else None,
+                user_id,
+                post['post_id']
+            ))
+        elif post_type == "Sidecar":
+            cur.execute("""
+                UPDATE popular 
+                SET jianyi1 = %s,
+                    success = %s,
+                    "jianyi1.5" = %s,
+                    jianyi2 = %s,
+                    prompt = NULL,
+                    prompt_array = %s::jsonb,
+                    display_url_base64 = %s::jsonb,
+                    images_base64 = %s::jsonb,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND post_id = %s
+            """, (
+                parsed_result['jianyi1'],
+                parsed_result['success'],
+                parsed_result['jianyi1.5'],
+                parsed_result['jianyi2'],
+                json.dumps(parsed_result['prompt_array']) if parsed_result['prompt_array'] else None,
+                json.dumps(post['display_url_base64']) if post['display_url_base64'] else None,
+                json.dumps(post['images_base64']) if post['images_base64'] else None,
+                user_id,
+                post['post_id']
+            ))
+        elif post_type == "Video":
+            cur.execute("""
+                UPDATE popular 
+                SET jianyi3 = %s,
+                    success = %s,
+                    video_url_base64 = %s::jsonb,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND post_id = %s
+            """, (
+                parsed_result['jianyi3'],
+                parsed_result['success'],
+                json.dumps(post['video_url_base64']) if post['video_url_base64'] else None,
+                user_id,
+                post['post_id']
+            ))
+        print("✅ 更新现有记录")
+    else:
+        # 插入新记录
+        if post_type == "Image":
+            cur.execute("""
+                INSERT INTO popular 
+                (user_id, post_id, post_type, jianyi1, success, "jianyi1.5", jianyi2, prompt, display_url_base64)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+            """, (
+                user_id,
+                post['post_id'],
+                post_type,
+                parsed_result['jianyi1'],
+                parsed_result['success'],
+                parsed_result['jianyi1.5'],
+                parsed_result['jianyi2'],
+                parsed_result['prompt'],
+                json.dumps(post['display_url_base64']) if post['display_url_base64'] else None
+            ))
+        elif post_type == "Sidecar":
+            cur.execute("""
+                INSERT INTO popular 
+                (user_id, post_id, post_type, jianyi1, success, "jianyi1.5", jianyi2, prompt_array, display_url_base64, images_base64)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb)
+            """, (
+                user_id,
+                post['post_id'],
+                post_type,
+                parsed_result['jianyi1'],
+                parsed_result['success'],
+                parsed_result['jianyi1.5'],
+                parsed_result['jianyi2'],
+                json.dumps(parsed_result['prompt_array']) if parsed_result['prompt_array'] else None,
+                json.dumps(post['display_url_base64']) if post['display_url_base64'] else None,
+                json.dumps(post['images_base64']) if post['images_base64'] else None
+            ))
+        elif post_type == "Video":
+            cur.execute("""
+                INSERT INTO popular 
+                (user_id, post_id, post_type, jianyi3, success, video_url_base64)
+                VALUES (%s, %s, %s, %s, %s, %s::jsonb)
+            """, (
+                user_id,
+                post['post_id'],
+                post_type,
+                parsed_result['jianyi3'],
+                parsed_result['success'],
+                json.dumps(post['video_url_base64']) if post['video_url_base64'] else None
+            ))
+        print("✅ 插入新记录")
+
+def save_popular_bulk(cur, user_id: int, items: list) -> int:
+    """
+    批量保存分析结果到 popular 表（按帖子类型分组，每组一条 INSERT ... ON CONFLICT）
+    更新的字段与 save_to_popular 一致
+    
+    Args:
+        cur: 数据库游标（调用方负责提交事务）
+        user_id: 用户ID
+        items: [(post, parsed_result), ...]
+    
+    Returns:
+        int: 写入的条数
+    """
+    def dump(value):
+        return json.dumps(value) if value else None
+    
+    image_rows, sidecar_rows, video_rows = [], [], []
+    for post, parsed_result in items:
+        if post['post_type'] == "Image":
+            image_rows.append((
+                user_id, post['post_id'], "Image",
+                parsed_result['jianyi1'], parsed_result['success'],
+                parsed_result['jianyi1.5'], parsed_result['jianyi2'],
+                parsed_result['prompt'], dump(post['display_url_base64'])
+            ))
+        elif post['post_type'] == "Sidecar":
+            sidecar_rows.append((
+                user_id, post['post_id'], "Sidecar",
+                parsed_result['jianyi1'], parsed_result['success'],
+                parsed_result['jianyi1.5'], parsed_result['jianyi2'],
+                dump(parsed_result['prompt_array']),
+                dump(post['display_url_base64']), dump(post['images_base64'])
+            ))
+        elif post['post_type'] == "Video":
+            video_rows.append((
+                user_id, post['post_id'], "Video",
+                parsed_result['jianyi3'], parsed_result['success'],
+                dump(post['video_url_base64'])
+            ))
+    
+    if image_rows:
+        execute_values(cur, """
+            INSERT INTO popular 
+            (user_id, post_id, post_type, jianyi1, success, "jianyi1.5", jianyi2, prompt, display_url_base64)
+            VALUES %s
+            ON CONFLICT (user_id, post_id) DO UPDATE SET
+                jianyi1 = EXCLUDED.jianyi1,
+                success = EXCLUDED.success,
+                "jianyi1.5" = EXCLUDED."jianyi1.5",
+                jianyi2 = EXCLUDED.jianyi2,
+                prompt = EXCLUDED.prompt,
+                prompt_array = NULL,
+                display_url_base64 = EXCLUDED.display_url_base64,
+                updated_at = CURRENT_TIMESTAMP
+        """, image_rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)")
+    
+    if sidecar_rows:
+        execute_values(cur, """
+            INSERT INTO popular 
+            (user_id, post_id, post_type, jianyi1, success, "jianyi1.5", jianyi2, prompt_array, display_url_base64, images_base64)
+            VALUES %s
+            ON CONFLICT (user_id, post_id) DO UPDATE SET
+                jianyi1 = EXCLUDED.jianyi1,
+                success = EXCLUDED.success,
+                "jianyi1.5" = EXCLUDED."jianyi1.5",
+                jianyi2 = EXCLUDED.jianyi2,
+                prompt = NULL,
+                prompt_array = EXCLUDED.prompt_array,
+                display_url_base64 = EXCLUDED.display_url_base64,
+                images_base64 = EXCLUDED.images_base64,
+                updated_at = CURRENT_TIMESTAMP
+        """, sidecar_rows, template="(%s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb)")
+    
+    if video_rows:
+        execute_values(cur, """
+            INSERT INTO popular 
+            (user_id, post_id, post_type, jianyi3, success, video_url_base64)
+            VALUES %s
+            ON CONFLICT (user_id, post_id) DO UPDATE SET
+                jianyi3 = EXCLUDED.jianyi3,
+                success = EXCLUDED.success,
+                video_url_base64 = EXCLUDED.video_url_base64,
+                updated_at = CURRENT_TIMESTAMP
+        """, video_rows, template="(%s, %s, %s, %s, %s, %s::jsonb)")
+    
+    return len(image_rows) + len(sidecar_rows) + len(video_rows)
+
+def build_analysis_prompt(post: dict):
+    """
+    生成分析提示词：固定部分作为缓存上下文发送，每次请求只发送文案和媒体
+    
+    Returns:
+        (system_prompt, input_prompt, cache_label)
+    """
+    caption = post['caption'] or ""
+    if post['post_type'] == "Video":
+        system_prompt = VIDEO_SYSTEM_PROMPT
+        input_prompt = get_prompt_input_video(caption)
+        cache_label = "video"
+    else:
+        system_prompt = IMAGE_SIDECAR_SYSTEM_PROMPT
+        input_prompt = get_prompt_input_image_sidecar(caption)
+        cache_label = "image_sidecar"
+    
+    print(f"✅ 提示词长度: 固定 {len(system_prompt)} 字符 + 输入 {len(input_prompt)} 字符")
+    return system_prompt, input_prompt, cache_label
+
+def run_analysis(post: dict, force_refresh: bool = False):
+    """
+    分析单个帖子（不写入 popular 表），供单个分析和批量分析共用
+    
+    Args:
+        post: post_data 中的帖子（post_id、post_type、caption 及媒体字段）
+        force_refresh: 跳过共享缓存，强制重新分析
+    
+    Returns:
+        (parsed_result, from_cache)
+    """
+    post_type = post['post_type']
+    
+    # Step 3: 生成提示词
+    print(f"Step 2: 生成提示词...")
+    system_prompt, input_prompt, cache_label = build_analysis_prompt(post)
+    
+    # Step 4: 查询共享分析缓存（任何用户分析过同一帖子、同一模板即可复用）
+    media_hash = compute_post_media_hash(post)
+    template_version = get_template_version(post_type)
+    cached = None
+    if not force_refresh:
+        cached = analysis_cache.get_cached_result(post['post_id'], media_hash, template_version, ANALYSIS_MODEL)
+    
+    if cached:
+        parsed_result = cached['result']
+        print(f"✅ 命中分析缓存，节省约 {cached['elapsed_seconds']:.1f} 秒")
+    else:
+        # Step 5: 准备媒体数据
+        print(f"Step 3: 准备媒体数据...")
+        media_parts = build_media_parts(post)
+        
+        # Step 6: 调用 Google AI 分析
+        print(f"Step 4: 调用 Google AI 分析...")
+        response_schema = None
+        if analysis_parser.STRUCTURED_OUTPUT:
+            input_prompt += analysis_parser.STRUCTURED_OUTPUT_INSTRUCTION
+            response_schema = analysis_parser.get_schema(post_type)
+        start_time = time.time()
+        analysis_result = analyze_with_google_ai_multimodal(
+            input_prompt, media_parts,
+            system_instruction=system_prompt, cache_label=cache_label,
+            response_schema=response_schema
+        )
+        elapsed = time.time() - start_time
+        
+        print(f"✅ 分析结果长度: {len(analysis_result)} 字符，耗时 {elapsed:.1f} 秒")
+        
+        # Step 7: 解析结果
+        print(f"Step 5: 解析分析结果...")
+        parsed_result = parse_analysis_result(post_type, analysis_result)
+        
+        if is_complete_result(post_type, parsed_result):
+            analysis_cache.save_cached_result(
+                post['post_id'], post_type, media_hash, template_version,
+                ANALYSIS_MODEL, parsed_result, elapsed, raw_text=analysis_result
+            )
+    
+    return parsed_result, bool(cached)
+
 @router.post("/script", response_model=AnalysisResponse)
 def analyze_script(request: AnalysisRequest):
     """
@@ -475,216 +1078,15 @@ def analyze_script(request: AnalysisRequest):
         if post_type not in ["Image", "Sidecar", "Video"]:
             raise HTTPException(status_code=400, detail=f"不支持的帖子类型: {post_type}")
         
-        # Step 3: 生成提示词
-        print(f"Step 2: 生成提示词...")
-        if post_type in ["Image", "Sidecar"]:
-            full_prompt = get_prompt_template_image_sidecar(caption)
-        elif post_type == "Video":
-            full_prompt = get_prompt_template_video(caption)
-        
-        print(f"✅ 提示词长度: {len(full_prompt)} 字符")
+        # Step 3-7: 生成提示词、查询缓存、调用 Google AI 并解析
+        parsed_result, from_cache = run_analysis(post, request.force_refresh)
         
-        # Step 4: 准备媒体数据
-        print(f"Step 3: 准备媒体数据...")
-        media_parts = []
-        
-        if post_type == "Image":
-            # Image 类型: display_url_base64
-            if not post['display_url_base64']:
-                raise HTTPException(status_code=400, detail="Image 类型缺少 display_url_base64")
-            
-            image_bytes = base64.b64decode(post['display_url_base64'])
-            media_parts.append(
-                types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg')
-            )
-            print(f"✅ 添加封面图: {len(image_bytes)/1024/1024:.2f} MB")
-        
-        elif post_type == "Sidecar":
-            # Sidecar 类型: display_url_base64 + images_base64[]
-            # 顺序：先 display，再 images（按顺序）
-            if not post['display_url_base64']:
-                raise HTTPException(status_code=400, detail="Sidecar 类型缺少 display_url_base64")
-            
-            # 先添加封面图
-            image_bytes = base64.b64decode(post['display_url_base64'])
-            media_parts.append(
-                types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg')
-            )
-            print(f"✅ 添加封面图: {len(image_bytes)/1024/1024:.2f} MB")
-            
-            # 再添加 images_base64（按顺序）
-            if post['images_base64']:
-                images_list = json.loads(post['images_base64']) if isinstance(post['images_base64'], str) else post['images_base64']
-                for idx, img_base64 in enumerate(images_list):
-                    if img_base64:  # 跳过 null
-                        img_bytes = base64.b64decode(img_base64)
-                        media_parts.append(
-                            types.Part.from_bytes(data=img_bytes, mime_type='image/jpeg')
-                        )
-                        print(f"✅ 添加图片 {idx + 1}: {len(img_bytes)/1024/1024:.2f} MB")
-        
-        elif post_type == "Video":
-            # Video 类型: video_url_base64
-            if not post['video_url_base64']:
-                raise HTTPException(status_code=400, detail="Video 类型缺少 video_url_base64")
-            
-            video_bytes = base64.b64decode(post['video_url_base64'])
-            media_parts.append(
-                types.Part(
-                    inline_data=types.Blob(data=video_bytes, mime_type='video/mp4')
-                )
-            )
-            print(f"✅ 添加视频: {len(video_bytes)/1024/1024:.2f} MB")
-        
-        # Step 5: 调用 Google AI 分析
-        print(f"Step 4: 调用 Google AI 分析...")
-        analysis_result = analyze_with_google_ai_multimodal(full_prompt, media_parts)
-        
-        print(f"✅ 分析结果长度: {len(analysis_result)} 字符")
-        
-        # Step 6: 解析结果
-        print(f"Step 5: 解析分析结果...")
-        if post_type in ["Image", "Sidecar"]:
-            parsed_result = parse_analysis_result_image_sidecar(analysis_result)
-            print(f"✅ jianyi1: {len(parsed_result['jianyi1'])} 字符")
-            print(f"✅ success: {len(parsed_result['success'])} 字符")
-            print(f"✅ jianyi1.5: {len(parsed_result['jianyi1.5'])} 字符")
-            print(f"✅ jianyi2: {len(parsed_result['jianyi2'])} 字符")
-            print(f"✅ prompt: {len(parsed_result['prompt']) if parsed_result['prompt'] else 0} 字符")
-            if parsed_result['prompt_array']:
-                print(f"✅ prompt_array: {len(parsed_result['prompt_array'])} 个提示词")
-                for i, p in enumerate(parsed_result['prompt_array'], 1):
-                    print(f"   - 第{i}张: {len(p)} 字符")
-        elif post_type == "Video":
-            parsed_result = parse_analysis_result_video(analysis_result)
-            print(f"✅ jianyi3: {len(parsed_result['jianyi3'])} 字符")
-            print(f"✅ success: {len(parsed_result['success'])} 字符")
-        
-        # Step 7: 保存到 popular 表
+        # Step 8: 保存到 popular 表
         print(f"Step 6: 保存到 popular 表...")
-        
-        # 检查记录是否已存在
-        cur.execute("""
-            SELECT id FROM popular WHERE user_id = %s AND post_id = %s
-        """, (request.user_id, request.post_id))
-        
-        existing = cur.fetchone()
-        
-        if existing:
-            # 更新现有记录
-            if post_type == "Image":
-                cur.execute("""
-                    UPDATE popular 
-                    SET jianyi1 = %s,
-                        success = %s,
-                        "jianyi1.5" = %s,
-                        jianyi2 = %s,
-                        prompt = %s,
-                        prompt_array = NULL,
-                        display_url_base64 = %s::jsonb,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = %s AND post_id = %s
-                """, (
-                    parsed_result['jianyi1'],
-                    parsed_result['success'],
-                    parsed_result['jianyi1.5'],
-                    parsed_result['jianyi2'],
-                    parsed_result['prompt'],
-                    json.dumps(post['display_url_base64']) if post['display_url_base64'] else None,
-                    request.user_id,
-                    request.post_id
-                ))
-            elif post_type == "Sidecar":
-                cur.execute("""
-                    UPDATE popular 
-                    SET jianyi1 = %s,
-                        success = %s,
-                        "jianyi1.5" = %s,
-                        jianyi2 = %s,
-                        prompt = NULL,
-                        prompt_array = %s::jsonb,
-                        display_url_base64 = %s::jsonb,
-                        images_base64 = %s::jsonb,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = %s AND post_id = %s
-                """, (
-                    parsed_result['jianyi1'],
-                    parsed_result['success'],
-                    parsed_result['jianyi1.5'],
-                    parsed_result['jianyi2'],
-                    json.dumps(parsed_result['prompt_array']) if parsed_result['prompt_array'] else None,
-                    json.dumps(post['display_url_base64']) if post['display_url_base64'] else None,
-                    json.dumps(post['images_base64']) if post['images_base64'] else None,
-                    request.user_id,
-                    request.post_id
-                ))
-            elif post_type == "Video":
-                cur.execute("""
-                    UPDATE popular 
-                    SET jianyi3 = %s,
-                        success = %s,
-                        video_url_base64 = %s::jsonb,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = %s AND post_id = %s
-                """, (
-                    parsed_result['jianyi3'],
-                    parsed_result['success'],
-                    json.dumps(post['video_url_base64']) if post['video_url_base64'] else None,
-                    request.user_id,
-                    request.post_id
-                ))
-            print("✅ 更新现有记录")
-        else:
-            # 插入新记录
-            if post_type == "Image":
-                cur.execute("""
-                    INSERT INTO popular 
-                    (user_id, post_id, post_type, jianyi1, success, "jianyi1.5", jianyi2, prompt, display_url_base64)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)
-                """, (
-                    request.user_id,
-                    request.post_id,
-                    post_type,
-                    parsed_result['jianyi1'],
-                    parsed_result['success'],
-                    parsed_result['jianyi1.5'],
-                    parsed_result['jianyi2'],
-                    parsed_result['prompt'],
-                    json.dumps(post['display_url_base64']) if post['display_url_base64'] else None
-                ))
-            elif post_type == "Sidecar":
-                cur.execute("""
-                    INSERT INTO popular 
-                    (user_id, post_id, post_type, jianyi1, success, "jianyi1.5", jianyi2, prompt_array, display_url_base64, images_base64)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb)
-                """, (
-                    request.user_id,
-                    request.post_id,
-                    post_type,
-                    parsed_result['jianyi1'],
-                    parsed_result['success'],
-                    parsed_result['jianyi1.5'],
-                    parsed_result['jianyi2'],
-                    json.dumps(parsed_result['prompt_array']) if parsed_result['prompt_array'] else None,
-                    json.dumps(post['display_url_base64']) if post['display_url_base64'] else None,
-                    json.dumps(post['images_base64']) if post['images_base64'] else None
-                ))
-            elif post_type == "Video":
-                cur.execute("""
-                    INSERT INTO popular 
-                    (user_id, post_id, post_type, jianyi3, success, video_url_base64)
-                    VALUES (%s, %s, %s, %s, %s, %s::jsonb)
-                """, (
-                    request.user_id,
-                    request.post_id,
-                    post_type,
-                    parsed_result['jianyi3'],
-                    parsed_result['success'],
-                    json.dumps(post['video_url_base64']) if post['video_url_base64'] else None
-                ))
-            print("✅ 插入新记录")
+        save_to_popular(cur, request.user_id, post, parsed_result)
         
         conn.commit()
+        responsecache.invalidate("popular_scripts", key=request.user_id)
         cur.close()
         conn.close()
         
@@ -694,7 +1096,7 @@ def analyze_script(request: AnalysisRequest):
         
         return AnalysisResponse(
             success=True,
-            message="分析完成",
+            message="分析完成（命中缓存）" if from_cache else "分析完成",
             data=parsed_result
         )
         
@@ -703,3 +1105,322 @@ def analyze_script(request: AnalysisRequest):
     except Exception as e:
         print(f"\n❌ 分析失败: {str(e)}\n")
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
+
+@router.post("/script/stream")
+def analyze_script_stream(request: AnalysisRequest):
+    """
+    分析脚本接口（SSE 流式返回）
+    
+    Gemini 生成的文本逐块推送，分节完成时立即推送解析出的字段，流结束后保存到 popular 表。
+    
+    事件:
+    - meta: {post_id, post_type}
+    - delta: {text}
+    - section: {field, value}（jianyi1 / success / jianyi1.5 / jianyi2 / prompt / prompt_array / jianyi3）
+    - done: {cached, elapsed_seconds, data}
+    - error: {detail}
+    """
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("""
+            SELECT post_id, post_type, caption, 
+                   display_url_base64, images_base64,
+                   video_url_base64
+            FROM post_data
+            WHERE post_id = %s
+        """, (request.post_id,))
+        post = cur.fetchone()
+        cur.close()
+        conn.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取帖子数据失败: {str(e)}")
+    
+    if not post:
+        raise HTTPException(status_code=404, detail=f"帖子 {request.post_id} 不存在")
+    
+    post_type = post['post_type']
+    if post_type == "Sidecar_video":
+        raise HTTPException(status_code=400, detail="Sidecar_video 类型暂不支持分析")
+    if post_type not in ["Image", "Sidecar", "Video"]:
+        raise HTTPException(status_code=400, detail=f"不支持的帖子类型: {post_type}")
+    
+    def persist(parsed_result: dict):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            save_to_popular(cur, request.user_id, post, parsed_result)
+            conn.commit()
+            responsecache.invalidate("popular_scripts", key=request.user_id)
+            cur.close()
+        finally:
+            conn.close()
+    
+    def events():
+        start_time = time.time()
+        print(f"\n开始流式分析脚本 Post ID: {request.post_id}, User ID: {request.user_id}")
+        yield sse.format_event("meta", {"post_id": request.post_id, "post_type": post_type})
+        
+        try:
+            system_prompt, input_prompt, cache_label = build_analysis_prompt(post)
+            media_hash = compute_post_media_hash(post)
+            template_version = get_template_version(post_type)
+            
+            cached = None
+            if not request.force_refresh:
+                cached = analysis_cache.get_cached_result(request.post_id, media_hash, template_version, ANALYSIS_MODEL)
+            
+            if cached:
+                parsed_result = cached['result']
+                for field, value in parsed_result.items():
+                    if value:
+                        yield sse.format_event("section", {"field": field, "value": value})
+            else:
+                media_parts = build_media_parts(post)
+                parser = SectionStreamParser(post_type)
+                
+                for text in stream_with_google_ai_multimodal(input_prompt, media_parts, system_prompt, cache_label):
+                    yield sse.format_event("delta", {"text": text})
+                    for field, value in parser.feed(text):
+                        yield sse.format_event("section", {"field": field, "value": value})
+                
+                parsed_result, remaining = parser.finish()
+                for field, value in remaining:
+                    yield sse.format_event("section", {"field": field, "value": value})
+                
+                elapsed = time.time() - start_time
+                print(f"✅ 流式分析完成: {len(parser.text)} 字符，耗时 {elapsed:.1f} 秒")
+                if is_complete_result(post_type, parsed_result):
+                    analysis_cache.save_cached_result(
+                        request.post_id, post_type, media_hash, template_version,
+                        ANALYSIS_MODEL, parsed_result, elapsed, raw_text=parser.text
+                    )
+            
+            persist(parsed_result)
+            
+            yield sse.format_event("done", {
+                "cached": bool(cached),
+                "elapsed_seconds": round(time.time() - start_time, 1),
+                "data": parsed_result
+            })
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"\n❌ 流式分析失败: {error}\n")
+            yield sse.format_event("error", {"detail": f"分析失败: {error}"})
+    
+    return sse.stream(events())
+
+@router.post("/batch")
+def analyze_batch(request: BatchAnalysisRequest):
+    """
+    批量分析脚本接口（SSE 流式返回）
+    
+    多个帖子并行分析（同一 Google API Key 的并发数受限），每个帖子完成后立即推送事件，
+    结果每攒够 BATCH_WRITE_SIZE 条批量写入 popular 表。
+    
+    事件:
+    - start: {total, post_ids}
+    - post_done: {post_id, post_type, cached, elapsed_seconds, data}
+    - post_failed: {post_id, error}
+    - saved: {count, total_saved}
+    - save_failed: {post_ids, error}
+    - done: {total, succeeded, failed, cached, elapsed_seconds}
+    """
+    # 去重并保持顺序
+    post_ids = list(dict.fromkeys(pid for pid in request.post_ids if pid))
+    if not post_ids:
+        raise HTTPException(status_code=400, detail="post_ids 不能为空")
+    if len(post_ids) > BATCH_MAX_POSTS:
+        raise HTTPException(status_code=400, detail=f"单次最多分析 {BATCH_MAX_POSTS} 个帖子")
+    
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("""
+            SELECT post_id, post_type, caption, 
+                   display_url_base64, images_base64,
+                   video_url_base64
+            FROM post_data
+            WHERE post_id = ANY(%s)
+        """, (post_ids,))
+        posts = {row['post_id']: row for row in cur.fetchall()}
+        cur.close()
+        conn.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取帖子数据失败: {str(e)}")
+    
+    def flush(pending: list) -> int:
+        """把已完成的结果批量写入 popular 表"""
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            count = save_popular_bulk(cur, request.user_id, pending)
+            conn.commit()
+            responsecache.invalidate("popular_scripts", key=request.user_id)
+            cur.close()
+            return count
+        finally:
+            conn.close()
+    
+    def events():
+        batch_start = time.time()
+        print(f"\n📦 批量分析开始: {len(post_ids)} 个帖子 (User ID: {request.user_id})")
+        yield sse.format_event("start", {"total": len(post_ids), "post_ids": post_ids})
+        
+        succeeded, failed, from_cache, total_saved = 0, 0, 0, 0
+        pending = []
+        
+        # 先排除不存在或不支持的帖子
+        runnable = []
+        for post_id in post_ids:
+            post = posts.get(post_id)
+            if not post:
+                error = f"帖子 {post_id} 不存在"
+            elif post['post_type'] not in ["Image", "Sidecar", "Video"]:
+                error = f"不支持的帖子类型: {post['post_type']}"
+            else:
+                runnable.append(post)
+                continue
+            failed += 1
+            yield sse.format_event("post_failed", {"post_id": post_id, "error": error})
+        
+        def analyze_one(post):
+            start = time.time()
+            parsed_result, cached = run_analysis(post, request.force_refresh)
+            return parsed_result, cached, time.time() - start
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(BATCH_MAX_WORKERS, len(runnable))))
+        futures = {executor.submit(analyze_one, post): post for post in runnable}
+        remaining = set(futures)
+        try:
+            while remaining:
+                done, remaining = wait(remaining, timeout=15, return_when=FIRST_COMPLETED)
+                if not done:
+                    yield sse.HEARTBEAT
+                    continue
+                
+                for future in done:
+                    post = futures[future]
+                    try:
+                        parsed_result, cached, elapsed = future.result()
+                    except Exception as e:
+                        failed += 1
+                        error = e.detail if isinstance(e, HTTPException) else str(e)
+                        print(f"❌ 批量分析失败 {post['post_id']}: {error}")
+                        yield sse.format_event("post_failed", {"post_id": post['post_id'], "error": error})
+                        continue
+                    
+                    succeeded += 1
+                    from_cache += 1 if cached else 0
+                    pending.append((post, parsed_result))
+                    yield sse.format_event("post_done", {
+                        "post_id": post['post_id'],
+                        "post_type": post['post_type'],
+                        "cached": cached,
+                        "elapsed_seconds": round(elapsed, 2),
+                        "data": parsed_result
+                    })
+                
+                if len(pending) >= BATCH_WRITE_SIZE or (not remaining and pending):
+                    batch, pending = pending, []
+                    try:
+                        count = flush(batch)
+                    except Exception as e:
+                        print(f"❌ 批量写入 popular 失败: {str(e)}")
+                        yield sse.format_event("save_failed", {
+                            "post_ids": [post['post_id'] for post, _ in batch],
+                            "error": str(e)
+                        })
+                        continue
+                    total_saved += count
+                    yield sse.format_event("saved", {"count": count, "total_saved": total_saved})
+        finally:
+            # 客户端断开时取消未开始的任务，已完成的结果仍然写入
+            executor.shutdown(wait=False, cancel_futures=True)
+            if pending:
+                try:
+                    flush(pending)
+                except Exception as e:
+                    print(f"❌ 批量写入 popular 失败: {str(e)}")
+        
+        elapsed = time.time() - batch_start
+        print(f"✅ 批量分析完成: 成功 {succeeded}，失败 {failed}，命中缓存 {from_cache}，耗时 {elapsed:.1f} 秒")
+        yield sse.format_event("done", {
+            "total": len(post_ids),
+            "succeeded": succeeded,
+            "failed": failed,
+            "cached": from_cache,
+            "elapsed_seconds": round(elapsed, 1)
+        })
+    
+    return sse.stream(events())
+
+@router.get("/cache/stats")
+def get_analysis_cache_stats():
+    """
+    分析结果缓存统计（命中率、节省的分析耗时）
+    """
+    try:
+        stats = analysis_cache.get_stats()
+        stats["template_versions"] = {
+            "Image/Sidecar": get_template_version("Image"),
+            "Video": get_template_version("Video")
+        }
+        return {
+            "success": True,
+            "data": stats
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取缓存统计失败: {str(e)}")
+
+@router.get("/prompt-cache/stats")
+def get_prompt_cache_stats():
+    """
+    提示词上下文缓存统计（输入 token、命中缓存的 token 占比、平均耗时）
+    """
+    return {
+        "success": True,
+        "data": prompt_cache.get_stats()
+    }
+
+@router.get("/parser/stats")
+def get_parser_stats():
+    """
+    分析结果解析统计（各解析方式的调用次数、完整率、平均耗时）
+    """
+    return {
+        "success": True,
+        "data": analysis_parser.get_stats()
+    }
+
+@router.get("/media/stats")
+def get_media_stats():
+    """
+    媒体预处理统计（处理前后的字节数、估算 token 数、耗时）
+    """
+    return {
+        "success": True,
+        "data": mediaprep.get_stats()
+    }
+
+@router.delete("/cache")
+def invalidate_analysis_cache(post_id: Optional[str] = None, stale_only: bool = False):
+    """
+    清除分析结果缓存
+    
+    Args:
+        post_id: 只清除该帖子的缓存，为空时清除全部
+        stale_only: 只清除旧版本提示词模板产生的缓存
+    """
+    try:
+        keep_versions = None
+        if stale_only:
+            keep_versions = [get_template_version("Image"), get_template_version("Video")]
+        deleted = analysis_cache.invalidate(post_id, keep_versions)
+        return {
+            "success": True,
+            "message": f"已清除 {deleted} 条缓存",
+            "deleted": deleted
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"清除缓存失败: {str(e)}")
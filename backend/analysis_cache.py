@@ -0,0 +1,171 @@
+"""
+脚本分析结果共享缓存
+按 (post_id, 媒体哈希, 提示词模板版本, 模型) 缓存 Gemini 分析结果，所有用户共享，
+同一帖子在有效期内被任何用户重复分析时直接复用结果，不再调用 Gemini
+"""
+import os
+import json
+import threading
+import logging
+from typing import Optional
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# 缓存有效期（小时）
+CACHE_TTL_HOURS = int(os.getenv("ANALYSIS_CACHE_TTL_HOURS", "168"))
+
+# 当前进程的命中统计（数据库中记录全局命中次数）
+_stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _count(field: str, value=1):
+    with _stats_lock:
+        _stats[field] += value
+
+
+def get_cached_result(post_id: str, media_hash: str, template_version: str, model: str) -> Optional[dict]:
+    """
+    查询缓存的分析结果
+
+    Returns:
+        Optional[dict]: {"result": 解析后的结果, "elapsed_seconds": 原始分析耗时}，未命中返回 None
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE analysis_cache
+            SET hit_count = hit_count + 1,
+                last_hit_at = CURRENT_TIMESTAMP
+            WHERE post_id = %s AND media_hash = %s
+              AND template_version = %s AND model = %s
+              AND created_at > CURRENT_TIMESTAMP - make_interval(hours => %s)
+            RETURNING result, elapsed_seconds
+        ''', (post_id, media_hash, template_version, model, CACHE_TTL_HOURS))
+        row = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Analysis cache lookup failed: {e}")
+        _count("misses")
+        return None
+
+    if not row:
+        _count("misses")
+        return None
+
+    elapsed = float(row['elapsed_seconds'] or 0)
+    _count("hits")
+    _count("saved_seconds", elapsed)
+
+    result = row['result']
+    if isinstance(result, str):
+        result = json.loads(result)
+    return {"result": result, "elapsed_seconds": elapsed}
+
+
+def save_cached_result(post_id: str, post_type: str, media_hash: str, template_version: str,
+                       model: str, result: dict, elapsed_seconds: float, raw_text: Optional[str] = None):
+    """
+    写入分析结果缓存（同一 key 覆盖旧结果），同时清理过期条目
+    raw_text 为模型原始输出，用于解析器回归测试（bench/parse_bench.py）
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO analysis_cache
+                (post_id, post_type, media_hash, template_version, model, result, elapsed_seconds, raw_text)
+            VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s, %s)
+            ON CONFLICT (post_id, media_hash, template_version, model) DO UPDATE SET
+                post_type = EXCLUDED.post_type,
+                result = EXCLUDED.result,
+                elapsed_seconds = EXCLUDED.elapsed_seconds,
+                raw_text = EXCLUDED.raw_text,
+                hit_count = 0,
+                created_at = CURRENT_TIMESTAMP
+        ''', (
+            post_id, post_type, media_hash, template_version, model,
+            json.dumps(result, ensure_ascii=False), round(elapsed_seconds, 3), raw_text
+        ))
+        cursor.execute('''
+            DELETE FROM analysis_cache
+            WHERE created_at <= CURRENT_TIMESTAMP - make_interval(hours => %s)
+        ''', (CACHE_TTL_HOURS,))
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Analysis cache write failed: {e}")
+
+
+def invalidate(post_id: Optional[str] = None, keep_template_versions: Optional[list] = None) -> int:
+    """
+    删除缓存条目
+
+    Args:
+        post_id: 只删除该帖子的缓存，为空时删除全部
+        keep_template_versions: 保留这些模板版本的条目（用于模板变更后清理旧版本）
+
+    Returns:
+        int: 删除的条目数
+    """
+    conditions = []
+    params = []
+    if post_id:
+        conditions.append("post_id = %s")
+        params.append(post_id)
+    if keep_template_versions:
+        conditions.append("NOT (template_version = ANY(%s))")
+        params.append(list(keep_template_versions))
+
+    query = "DELETE FROM analysis_cache"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    deleted = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return deleted
+
+
+def get_stats() -> dict:
+    """缓存统计：当前进程命中率 + 数据库中的全局命中与节省耗时"""
+    with _stats_lock:
+        process_stats = dict(_stats)
+    total = process_stats["hits"] + process_stats["misses"]
+    process_stats["hit_rate"] = round(process_stats["hits"] / total, 4) if total else 0
+    process_stats["saved_seconds"] = round(process_stats["saved_seconds"], 1)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*) AS entries,
+               COALESCE(SUM(hit_count), 0) AS total_hits,
+               COALESCE(SUM(hit_count * elapsed_seconds), 0) AS saved_seconds,
+               COALESCE(AVG(elapsed_seconds), 0) AS avg_analysis_seconds
+        FROM analysis_cache
+        WHERE created_at > CURRENT_TIMESTAMP - make_interval(hours => %s)
+    ''', (CACHE_TTL_HOURS,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    return {
+        "ttl_hours": CACHE_TTL_HOURS,
+        "process": process_stats,
+        "global": {
+            "entries": row['entries'],
+            "total_hits": int(row['total_hits']),
+            "saved_seconds": round(float(row['saved_seconds']), 1),
+            "avg_analysis_seconds": round(float(row['avg_analysis_seconds']), 1),
+        },
+    }
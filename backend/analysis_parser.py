@@ -0,0 +1,360 @@
+"""
+Analysis response parsing
+Structured (JSON schema) output with a single-pass validator, plus a single-pass
+line scanner for Markdown responses. Callers supply the legacy regex parser as the
+last-resort fallback; per-method timing and success counts are kept for tuning.
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+# Ask Gemini for JSON matching the schemas below (streaming endpoints stay Markdown)
+STRUCTURED_OUTPUT = os.getenv("ANALYSIS_STRUCTURED_OUTPUT", "true").lower() == "true"
+
+# Appended to the per-request input in structured mode, so the cached system prompt is unchanged
+STRUCTURED_OUTPUT_INSTRUCTION = (
+    "\n**输出格式覆盖:** 本次请以 JSON 输出（字段定义见 response schema），"
+    "每个字段的内容要求与 (S) 中对应条目一致，使用中文，不要输出 Markdown 标题。\n"
+)
+
+
+def _string(description: str) -> dict:
+    return {"type": "STRING", "description": description}
+
+
+IMAGE_SIDECAR_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "content_pillar": _string("内容定位：这篇帖子的主要目的"),
+        "visual_strategy": _string("视觉策略：图片风格"),
+        "copy_strategy": _string("文案策略：语气、结构、行动号召"),
+        "target_audience": _string("目标受众"),
+        "success_factors": _string("成功归因：两个主要因素，每个4个字以内"),
+        "strategy_insight": _string("策略适配洞察"),
+        "post_copy": _string("帖子文案（中文）及推荐标签"),
+        "image_prompts": {
+            "type": "ARRAY",
+            "description": "图片生成提示词，单图帖子只有一项，多图帖子每张图片一项（按顺序）",
+            "items": {"type": "STRING"},
+        },
+    },
+    "required": [
+        "content_pillar", "visual_strategy", "copy_strategy", "target_audience",
+        "success_factors", "strategy_insight", "post_copy", "image_prompts",
+    ],
+}
+
+VIDEO_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "caption_role": _string("文案角色"),
+        "caption_message": _string("核心信息"),
+        "caption_cta": _string("文案CTA (行动号召)"),
+        "hashtag_composition": _string("标签构成"),
+        "hashtag_strategy": _string("标签策略"),
+        "success_factors": _string("成功归因：两个主要因素，每个4个字以内"),
+        "content_pillar": _string("核心定位 (Content Pillar)"),
+        "narrative_structure": _string("叙事结构 (Narrative Structure)"),
+        "hook": _string("黄金3秒钩子 (The Hook)"),
+        "audio_strategy": _string("听觉策略 (Audio Strategy)"),
+        "visuals_cta": _string("视觉与转化 (Visuals & CTA)"),
+    },
+    "required": [
+        "caption_role", "caption_message", "caption_cta",
+        "hashtag_composition", "hashtag_strategy", "success_factors",
+        "content_pillar", "narrative_structure", "hook", "audio_strategy", "visuals_cta",
+    ],
+}
+
+
+def get_schema(post_type: str) -> dict:
+    return VIDEO_SCHEMA if post_type == "Video" else IMAGE_SIDECAR_SCHEMA
+
+
+# ============================================
+# Structured (JSON) responses
+# ============================================
+
+def _validate(data, schema: dict) -> bool:
+    """Single pass over the required fields: present, right type, non-empty"""
+    if not isinstance(data, dict):
+        return False
+    for field in schema["required"]:
+        value = data.get(field)
+        if schema["properties"][field]["type"] == "ARRAY":
+            if not isinstance(value, list) or not any(isinstance(v, str) and v.strip() for v in value):
+                return False
+        elif not isinstance(value, str) or not value.strip():
+            return False
+    return True
+
+
+def _load_json(text: str):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    if not text.startswith("{"):
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def parse_structured(post_type: str, text: str) -> Optional[dict]:
+    """
+    Parse a JSON-mode response into the popular-table fields
+
+    Returns:
+        dict in the same shape as the Markdown parsers, or None if the text is not valid structured output
+    """
+    data = _load_json(text)
+    if not _validate(data, get_schema(post_type)):
+        return None
+
+    data = {k: v.strip() if isinstance(v, str) else v for k, v in data.items()}
+
+    if post_type == "Video":
+        jianyi3 = "\n\n".join([
+            "**【一、 帖子文案分析 (Caption Analysis)】**",
+            f"* **文案角色:** {data['caption_role']}\n"
+            f"* **核心信息:** {data['caption_message']}\n"
+            f"* **文案CTA (行动号召):** {data['caption_cta']}",
+            "**【二、 标签分析 (Hashtag Analysis)】**",
+            f"* **标签构成:** {data['hashtag_composition']}\n"
+            f"* **标签策略:** {data['hashtag_strategy']}",
+            "**【三、 视频内容分析 (Video Content Analysis)】**",
+            f"1. **核心定位 (Content Pillar):** {data['content_pillar']}\n"
+            f"2. **叙事结构 (Narrative Structure):** {data['narrative_structure']}\n"
+            f"3. **黄金3秒钩子 (The Hook):** {data['hook']}\n"
+            f"4. **听觉策略 (Audio Strategy):** {data['audio_strategy']}\n"
+            f"5. **视觉与转化 (Visuals & CTA):** {data['visuals_cta']}",
+        ])
+        return {"jianyi3": jianyi3, "success": data['success_factors']}
+
+    prompts = [p.strip() for p in data['image_prompts'] if isinstance(p, str) and p.strip()]
+    single = post_type == "Image" or len(prompts) == 1
+    return {
+        "jianyi1": "\n\n".join([
+            f"内容定位: {data['content_pillar']}",
+            f"视觉策略: {data['visual_strategy']}",
+            f"文案策略: {data['copy_strategy']}",
+            f"目标受众: {data['target_audience']}",
+        ]),
+        "success": data['success_factors'],
+        "jianyi1.5": data['strategy_insight'],
+        "jianyi2": data['post_copy'],
+        "prompt": "\n\n".join(prompts) if single else None,
+        "prompt_array": None if single else prompts,
+    }
+
+
+# ============================================
+# Markdown responses (single pass)
+# ============================================
+
+# "1. **内容定位 (Content Pillar):** text" / "* **成功归因:** text"
+_ITEM = re.compile(r'^\s*(?:\d+\.|[*\-])?\s*\*{0,2}\s*([^*:：\n]+?)\s*\*{0,2}\s*[:：]\s*\*{0,2}\s*(.*)$')
+_PROMPT_ITEM = re.compile(r'^\s*\*{0,2}\s*第[一二三四五六七八九十\d]+张图片提示词\s*[:：]\s*\*{0,2}\s*(.*)$')
+_PROMPT_SINGLE = re.compile(r'^\s*\*{0,2}\s*(?:图片)?提示词\s*[:：]\s*\*{0,2}\s*(.*)$')
+
+_SECTION_ONE_FIELDS = (
+    ("内容定位", "content_pillar"), ("Content Pillar", "content_pillar"),
+    ("视觉策略", "visual_strategy"), ("Visual Strategy", "visual_strategy"),
+    ("文案策略", "copy_strategy"), ("Copy Strategy", "copy_strategy"),
+    ("目标受众", "target_audience"), ("Target Audience", "target_audience"),
+    ("成功归因", "success"), ("Success factors", "success"),
+)
+_SECTION_TWO_FIELDS = (
+    ("策略适配洞察", "jianyi1.5"),
+    ("帖子文案", "jianyi2"),
+    ("图片生成提示词", "prompts"),
+)
+
+
+def _match_field(label: str, fields) -> Optional[str]:
+    for name, key in fields:
+        if label.startswith(name):
+            return key
+    return None
+
+
+def _clean(lines: list) -> str:
+    return "\n".join(lines).strip().strip("*").strip()
+
+
+def parse_markdown_image_sidecar(text: str) -> dict:
+    """
+    Scan an Image/Sidecar Markdown response line by line
+
+    Returns:
+        dict with jianyi1 / success / jianyi1.5 / jianyi2 / prompt / prompt_array
+    """
+    buffers = {}
+    prompt_items = []
+    section = 0
+    current = None
+
+    for line in text.splitlines():
+        if "【一、" in line:
+            section, current = 1, None
+            continue
+        if "【二、" in line:
+            section, current = 2, None
+            continue
+        if section == 0:
+            continue
+
+        # Only lines that can be headings go through a regex; body lines are appended as-is
+        if current == "prompts":
+            if "提示词" in line:
+                item = _PROMPT_ITEM.match(line)
+                if item:
+                    prompt_items.append([item.group(1)] if item.group(1) else [])
+                    continue
+                single = _PROMPT_SINGLE.match(line)
+                if single and not prompt_items:
+                    if single.group(1):
+                        buffers["prompts"].append(single.group(1))
+                    continue
+            (prompt_items[-1] if prompt_items else buffers["prompts"]).append(line)
+            continue
+
+        item = _ITEM.match(line) if (":" in line or "：" in line) else None
+        if item:
+            key = _match_field(item.group(1).strip(), _SECTION_ONE_FIELDS if section == 1 else _SECTION_TWO_FIELDS)
+            if key:
+                current = key
+                buffers[current] = [item.group(2)] if item.group(2) else []
+                continue
+
+        if current:
+            buffers[current].append(line)
+
+    def field(key):
+        return _clean(buffers.get(key, []))
+
+    jianyi1_parts = [
+        f"{label}: {field(key)}"
+        for label, key in (("内容定位", "content_pillar"), ("视觉策略", "visual_strategy"),
+                           ("文案策略", "copy_strategy"), ("目标受众", "target_audience"))
+        if key in buffers
+    ]
+
+    prompt_array = [_clean(lines) for lines in prompt_items if _clean(lines)]
+    return {
+        "jianyi1": "\n\n".join(jianyi1_parts),
+        "success": field("success"),
+        "jianyi1.5": field("jianyi1.5"),
+        "jianyi2": field("jianyi2"),
+        "prompt": None if prompt_array or "prompts" not in buffers else (field("prompts") or None),
+        "prompt_array": prompt_array or None,
+    }
+
+
+_VIDEO_SUCCESS = re.compile(r'^\s*\*?\s*\*{0,2}\s*(?:成功归因|Success factors)\s*\*{0,2}\s*[:：]\s*\*{0,2}\s*(.*)$')
+
+
+def parse_markdown_video(text: str) -> dict:
+    """
+    Scan a Video Markdown response line by line: jianyi3 is the report without the
+    success-factor line, success is that line's value from the hashtag section
+    """
+    kept = []
+    success = ""
+    section = 0
+
+    for line in text.splitlines():
+        if "【二、" in line:
+            section = 2
+        elif "【三、" in line:
+            section = 3
+
+        match = None
+        if section == 2 and not success and ("成功归因" in line or "Success factors" in line):
+            match = _VIDEO_SUCCESS.match(line)
+        if match:
+            success = match.group(1).strip().strip("*").strip()
+            continue
+        kept.append(line)
+
+    return {"jianyi3": "\n".join(kept).strip(), "success": success}
+
+
+# ============================================
+# Pipeline
+# ============================================
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(method: str, elapsed: float, ok: bool):
+    with _stats_lock:
+        stats = _stats.setdefault(method, {"calls": 0, "complete": 0, "total_us": 0.0})
+        stats["calls"] += 1
+        stats["complete"] += 1 if ok else 0
+        stats["total_us"] += elapsed * 1e6
+
+
+def is_complete(post_type: str, parsed: Optional[dict]) -> bool:
+    """All fields the frontend relies on are present"""
+    if not parsed:
+        return False
+    if post_type == "Video":
+        return bool(parsed.get('jianyi3') and parsed.get('success'))
+    return bool(
+        parsed.get('jianyi1') and parsed.get('success') and parsed.get('jianyi2')
+        and (parsed.get('prompt') or parsed.get('prompt_array'))
+    )
+
+
+def parse(post_type: str, text: str, fallback: Callable[[str], dict]) -> dict:
+    """
+    Parse an analysis response: structured JSON -> single-pass Markdown -> regex fallback
+
+    Args:
+        post_type: Image / Sidecar / Video
+        text: raw model response
+        fallback: legacy regex parser for this post type
+
+    Returns:
+        dict: parsed fields
+    """
+    start = time.perf_counter()
+    parsed = parse_structured(post_type, text)
+    _record("structured", time.perf_counter() - start, parsed is not None)
+    if parsed is not None:
+        return parsed
+
+    start = time.perf_counter()
+    if post_type == "Video":
+        parsed = parse_markdown_video(text)
+    else:
+        parsed = parse_markdown_image_sidecar(text)
+    ok = is_complete(post_type, parsed)
+    _record("single_pass", time.perf_counter() - start, ok)
+    if ok:
+        return parsed
+
+    start = time.perf_counter()
+    legacy = fallback(text)
+    _record("regex", time.perf_counter() - start, is_complete(post_type, legacy))
+    return legacy
+
+
+def get_stats() -> dict:
+    """Per-method parse counts, completeness rate and mean time"""
+    with _stats_lock:
+        return {
+            method: {
+                "calls": stats["calls"],
+                "complete_rate": round(stats["complete"] / stats["calls"], 4) if stats["calls"] else 0,
+                "avg_us": round(stats["total_us"] / stats["calls"], 1) if stats["calls"] else 0,
+            }
+            for method, stats in _stats.items()
+        }
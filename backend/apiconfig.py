@@ -5,17 +5,20 @@ API Key 配置管理模块
 """
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Callable, Dict, Optional
 import os
+import threading
+import time
 import logging
 from database import get_db_connection
+import bootstrap
+import changefeed
 
 router = APIRouter(prefix="/api/config", tags=["config"])
 logger = logging.getLogger(__name__)
 
-# 全局 API Key 存储（运行时缓存）
-# 优先从数据库加载，如果数据库没有则使用环境变量
-_api_keys = {
+# 环境变量中的默认值（数据库中没有对应记录时使用）
+_env_keys = {
     "APIFY_API_TOKEN": os.getenv("APIFY_API_TOKEN", ""),
     "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", ""),
     "AISONNET_API_KEY": os.getenv("AISONNET_API_KEY", ""),
@@ -23,39 +26,97 @@ _api_keys = {
     "SORA2_API_KEY": os.getenv("SORA2_API_KEY", ""),
 }
 
-def load_api_keys_from_db():
+# 全局 API Key 存储（运行时缓存）
+# 优先从数据库加载，如果数据库没有则使用环境变量
+_api_keys = dict(_env_keys)
+
+# 每个 Key 的版本号（api_config.version，每次更新 +1；0 表示来自环境变量）
+# 各 worker 通过 api_config 表变更通知重新加载；监听未连接时按 KEY_CHECK_SECONDS 比对版本
+_key_versions = {name: 0 for name in _env_keys}
+_versions_fingerprint = None
+_checked_at = 0.0
+_reload_lock = threading.Lock()
+
+KEY_CHECK_SECONDS = int(os.getenv("API_KEY_CHECK_SECONDS", "10"))
+
+VERSION_QUERY = "SELECT COUNT(*) AS n, COALESCE(SUM(version), 0) AS total FROM api_config"
+
+def load_api_keys_from_db(raise_errors: bool = False):
     """
     从数据库加载 API Keys 到内存
-    启动时自动调用一次
+    启动初始化（bootstrap.py）、收到 api_config 变更通知、检测到版本变化时调用
+
+    Args:
+        raise_errors: 加载失败时抛出异常（启动初始化据此重试），默认只记录日志
     """
+    global _versions_fingerprint, _checked_at
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT key_name, key_value FROM api_config")
+        cursor.execute(VERSION_QUERY)
+        fingerprint = tuple(cursor.fetchone().values())
+        cursor.execute("SELECT key_name, key_value, version FROM api_config")
         rows = cursor.fetchall()
         
-        for row in rows:
-            _api_keys[row['key_name']] = row['key_value']
-            logger.info(f"Loaded API key from database: {row['key_name']}")
-        
         cursor.close()
         conn.close()
         
-        if rows:
-            logger.info(f"Successfully loaded {len(rows)} API keys from database")
-        else:
+        # 整体替换：数据库中已删除的 Key 回退到环境变量
+        keys, versions = dict(_env_keys), {name: 0 for name in _env_keys}
+        for row in rows:
+            keys[row['key_name']] = row['key_value']
+            versions[row['key_name']] = row['version']
+        
+        with _reload_lock:
+            changed = [name for name in keys if versions.get(name) != _key_versions.get(name)]
+            _api_keys.clear()
+            _api_keys.update(keys)
+            _key_versions.clear()
+            _key_versions.update(versions)
+            _versions_fingerprint = fingerprint
+            _checked_at = time.time()
+        
+        if changed:
+            logger.info(f"Loaded API keys from database: {', '.join(changed)}")
+        elif not rows:
             logger.info("No API keys found in database, using environment variables")
             
     except Exception as e:
+        if raise_errors:
+            raise
         logger.warning(f"Failed to load API keys from database: {e}")
         logger.info("Using environment variables for API keys")
         # 如果数据库还没初始化或出错，不报错，继续使用环境变量
 
-# 启动时自动从数据库加载 API Keys
-try:
-    load_api_keys_from_db()
-except Exception as e:
-    logger.warning(f"Initial API keys loading failed: {e}")
+def _check_versions():
+    """
+    变更通知监听未连接（或尚未成功从数据库加载过 Key）时，最多每 KEY_CHECK_SECONDS 秒
+    比对一次版本（单行聚合查询），其他 worker 更新过 Key 时重新加载
+    """
+    global _checked_at
+    if time.time() - _checked_at < KEY_CHECK_SECONDS:
+        return
+    if changefeed.listener.connected and _versions_fingerprint is not None:
+        return
+    _checked_at = time.time()
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(VERSION_QUERY)
+        fingerprint = tuple(cursor.fetchone().values())
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"API key version check failed: {e}")
+        return
+    if fingerprint != _versions_fingerprint:
+        load_api_keys_from_db()
+
+# 数据库可用后加载 API Keys（导入阶段不访问数据库，加载完成前使用环境变量）
+bootstrap.register("api_keys", lambda: load_api_keys_from_db(raise_errors=True))
+
+# 其他 worker 修改 API Key 后重新加载（api_config 表变更通知）
+changefeed.subscribe("api_config", lambda changes: load_api_keys_from_db())
 
 class APIKeysRequest(BaseModel):
     apify_token: Optional[str] = None
@@ -70,14 +131,60 @@ class APIKeysResponse(BaseModel):
     aisonnet_key_set: bool
     deepseek_key_set: bool
     sora2_key_set: bool
+    versions: Optional[Dict[str, int]] = None
 
 def get_api_key(key_name: str) -> str:
     """
     获取 API Key
     优先从运行时缓存获取，如果没有则从环境变量获取
     """
+    _check_versions()
     return _api_keys.get(key_name, "")
 
+def get_key_version(key_name: str) -> int:
+    """获取 API Key 当前版本号（0 表示使用环境变量）"""
+    _check_versions()
+    return _key_versions.get(key_name, 0)
+
+class ProviderClient:
+    """
+    按 API Key 版本懒加载的服务商客户端
+    Key 的版本变化（任一 worker 更新了 Key）后，下次 get() 时用新 Key 重建
+    """
+
+    def __init__(self, key_name: str, factory: Callable[[str], Any]):
+        self.key_name = key_name
+        self.factory = factory
+        self._client = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self):
+        version = get_key_version(self.key_name)
+        client = self._client
+        if client is not None and version == self._version:
+            return client
+        with self._lock:
+            if self._client is None or version != self._version:
+                token = get_api_key(self.key_name) or os.getenv(self.key_name, "")
+                self._client = self.factory(token)
+                self._version = version
+                self.builds += 1
+                logger.info(f"Built {self.key_name} client (version {version})")
+            return self._client
+
+def _build_apify_client(token):
+    # apify_client 在第一次抓取时才导入，缩短应用启动时间
+    from apify_client import ApifyClient
+    return ApifyClient(token)
+
+# Apify 客户端（竞品抓取与关键词抓取共用；APIFY_API_TOKEN 更新后自动重建，任一 worker 更新均生效）
+_apify = ProviderClient("APIFY_API_TOKEN", _build_apify_client)
+
+def get_apify_client():
+    return _apify.get()
+
 def set_api_key(key_name: str, value: str):
     """
     设置 API Key（同时更新内存缓存和数据库）
@@ -94,17 +201,21 @@ def set_api_key(key_name: str, value: str):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # 使用 UPSERT（插入或更新）
+        # 使用 UPSERT（插入或更新），版本号 +1 通知其他 worker 重新加载
         cursor.execute("""
-            INSERT INTO api_config (key_name, key_value, updated_at) 
-            VALUES (%s, %s, CURRENT_TIMESTAMP)
+            INSERT INTO api_config (key_name, key_value, version, updated_at) 
+            VALUES (%s, %s, 1, CURRENT_TIMESTAMP)
             ON CONFLICT (key_name) 
             DO UPDATE SET 
                 key_value = EXCLUDED.key_value, 
+                version = api_config.version + 1,
                 updated_at = CURRENT_TIMESTAMP
+            RETURNING version
         """, (key_name, value))
+        version = cursor.fetchone()['version']
         
         conn.commit()
+        _key_versions[key_name] = version
         cursor.close()
         conn.close()
         
@@ -155,5 +266,6 @@ async def get_api_keys_status():
         aisonnet_key_set=len(get_api_key("AISONNET_API_KEY")) > 0,
         deepseek_key_set=len(get_api_key("DEEPSEEK_API_KEY")) > 0,
         sora2_key_set=len(get_api_key("SORA2_API_KEY")) > 0,
+        versions=dict(_key_versions),
     )
 
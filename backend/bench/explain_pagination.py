@@ -0,0 +1,118 @@
+"""
+EXPLAIN check for keyset-paginated post lists
+
+Runs the queries issued by pagination.fetch_page for the competitor and keyword
+post lists (first page and a follow-up page, with and without a post_type
+filter) through EXPLAIN and asserts that each one is served by one of the
+composite (owner/search, [post_type,] timestamp, id) indexes with no Sort node
+and no sequential scan of post_data. Exits with status 1 on any violation.
+
+By default enable_seqscan is turned off so the check is meaningful on small
+development databases; pass --planner-default to check the planner's real
+choice on a production-sized table.
+
+Usage (from backend/, against a database initialised by init_db.py):
+    python bench/explain_pagination.py --username someuser --search-id 1
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pagination  # noqa: E402
+from database import get_db_connection  # noqa: E402
+
+EXPECTED_INDEXES = {
+    "owner_username": ("idx_post_data_owner_type_ts", "idx_post_data_owner_ts"),
+    "search_id": ("idx_post_data_search_type_ts", "idx_post_data_search_ts"),
+}
+
+
+class ExplainCursor:
+    """Cursor wrapper that EXPLAINs every query instead of running it"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.plans = []
+
+    def execute(self, query, params=None):
+        self.cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = self.cursor.fetchone()["QUERY PLAN"]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self.plans.append((query, plan[0]["Plan"]))
+
+    def fetchall(self):
+        return []
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def check_plan(plan, expected) -> list:
+    problems = []
+    nodes = list(walk(plan))
+    if any(n["Node Type"] == "Sort" for n in nodes):
+        problems.append("Sort node")
+    if any(n["Node Type"] == "Seq Scan" and n.get("Relation Name") == "post_data" for n in nodes):
+        problems.append("Seq Scan on post_data")
+    used = {n.get("Index Name") for n in nodes if n["Node Type"] in ("Index Scan", "Index Only Scan")}
+    if not used & set(expected):
+        problems.append(f"none of {expected} used (indexes: {sorted(i for i in used if i)})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--username", default="example_user", help="owner_username to filter by")
+    parser.add_argument("--search-id", type=int, default=1, help="search_id to filter by")
+    parser.add_argument("--post-type", default="Image")
+    parser.add_argument("--page-size", type=int, default=5)
+    parser.add_argument("--planner-default", action="store_true", help="leave enable_seqscan on")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not args.planner_default:
+        cursor.execute("SET enable_seqscan = off")
+
+    cursors = {
+        "first page": None,
+        "next page": pagination.encode_cursor(datetime.now(), 2 ** 31 - 1),
+        "null-timestamp page": pagination.encode_cursor(None, 2 ** 31 - 1),
+    }
+
+    failures = 0
+    for column, value in (("owner_username", args.username), ("search_id", args.search_id)):
+        for post_type in (None, args.post_type):
+            query = f"SELECT * FROM post_data WHERE {column} = %s"
+            params = [value]
+            if post_type:
+                query += " AND post_type = %s"
+                params.append(post_type)
+
+            for label, after in cursors.items():
+                explain = ExplainCursor(cursor)
+                pagination.fetch_page(explain, query, params, args.page_size, after)
+                for sql, plan in explain.plans:
+                    problems = check_plan(plan, EXPECTED_INDEXES[column])
+                    status = "FAIL" if problems else "ok"
+                    print(f"[{status}] {column} post_type={post_type or 'all'} {label}: {sql[len(query):].strip()}")
+                    if problems:
+                        failures += 1
+                        print("       " + "; ".join(problems))
+                        print("       " + json.dumps(plan)[:400])
+
+    cursor.close()
+    conn.close()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Application import-time budget
+
+Imports main.py in a fresh interpreter with `python -X importtime`, reports the
+slowest modules by cumulative import time and checks that:
+  - the total import time of main stays under --budget-ms
+  - heavy provider SDKs (google.genai, apify_client, openai) are not imported eagerly
+  - nothing connects to the database during import (the database settings point at
+    an unreachable host, so any import-time query would show up as a connection log)
+Exits with status 1 when any check fails.
+
+Usage (from backend/, with requirements.txt installed; no database needed):
+    python bench/import_budget.py --budget-ms 1500 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ("google.genai", "apify_client", "openai")
+DB_LOG_MARKERS = ("Using Railway database", "Using local database")
+
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(runs: int):
+    """Best of `runs` cold imports: (total_us, [(cumulative_us, self_us, module)], other output)"""
+    env = dict(os.environ)
+    env.pop("DATABASE_URL", None)
+    env.update({"DB_HOST": "127.0.0.1", "DB_PORT": "1", "PYTHONDONTWRITEBYTECODE": "1",
+                "LOG_FORMAT": "text", "LOG_LEVELS": "database=DEBUG"})
+
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(proc.stderr[-4000:])
+            raise SystemExit("import main failed")
+
+        modules, other = [], []
+        total = 0
+        for line in proc.stderr.splitlines():
+            match = LINE.match(line)
+            if not match:
+                if not line.startswith("import time:"):
+                    other.append(line)
+                continue
+            self_us, cumulative_us, _, name = match.groups()
+            modules.append((int(cumulative_us), int(self_us), name))
+            if name == "main":
+                total = int(cumulative_us)
+        if best is None or total < best[0]:
+            best = (total, modules, other + proc.stdout.splitlines())
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=1500, help="maximum cumulative import time of main")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to list")
+    parser.add_argument("--runs", type=int, default=3, help="imports to run (the fastest one is reported)")
+    args = parser.parse_args()
+
+    total, modules, other = measure(args.runs)
+    imported = {name for _, _, name in modules}
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(modules, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    print(f"\nimport main: {total / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    if total / 1000 > args.budget_ms:
+        failures.append(f"import time {total / 1000:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+    for module in LAZY_MODULES:
+        if module in imported:
+            failures.append(f"{module} imported at startup")
+    for line in other:
+        if any(marker in line for marker in DB_LOG_MARKERS):
+            failures.append(f"database accessed at import: {line.strip()}")
+            break
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
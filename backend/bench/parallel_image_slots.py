@@ -0,0 +1,82 @@
+"""
+Parallel new_images_base64 slot writes
+
+Writes every slot of a scratch mypostl row from concurrent threads (in shuffled
+order, each on its own connection) through imageanalysis.save_new_image and checks
+that no write was lost. Exits with status 1 on any mismatch.
+
+Usage (from backend/, against a database initialised by init_db.py):
+    python bench/parallel_image_slots.py --user-id 1 --slots 10 --rounds 5
+"""
+import argparse
+import os
+import random
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2.extras import RealDictCursor  # noqa: E402
+from database import get_db_connection  # noqa: E402
+from imageanalysis import save_new_image  # noqa: E402
+
+
+def write_slot(user_id: int, post_id: str, index: int):
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            save_new_image(cur, user_id, post_id, index, f"slot-{index}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_round(user_id: int, slots: int) -> bool:
+    post_id = f"__slot_check_{uuid.uuid4().hex[:12]}"
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                INSERT INTO mypostl (user_id, post_id, post_type)
+                VALUES (%s, %s, 'Sidecar')
+            """, (user_id, post_id))
+        conn.commit()
+
+        order = list(range(slots))
+        random.shuffle(order)
+        with ThreadPoolExecutor(max_workers=slots) as executor:
+            list(executor.map(lambda i: write_slot(user_id, post_id, i), order))
+
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT new_images_base64 FROM mypostl WHERE user_id = %s AND post_id = %s
+            """, (user_id, post_id))
+            stored = cur.fetchone()['new_images_base64']
+
+        expected = [f"slot-{i}" for i in range(slots)]
+        if stored != expected:
+            print(f"MISMATCH (write order {order}): {stored}")
+            return False
+        return True
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM mypostl WHERE user_id = %s AND post_id = %s", (user_id, post_id))
+        conn.commit()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, required=True, help="existing user id for the scratch row")
+    parser.add_argument("--slots", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    passed = sum(run_round(args.user_id, args.slots) for _ in range(args.rounds))
+    print(f"{passed}/{args.rounds} rounds kept all {args.slots} slots")
+    sys.exit(0 if passed == args.rounds else 1)
+
+
+if __name__ == "__main__":
+    main()
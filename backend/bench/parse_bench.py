@@ -0,0 +1,123 @@
+"""
+Analysis parser benchmark
+
+Measures parse time and completeness of each parsing method (structured JSON,
+single-pass Markdown, legacy regex) over a corpus of stored model responses.
+
+Usage (from backend/):
+    python bench/parse_bench.py                          # run on bench/corpus/*.jsonl
+    python bench/parse_bench.py --corpus my.jsonl --repeat 200
+    python bench/parse_bench.py --export bench/corpus/cache.jsonl --limit 500
+                                                         # dump raw responses from analysis_cache
+
+Corpus format: one JSON object per line, {"post_type": "Image|Sidecar|Video", "text": "..."}
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis_parser  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "*.jsonl")
+
+
+def export_corpus(path: str, limit: int):
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT post_type, raw_text FROM analysis_cache
+        WHERE raw_text IS NOT NULL
+        ORDER BY created_at DESC
+        LIMIT %s
+    ''', (limit,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({"post_type": row['post_type'], "text": row['raw_text']}, ensure_ascii=False) + "\n")
+    print(f"Exported {len(rows)} responses to {path}")
+
+
+def load_corpus(pattern: str) -> list:
+    entries = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    return entries
+
+
+def get_methods():
+    # The regex parsers live in analysis.py, which needs the full app environment
+    from analysis import parse_analysis_result_image_sidecar, parse_analysis_result_video
+
+    def structured(post_type, text):
+        return analysis_parser.parse_structured(post_type, text)
+
+    def single_pass(post_type, text):
+        if post_type == "Video":
+            return analysis_parser.parse_markdown_video(text)
+        return analysis_parser.parse_markdown_image_sidecar(text)
+
+    def regex(post_type, text):
+        if post_type == "Video":
+            return parse_analysis_result_video(text)
+        return parse_analysis_result_image_sidecar(text)
+
+    def pipeline(post_type, text):
+        fallback = parse_analysis_result_video if post_type == "Video" else parse_analysis_result_image_sidecar
+        return analysis_parser.parse(post_type, text, fallback)
+
+    return {"structured": structured, "single_pass": single_pass, "regex": regex, "pipeline": pipeline}
+
+
+def run(entries: list, repeat: int):
+    methods = get_methods()
+    print(f"{len(entries)} responses, {repeat} runs each\n")
+    print(f"{'method':<12} {'complete':>10} {'avg_us':>10} {'p95_us':>10}")
+
+    for name, method in methods.items():
+        timings = []
+        complete = 0
+        for entry in entries:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                parsed = method(entry["post_type"], entry["text"])
+            timings.append((time.perf_counter() - start) / repeat * 1e6)
+            complete += 1 if analysis_parser.is_complete(entry["post_type"], parsed) else 0
+
+        timings.sort()
+        avg = sum(timings) / len(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{name:<12} {complete / len(entries):>10.1%} {avg:>10.1f} {p95:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="corpus file or glob")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--export", help="dump raw responses from analysis_cache to this path and exit")
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.export:
+        export_corpus(args.export, args.limit)
+        return
+
+    entries = load_corpus(args.corpus)
+    if not entries:
+        print(f"No corpus entries found at {args.corpus}")
+        return
+    run(entries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
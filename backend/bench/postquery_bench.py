@@ -0,0 +1,196 @@
+"""
+Faceted post query latency benchmark
+
+Seeds a synthetic dataset into post_data (default 1M rows spread over 50 bench
+competitors and 10 bench keywords), then runs random filter combinations through
+postquery.query_posts (first page + facets, facet cache disabled) and reports
+p50/p95/p99 latency. Exits with status 1 when p95 exceeds --p95-ms.
+
+Bench rows use the "__bench_" prefix and are removed with --cleanup
+(post_data rows cascade from the bench competitor/search rows).
+
+Usage (from backend/, against a database initialised by init_db.py):
+    python bench/postquery_bench.py --seed 1000000
+    python bench/postquery_bench.py --queries 300 --p95-ms 250
+    python bench/postquery_bench.py --cleanup
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import postquery  # noqa: E402
+import posttags  # noqa: E402
+from database import get_db_connection  # noqa: E402
+
+OWNERS = [f"__bench_owner_{i}" for i in range(50)]
+KEYWORDS = [f"__bench_kw_{i}" for i in range(10)]
+# Raw hashtags as scraped: "#" prefixes, mixed case and full-width letters, so the
+# seeded post_hashtag rows go through the same normalization as production
+HASHTAGS = [
+    (f"#BenchTag{i}", f"BENCHTAG{i}", f"ｂｅｎｃｈTag{i}")[i % 3]
+    for i in range(500)
+]
+POST_TYPES = ["Image", "Video", "Sidecar"]
+
+
+def seed(rows: int, batch: int):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    competitor_ids = []
+    for owner in OWNERS:
+        cursor.execute("""
+            INSERT INTO competitor (instagram_id, username) VALUES (%s, %s)
+            ON CONFLICT (instagram_id) DO UPDATE SET username = EXCLUDED.username
+            RETURNING id
+        """, (owner, owner))
+        competitor_ids.append(cursor.fetchone()['id'])
+
+    search_ids = []
+    for keyword in KEYWORDS:
+        cursor.execute("""
+            INSERT INTO search (keyword) VALUES (%s)
+            ON CONFLICT (keyword) DO UPDATE SET keyword = EXCLUDED.keyword
+            RETURNING id
+        """, (keyword,))
+        search_ids.append(cursor.fetchone()['id'])
+    conn.commit()
+
+    start = time.time()
+    for offset in range(0, rows, batch):
+        n = min(batch, rows - offset)
+        # 80% competitor posts, 20% keyword posts; likes/views are long-tailed
+        cursor.execute("""
+            INSERT INTO post_data (
+                post_id, post_type, owner_username, "timestamp",
+                likes_count, comments_count, video_view_count, video_play_count,
+                hashtags, competitor_id, search_id
+            )
+            SELECT
+                '__bench_' || (%s + g),
+                (%s::text[])[1 + (g %% 3)],
+                CASE WHEN g %% 5 < 4 THEN (%s::text[])[1 + (g %% 50)] ELSE 'kw_owner_' || (g %% 997) END,
+                NOW() - (random() * INTERVAL '730 days'),
+                floor(power(random(), 4) * 200000)::int,
+                floor(power(random(), 4) * 5000)::int,
+                CASE WHEN g %% 3 = 1 THEN floor(power(random(), 4) * 2000000)::bigint ELSE 0 END,
+                CASE WHEN g %% 3 = 1 THEN floor(power(random(), 4) * 3000000)::bigint ELSE 0 END,
+                jsonb_build_array(
+                    (%s::text[])[1 + floor(power(random(), 2) * 500)::int],
+                    (%s::text[])[1 + floor(random() * 500)::int]
+                ),
+                CASE WHEN g %% 5 < 4 THEN (%s::int[])[1 + (g %% 50)] END,
+                CASE WHEN g %% 5 = 4 THEN (%s::int[])[1 + (g %% 10)] END
+            FROM generate_series(1, %s) AS g
+            ON CONFLICT (post_id) DO NOTHING
+        """, (offset, POST_TYPES, OWNERS, HASHTAGS, HASHTAGS, competitor_ids, search_ids, n))
+        conn.commit()
+        print(f"  seeded {offset + n}/{rows} rows ({time.time() - start:.0f}s)")
+
+    # Index the bench hashtags with posttags.normalize_tag (what sync_post_tags stores),
+    # mapped in SQL so seeding a million rows does not take a round trip per post
+    cursor.execute("""
+        INSERT INTO post_hashtag (post_data_id, tag, posted_at)
+        SELECT p.id, m.tag, p."timestamp"
+        FROM post_data p, jsonb_array_elements_text(p.hashtags) AS h(raw)
+        JOIN unnest(%s::text[], %s::text[]) AS m(raw, tag) ON m.raw = h.raw
+        WHERE p.post_id LIKE '\\_\\_bench\\_%%'
+        ON CONFLICT (post_data_id, tag) DO NOTHING
+    """, (HASHTAGS, [posttags.normalize_tag(tag) for tag in HASHTAGS]))
+    conn.commit()
+
+    cursor.execute("ANALYZE post_data")
+    cursor.execute("ANALYZE post_hashtag")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def cleanup():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM competitor WHERE instagram_id = ANY(%s)", (OWNERS,))
+    cursor.execute("DELETE FROM search WHERE keyword = ANY(%s)", (KEYWORDS,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def random_filters(rng: random.Random) -> postquery.PostFilters:
+    filters = postquery.PostFilters()
+    if rng.random() < 0.5:
+        filters.competitor = rng.choice(OWNERS)
+    elif rng.random() < 0.3:
+        filters.keyword = rng.choice(KEYWORDS)
+    if rng.random() < 0.6:
+        filters.post_type = rng.choice(POST_TYPES)
+    if rng.random() < 0.4:
+        days = rng.choice([7, 30, 90, 365])
+        filters.date_from = date.today() - timedelta(days=days)
+    if rng.random() < 0.3:
+        filters.min_likes = rng.choice([1000, 10000, 50000])
+    if rng.random() < 0.2:
+        filters.min_comments = rng.choice([100, 1000])
+    if rng.random() < 0.15:
+        filters.min_views = rng.choice([10000, 100000])
+    if rng.random() < 0.3:
+        filters.hashtag = rng.choice(HASHTAGS[:50])
+    return filters
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def run(queries: int, page_size: int, p95_ms: float, seed_value: int) -> bool:
+    rng = random.Random(seed_value)
+    postquery._facets.ttl = 0  # measure uncached facet queries
+    samples = []
+    slowest = []
+    for _ in range(queries):
+        filters = random_filters(rng)
+        start = time.perf_counter()
+        postquery.query_posts(filters, page_size=page_size)
+        elapsed = (time.perf_counter() - start) * 1000
+        samples.append(elapsed)
+        slowest.append((elapsed, filters.dict(exclude_none=True)))
+
+    p50, p95, p99 = (percentile(samples, p) for p in (0.5, 0.95, 0.99))
+    print(f"{queries} queries: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms (target p95 <= {p95_ms} ms)")
+    print("slowest filter combinations:")
+    for elapsed, filters in sorted(slowest, key=lambda s: s[0], reverse=True)[:5]:
+        print(f"  {elapsed:8.1f} ms  {filters}")
+    return p95 <= p95_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="insert this many synthetic rows first")
+    parser.add_argument("--batch", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--p95-ms", type=float, default=250)
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--cleanup", action="store_true", help="delete the bench rows and exit")
+    args = parser.parse_args()
+
+    if args.cleanup:
+        cleanup()
+        print("bench rows deleted")
+        return
+
+    if args.seed:
+        seed(args.seed, args.batch)
+
+    ok = run(args.queries, args.page_size, args.p95_ms, args.random_seed)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+依赖数据库的启动任务
+导入阶段不访问数据库、不创建外部服务客户端；应用启动后在后台线程中等待数据库可用
+（指数退避重试），再依次执行各模块注册的初始化任务（加载 API Key、加载内存指标缓存、
+启动变更通知监听等）。数据库未就绪时应用照常启动并通过健康检查，/health 可查看初始化进度；
+重试后仍失败的任务使状态变为 degraded，并在后台每 RETRY_MAX_SECONDS 秒继续重试直到成功
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from database import test_connection
+
+logger = logging.getLogger(__name__)
+
+# 数据库重试间隔（秒）：从 STARTUP_DB_RETRY_SECONDS 开始翻倍，最长 STARTUP_DB_RETRY_MAX_SECONDS
+RETRY_INITIAL_SECONDS = float(os.getenv("STARTUP_DB_RETRY_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("STARTUP_DB_RETRY_MAX_SECONDS", "30"))
+# 单个初始化任务失败后的重试次数
+TASK_RETRIES = 3
+
+_tasks: List[Tuple[str, Callable[[], None]]] = []
+_status = {
+    "state": "pending",  # pending / waiting_for_db / initializing / degraded / ready
+    "db_attempts": 0,
+    "tasks": {},
+    "failed_tasks": [],
+    "started_at": None,
+    "ready_at": None,
+}
+_thread = None
+
+
+def register(name: str, func: Callable[[], None]):
+    """注册数据库可用后执行的初始化任务（按注册顺序执行）"""
+    _tasks.append((name, func))
+    _status["tasks"][name] = "pending"
+
+
+def _wait_for_db():
+    delay = RETRY_INITIAL_SECONDS
+    while True:
+        _status["db_attempts"] += 1
+        if test_connection():
+            return
+        _status["state"] = "waiting_for_db"
+        logger.warning("数据库未就绪，%g 秒后重试（第 %s 次）", delay, _status["db_attempts"])
+        time.sleep(delay)
+        delay = min(delay * 2, RETRY_MAX_SECONDS)
+
+
+def _run_task(name: str, func: Callable[[], None]) -> bool:
+    delay = RETRY_INITIAL_SECONDS
+    for attempt in range(1, TASK_RETRIES + 1):
+        try:
+            start = time.perf_counter()
+            func()
+            _status["tasks"][name] = f"ok ({(time.perf_counter() - start) * 1000:.0f} ms)"
+            return True
+        except Exception as e:
+            _status["tasks"][name] = f"failed: {e}"
+            logger.error("初始化任务 %s 失败（第 %s 次）: %s", name, attempt, e)
+            if attempt < TASK_RETRIES:
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_SECONDS)
+    return False
+
+
+def _run():
+    _wait_for_db()
+    _status["state"] = "initializing"
+    failed = [(name, func) for name, func in _tasks if not _run_task(name, func)]
+    while failed:
+        _status["state"] = "degraded"
+        _status["failed_tasks"] = [name for name, _ in failed]
+        logger.error("启动初始化未完成，%g 秒后重试: %s", RETRY_MAX_SECONDS, _status["failed_tasks"])
+        time.sleep(RETRY_MAX_SECONDS)
+        failed = [(name, func) for name, func in failed if not _run_task(name, func)]
+    _status["failed_tasks"] = []
+    _status["state"] = "ready"
+    _status["ready_at"] = time.time()
+    logger.info("启动初始化完成: %s", _status["tasks"])
+
+
+def start():
+    """在后台线程中执行初始化（应用启动时调用一次）"""
+    global _thread
+    if _thread is not None:
+        return
+    _status["started_at"] = time.time()
+    _thread = threading.Thread(target=_run, daemon=True, name="bootstrap")
+    _thread.start()
+
+
+def status() -> dict:
+    """初始化进度（健康检查使用）"""
+    return {**_status, "tasks": dict(_status["tasks"]), "failed_tasks": list(_status["failed_tasks"])}
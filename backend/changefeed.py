@@ -0,0 +1,289 @@
+"""
+表变更通知监听
+init_db.py 中的触发器在 post_data / competitor / search / popular / api_config 变更时向
+table_change 频道发送 NOTIFY；这里用一条独立连接 LISTEN，把短时间内的通知合并成批次
+（批量抓取时一次会写入上百行），再分发给进程内的订阅函数（各模块缓存）和 SSE 订阅者。
+每个 worker 进程各自监听，因此任一 worker 的写入都会让所有 worker 的缓存失效。
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import APIRouter
+
+import bootstrap
+import sse
+from database import get_db_connection
+
+router = APIRouter(prefix="/api/changes", tags=["changes"])
+logger = logging.getLogger(__name__)
+
+CHANNEL = "table_change"
+
+# 通知合并窗口：最后一条通知后静默这么久才分发（毫秒）
+BATCH_WINDOW = float(os.getenv("CHANGEFEED_BATCH_MS", "200")) / 1000
+# 持续写入时最长延迟（毫秒），保证批量抓取期间也能定期分发
+MAX_BATCH_DELAY = float(os.getenv("CHANGEFEED_MAX_DELAY_MS", "2000")) / 1000
+# 连接断开后重连间隔（秒）
+RECONNECT_SECONDS = 5
+# 每个 SSE 订阅者最多积压的批次；超出时丢弃积压，改为推送各表的 resync 事件（客户端应全量刷新）
+SSE_QUEUE_SIZE = 100
+# SSE 事件中最多列出的 id 数
+SSE_MAX_IDS = 200
+
+
+class TableChanges:
+    """一个批次内某张表的变更汇总"""
+
+    def __init__(self, table: str, resync: bool = False):
+        self.table = table
+        self.resync = resync  # 监听中断期间可能漏掉通知，订阅者应整体失效
+        self.ids: Set[int] = set()
+        self.deleted: Set[int] = set()
+        self.values: Dict[str, Set[str]] = defaultdict(set)  # 触发器附带的列，如 popular.user_id
+        self.count = 0
+
+    def add(self, payload: dict):
+        self.count += 1
+        row_id = payload.get('id')
+        if row_id is not None:
+            self.ids.add(row_id)
+            if payload.get('op') == 'DELETE':
+                self.deleted.add(row_id)
+        for key, value in payload.items():
+            if key not in ('table', 'op', 'id') and value is not None:
+                self.values[key].add(value)
+
+    def to_dict(self) -> dict:
+        data = {
+            "table": self.table,
+            "count": self.count,
+            "resync": self.resync,
+            "ids": sorted(self.ids)[:SSE_MAX_IDS],
+            "deleted": sorted(self.deleted)[:SSE_MAX_IDS],
+            "truncated": len(self.ids) > SSE_MAX_IDS,
+        }
+        for key, values in self.values.items():
+            data[key] = sorted(values)
+        return data
+
+
+class ChangeListener:
+    """LISTEN 连接 + 批次合并 + 分发"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[TableChanges], None]]] = defaultdict(list)
+        self._streams: List[queue.Queue] = []
+        self._streams_lock = threading.Lock()
+        self._tables: Set[str] = set()  # 订阅或出现过通知的表（溢出时逐表推送 resync）
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+        self.notifications = 0
+        self.batches = 0
+        self.reconnects = 0
+        self.stream_overflows = 0
+        self.last_batch_at = 0.0
+
+    # ---------- 订阅 ----------
+
+    def subscribe(self, table: str, callback: Callable[[TableChanges], None]):
+        """注册进程内订阅函数（在监听线程中调用，应快速返回）"""
+        self._subscribers[table].append(callback)
+
+    def open_stream(self) -> queue.Queue:
+        q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+        with self._streams_lock:
+            self._streams.append(q)
+        return q
+
+    def close_stream(self, q: queue.Queue):
+        with self._streams_lock:
+            if q in self._streams:
+                self._streams.remove(q)
+
+    # ---------- 分发 ----------
+
+    def _dispatch(self, batch: Dict[str, TableChanges]):
+        self.batches += 1
+        self.last_batch_at = time.time()
+        for table, changes in batch.items():
+            for callback in self._subscribers.get(table, []):
+                try:
+                    callback(changes)
+                except Exception as e:
+                    logger.exception("变更通知处理失败 (%s): %s", table, e)
+
+        self._tables.update(batch)
+        events = [changes.to_dict() for changes in batch.values()]
+        with self._streams_lock:
+            streams = list(self._streams)
+        for q in streams:
+            for event in events:
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    self._overflow(q)
+                    break
+
+    def _overflow(self, q: queue.Queue):
+        """订阅者跟不上：丢弃积压的批次，改为推送各表的 resync 事件"""
+        self.stream_overflows += 1
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        for table in sorted(self._tables | set(self._subscribers)):
+            try:
+                q.put_nowait(TableChanges(table, resync=True).to_dict())
+            except queue.Full:
+                break
+
+    def _resync(self):
+        """重连并 LISTEN 后通知所有订阅者整体失效（断线期间的通知已丢失）"""
+        self._dispatch({table: TableChanges(table, resync=True) for table in self._subscribers})
+
+    # ---------- 监听 ----------
+
+    def _listen(self, conn, resync: bool = False):
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {CHANNEL}")
+        self.connected = True
+        if resync:
+            # 先 LISTEN 再通知失效：之后提交的写入都会收到通知，不会落在两者之间的空窗里
+            self._resync()
+
+        pending: Dict[str, TableChanges] = {}
+        first_at = last_at = 0.0
+        while True:
+            now = time.monotonic()
+            if pending:
+                timeout = max(0.0, min(last_at + BATCH_WINDOW, first_at + MAX_BATCH_DELAY) - now)
+            else:
+                timeout = 30.0
+
+            if select.select([conn], [], [], timeout) != ([], [], []):
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    self.notifications += 1
+                    try:
+                        payload = json.loads(notify.payload)
+                    except ValueError:
+                        continue
+                    table = payload.get('table')
+                    if table not in pending:
+                        pending[table] = TableChanges(table)
+                    pending[table].add(payload)
+                    last_at = time.monotonic()
+                    if not first_at:
+                        first_at = last_at
+            elif not pending:
+                # 空闲时探测连接是否仍然可用
+                cursor.execute("SELECT 1")
+
+            now = time.monotonic()
+            if pending and (now >= last_at + BATCH_WINDOW or now >= first_at + MAX_BATCH_DELAY):
+                batch, pending = pending, {}
+                first_at = last_at = 0.0
+                self._dispatch(batch)
+
+    def _run(self):
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = get_db_connection()
+                resync = not first
+                if resync:
+                    self.reconnects += 1
+                first = False
+                self._listen(conn, resync=resync)
+            except Exception as e:
+                logger.warning("变更通知监听中断，%s 秒后重连: %s", RECONNECT_SECONDS, e)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        """启动监听线程（应用启动时调用一次）"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="changefeed")
+        self._thread.start()
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "notifications": self.notifications,
+            "batches": self.batches,
+            "reconnects": self.reconnects,
+            "stream_overflows": self.stream_overflows,
+            "last_batch_at": self.last_batch_at,
+            "subscribers": {table: len(callbacks) for table, callbacks in self._subscribers.items()},
+            "streams": len(self._streams),
+        }
+
+
+listener = ChangeListener()
+subscribe = listener.subscribe
+
+# 数据库可用后再开始监听（见 bootstrap.py）
+bootstrap.register("changefeed", listener.start)
+
+
+# ============================================
+# API Endpoints
+# ============================================
+
+@router.get("/stream")
+async def stream_changes(tables: Optional[str] = None):
+    """
+    SSE 推送表变更批次（前端据此刷新视图）
+
+    Args:
+        tables: 可选，逗号分隔的表名，只推送这些表
+    """
+    wanted = set(tables.split(",")) if tables else None
+
+    async def events():
+        q = listener.open_stream()
+        try:
+            yield sse.format_event("ready", listener.stats())
+            idle = 0.0
+            while True:
+                try:
+                    event = q.get_nowait()
+                except queue.Empty:
+                    await asyncio.sleep(0.2)
+                    idle += 0.2
+                    if idle >= 15:
+                        idle = 0.0
+                        yield sse.HEARTBEAT
+                    continue
+                idle = 0.0
+                if wanted is None or event["table"] in wanted:
+                    yield sse.format_event("change", event)
+        finally:
+            listener.close_stream(q)
+
+    return sse.stream(events())
+
+
+@router.get("/stats")
+def get_changefeed_stats():
+    """变更通知监听状态"""
+    return {"success": True, "data": listener.stats()}
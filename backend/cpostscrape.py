@@ -1,23 +1,26 @@
-import os
 import json
+import logging
 import base64
-import requests
+import httpclient
+import logconfig
+import monitoring
+import tracing
 from datetime import datetime
-from apify_client import ApifyClient
 from dotenv import load_dotenv
 from translate import translate_competitor, translate_post_by_id
 from database import get_db_connection
+from posttags import sync_post_tags
+from postmetrics import record_snapshot
+from viralscore import refresh_after_scrape
+from metricstore import store as metric_store
+import responsecache
 
 load_dotenv()
 
-# Apify客户端
-from apiconfig import get_api_key
+logger = logging.getLogger(__name__)
 
-def get_apify_client():
-    token = get_api_key("APIFY_API_TOKEN") or os.getenv("APIFY_API_TOKEN", "")
-    return ApifyClient(token)
-
-client = get_apify_client()
+# Apify客户端（APIFY_API_TOKEN 更新后自动重建，任一 worker 更新均生效）
+from apiconfig import get_apify_client
 
 def check_competitor_exists(username):
     """检查竞品是否已存在"""
@@ -29,22 +32,24 @@ def check_competitor_exists(username):
     conn.close()
     return result is not None
 
+@tracing.traced("download_image", attributes=("url",))
 def download_image_to_base64(url):
     """下载图片并转换为Base64"""
     try:
-        response = requests.get(url, timeout=10)
+        response = httpclient.get("cdn", url, timeout=10)
         if response.status_code == 200:
             return base64.b64encode(response.content).decode('utf-8')
     except Exception as e:
-        print(f"下载图片失败: {url}, 错误: {e}")
+        logger.warning("下载图片失败: %s, 错误: %s", url, e)
     return None
 
+@tracing.traced("download_video", attributes=("url",))
 def download_video_to_base64(url):
     """下载视频并转换为Base64（带超时和大小限制）"""
     try:
-        print(f"正在下载视频: {url[:80]}...")
+        logger.debug("正在下载视频: %s", url[:80], extra=logconfig.SAMPLED)
         # 设置较长的超时时间（视频文件较大）
-        response = requests.get(url, timeout=120, stream=True)
+        response = httpclient.get("cdn", url, timeout=120, stream=True)
         if response.status_code == 200:
             # 限制视频大小（例如最大100MB）
             max_size = 100 * 1024 * 1024  # 100MB
@@ -55,23 +60,26 @@ def download_video_to_base64(url):
                 video_data += chunk
                 downloaded_size += len(chunk)
                 
-                # 显示下载进度
-                if downloaded_size % (1024 * 1024) == 0:  # 每1MB显示一次
-                    print(f"  已下载: {downloaded_size / 1024 / 1024:.1f}MB")
+                # 下载进度（每1MB一条，DEBUG 级别并采样）
+                if downloaded_size % (1024 * 1024) == 0:
+                    logger.debug("已下载: %.1fMB", downloaded_size / 1024 / 1024, extra=logconfig.SAMPLED)
                 
                 if downloaded_size > max_size:
-                    print(f"  ⚠️ 视频过大(>{max_size/1024/1024}MB)，跳过: {url[:80]}")
+                    logger.warning("视频过大(>%dMB)，跳过: %s", max_size // 1024 // 1024, url[:80])
                     return None
             
-            print(f"  ✅ 视频下载完成: {downloaded_size / 1024 / 1024:.2f}MB")
+            tracing.annotate(bytes=downloaded_size)
+            logger.debug("视频下载完成: %.2fMB", downloaded_size / 1024 / 1024, extra=logconfig.SAMPLED)
             return base64.b64encode(video_data).decode('utf-8')
     except Exception as e:
-        print(f"  ❌ 下载视频失败: {url[:80]}, 错误: {e}")
+        logger.warning("下载视频失败: %s, 错误: %s", url[:80], e)
     return None
 
+@tracing.traced(attributes=("username",))
 def scrape_details(username):
     """抓取账号详情数据"""
-    print(f"正在抓取账号详情: {username}")
+    logger.info("正在抓取账号详情: %s", username)
+    client = get_apify_client()
     
     run_input = {
         "directUrls": [f"https://www.instagram.com/{username}/"],
@@ -83,16 +91,18 @@ def scrape_details(username):
     }
     
     try:
-        run = client.actor("RB9HEZitC8hIUXAha").call(run_input=run_input)
+        with monitoring.track_call("apify"):
+            run = client.actor("RB9HEZitC8hIUXAha").call(run_input=run_input)
         results = list(client.dataset(run["defaultDatasetId"]).iterate_items())
         
         if results:
             return results[0]
         return None
     except Exception as e:
-        print(f"抓取详情失败: {e}")
+        logger.error("抓取详情失败: %s", e)
         return None
 
+@tracing.traced()
 def save_competitor_to_db(data):
     """保存竞品数据到数据库"""
     conn = get_db_connection()
@@ -138,10 +148,13 @@ def save_competitor_to_db(data):
     conn.commit()
     cursor.close()
     conn.close()
+    metric_store.mark_sources()
+    responsecache.invalidate("competitors", "competitor_stats")
     
-    print(f"✅ 竞品数据已保存，ID: {competitor_id}")
+    logger.info("竞品数据已保存，ID: %s", competitor_id)
     return competitor_id
 
+@tracing.traced(attributes=("username", "posts_count", "stories_count"))
 def scrape_posts(username, posts_count=0, stories_count=0):
     """
     抓取帖子数据
@@ -154,13 +167,14 @@ def scrape_posts(username, posts_count=0, stories_count=0):
     Returns:
         list: 帖子数据列表
     """
-    print(f"正在抓取帖子: {username}, 图文数量: {posts_count}, 视频数量: {stories_count}")
+    logger.info("正在抓取帖子: %s, 图文数量: %s, 视频数量: %s", username, posts_count, stories_count)
+    client = get_apify_client()
     
     all_posts = []
     
     # 抓取图文帖子
     if posts_count > 0:
-        print(f"📝 抓取 {posts_count} 条图文帖子...")
+        logger.info("抓取 %s 条图文帖子", posts_count)
         posts_input = {
             "directUrls": [f"https://www.instagram.com/{username}/"],
             "resultsType": "posts",
@@ -171,16 +185,17 @@ def scrape_posts(username, posts_count=0, stories_count=0):
         }
         
         try:
-            run = client.actor("RB9HEZitC8hIUXAha").call(run_input=posts_input)
+            with monitoring.track_call("apify"):
+                run = client.actor("RB9HEZitC8hIUXAha").call(run_input=posts_input)
             posts = list(client.dataset(run["defaultDatasetId"]).iterate_items())
             all_posts.extend(posts)
-            print(f"✅ 获取到 {len(posts)} 条图文帖子")
+            logger.info("获取到 %s 条图文帖子", len(posts))
         except Exception as e:
-            print(f"❌ 抓取图文帖子失败: {e}")
+            logger.error("抓取图文帖子失败: %s", e)
     
     # 抓取视频帖子
     if stories_count > 0:
-        print(f"🎥 抓取 {stories_count} 条视频帖子...")
+        logger.info("抓取 %s 条视频帖子", stories_count)
         stories_input = {
             "directUrls": [f"https://www.instagram.com/{username}/"],
             "resultsType": "stories",
@@ -191,15 +206,17 @@ def scrape_posts(username, posts_count=0, stories_count=0):
         }
         
         try:
-            run = client.actor("RB9HEZitC8hIUXAha").call(run_input=stories_input)
+            with monitoring.track_call("apify"):
+                run = client.actor("RB9HEZitC8hIUXAha").call(run_input=stories_input)
             stories = list(client.dataset(run["defaultDatasetId"]).iterate_items())
             all_posts.extend(stories)
-            print(f"✅ 获取到 {len(stories)} 条视频帖子")
+            logger.info("获取到 %s 条视频帖子", len(stories))
         except Exception as e:
-            print(f"❌ 抓取视频帖子失败: {e}")
+            logger.error("抓取视频帖子失败: %s", e)
     
     return all_posts
 
+@tracing.traced(attributes=("username",))
 def save_posts_to_db(posts, username):
     """保存帖子数据到数据库"""
     conn = get_db_connection()
@@ -209,13 +226,13 @@ def save_posts_to_db(posts, username):
     cursor.execute('SELECT id FROM competitor WHERE username = %s', (username,))
     competitor_result = cursor.fetchone()
     if not competitor_result:
-        print(f"❌ 未找到竞品: {username}")
+        logger.error("未找到竞品: %s", username)
         cursor.close()
         conn.close()
         return 0
     
     competitor_id = competitor_result['id']
-    print(f"✅ 找到竞品ID: {competitor_id}")
+    logger.debug("找到竞品ID: %s", competitor_id)
     
     saved_count = 0
     inserted_ids = []
@@ -242,11 +259,13 @@ def save_posts_to_db(posts, username):
                 child_posts = post.get('childPosts', [])
                 has_video = False
                 
-                print(f"  处理 Sidecar 帖子，包含 {len(child_posts)} 个子帖子")
+                logger.debug("处理 Sidecar 帖子，包含 %s 个子帖子", len(child_posts),
+                             extra={"post_id": post.get('id'), **logconfig.SAMPLED})
                 
                 for idx, child in enumerate(child_posts):
                     child_type = child.get('type')
-                    print(f"    子帖子 {idx + 1}/{len(child_posts)}: 类型 = {child_type}")
+                    logger.debug("子帖子 %s/%s: 类型 = %s", idx + 1, len(child_posts), child_type,
+                                 extra={"post_id": post.get('id'), **logconfig.SAMPLED})
                     
                     if child_type == "Video":
                         has_video = True
@@ -290,7 +309,8 @@ def save_posts_to_db(posts, username):
                 # 如果包含视频，修改post_type为 Sidecar_video
                 if has_video:
                     post_type = "Sidecar_video"
-                    print(f"  ✅ 检测到混合类型，post_type 更改为: Sidecar_video")
+                    logger.debug("检测到混合类型，post_type 更改为: Sidecar_video",
+                                 extra={"post_id": post.get('id'), **logconfig.SAMPLED})
             
             # 处理纯 Video 类型（单视频）
             elif post_type == "Video":
@@ -420,27 +440,42 @@ def save_posts_to_db(posts, username):
             
             row = cursor.fetchone()
             if row:
+                # 同步话题标签 / 提及索引
+                sync_post_tags(cursor, row['id'], post.get('hashtags', []), post.get('mentions', []),
+                               post.get('timestamp'), post.get('caption'))
+                record_snapshot(cursor, row['id'], post.get('likesCount', 0), post.get('commentsCount', 0),
+                                video_view_count, video_play_count)
                 saved_count += 1
                 inserted_ids.append(row['id'])
                 
         except Exception as e:
-            print(f"保存帖子失败 {post.get('id')}: {e}")
+            logger.error("保存帖子失败: %s", e, extra={"post_id": post.get('id')})
             continue
     
     conn.commit()
     cursor.close()
     conn.close()
     
+    # 通知内存指标缓存
+    metric_store.mark_posts(inserted_ids)
+    responsecache.invalidate("competitor_stats")
+    
+    # 重新计算该账号的爆款评分
+    if saved_count:
+        refresh_after_scrape([username])
+    
     # 入库后强制翻译所有 _zh 字段
     for db_id in inserted_ids:
         try:
             translate_post_by_id(db_id)
         except Exception as e:
-            print(f"翻译帖子失败 id={db_id}: {e}")
+            logger.error("翻译帖子失败: %s", e, extra={"post_db_id": db_id})
     
-    print(f"✅ 成功保存 {saved_count} 条帖子到数据库")
+    tracing.annotate(posts=len(posts), saved=saved_count)
+    logger.info("成功保存 %s 条帖子到数据库", saved_count)
     return saved_count
 
+@tracing.traced("competitor_scrape", root=True, attributes=("username", "posts_count", "stories_count"))
 def scrape_competitor_data(username, posts_count=0, stories_count=0):
     """
     主函数：抓取竞品数据
@@ -453,31 +488,26 @@ def scrape_competitor_data(username, posts_count=0, stories_count=0):
     Returns:
         dict: 抓取结果
     """
-    print(f"\n{'='*60}")
-    print(f"开始抓取竞品数据")
-    print(f"用户名: {username}")
-    print(f"图文数量: {posts_count}")
-    print(f"视频数量: {stories_count}")
-    print(f"{'='*60}\n")
+    logger.info("开始抓取竞品数据: %s（图文: %s, 视频: %s）", username, posts_count, stories_count)
     
     # 检查竞品是否存在
     exists = check_competitor_exists(username)
     
     if not exists:
-        print("竞品不存在，开始抓取详情...")
+        logger.info("竞品不存在，开始抓取详情")
         # 抓取详情
         details = scrape_details(username)
         if details:
             # 保存到数据库
             competitor_id = save_competitor_to_db(details)
             # 触发翻译
-            print("触发翻译竞品信息...")
+            logger.info("触发翻译竞品信息")
             translate_competitor(competitor_id)
         else:
-            print("❌ 抓取详情失败")
+            logger.error("抓取详情失败: %s", username)
             return {"success": False, "message": "抓取账号详情失败"}
     else:
-        print("竞品已存在，跳过详情抓取")
+        logger.info("竞品已存在，跳过详情抓取")
     
     # 抓取帖子
     posts = scrape_posts(username, posts_count, stories_count)
@@ -496,6 +526,7 @@ def scrape_competitor_data(username, posts_count=0, stories_count=0):
 
 if __name__ == "__main__":
     # 测试：抓取 2 条图文 + 1 条视频
+    logconfig.setup()
     result = scrape_competitor_data("camblyk", posts_count=2, stories_count=1)
     print(f"\n最终结果: {result}")
 
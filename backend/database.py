@@ -3,16 +3,71 @@
 支持本地开发环境和 Railway 生产环境
 """
 import os
+import time
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 from typing import Optional
 import logging
+import monitoring
+import tracing
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志输出由 logconfig.setup() 统一配置；每次连接的日志为 DEBUG 级别
 logger = logging.getLogger(__name__)
 
 
+class _TimedCursorMixin:
+    """记录每条语句的耗时和失败次数（/metrics），在作业追踪中记录为 span（tracing.py）"""
+
+    def execute(self, query, vars=None):
+        statement = monitoring.statement_type(query)
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"db.{statement.lower()}"):
+                return super().execute(query, vars)
+        except Exception:
+            monitoring.DB_QUERY_ERRORS.inc(statement=statement)
+            raise
+        finally:
+            monitoring.DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement=statement)
+
+    def executemany(self, query, vars_list):
+        statement = monitoring.statement_type(query)
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"db.{statement.lower()}", many=True):
+                return super().executemany(query, vars_list)
+        except Exception:
+            monitoring.DB_QUERY_ERRORS.inc(statement=statement)
+            raise
+        finally:
+            monitoring.DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement=statement)
+
+
+_timed_cursors = {}
+
+
+def _timed_cursor(cursor_factory):
+    """带耗时统计的游标类（按原游标工厂缓存）"""
+    cursor_factory = cursor_factory or psycopg2.extensions.cursor
+    if issubclass(cursor_factory, _TimedCursorMixin):
+        return cursor_factory
+    timed = _timed_cursors.get(cursor_factory)
+    if timed is None:
+        timed = type(f"Timed{cursor_factory.__name__}", (_TimedCursorMixin, cursor_factory), {})
+        _timed_cursors[cursor_factory] = timed
+    return timed
+
+
+class _TimedConnection(psycopg2.extensions.connection):
+    """调用方显式传入 cursor_factory 时同样换成带耗时统计的游标"""
+
+    def cursor(self, *args, **kwargs):
+        if kwargs.get("cursor_factory") is not None:
+            kwargs["cursor_factory"] = _timed_cursor(kwargs["cursor_factory"])
+        return super().cursor(*args, **kwargs)
+
+
 def get_db_connection(cursor_factory=RealDictCursor):
     """
     获取数据库连接
@@ -31,13 +86,16 @@ def get_db_connection(cursor_factory=RealDictCursor):
         如果没有 DATABASE_URL，使用本地 PostgreSQL 配置
     """
     database_url = os.getenv('DATABASE_URL')
+    cursor_factory = _timed_cursor(cursor_factory)
+    start = time.perf_counter()
     
     try:
         if database_url:
             # Railway 生产环境
-            logger.info("Using Railway database connection")
+            logger.debug("Using Railway database connection")
             conn = psycopg2.connect(
                 database_url,
+                connection_factory=_TimedConnection,
                 cursor_factory=cursor_factory
             )
         else:
@@ -48,21 +106,24 @@ def get_db_connection(cursor_factory=RealDictCursor):
             db_user = os.getenv('DB_USER', 'postgres')
             db_password = os.getenv('DB_PASSWORD', '1234qwer')
             
-            logger.info(f"Using local database: {db_user}@{db_host}:{db_port}/{db_name}")
+            logger.debug("Using local database: %s@%s:%s/%s", db_user, db_host, db_port, db_name)
             conn = psycopg2.connect(
                 host=db_host,
                 port=db_port,
                 database=db_name,
                 user=db_user,
                 password=db_password,
+                connection_factory=_TimedConnection,
                 cursor_factory=cursor_factory
             )
         
-        logger.info("Database connected successfully")
+        monitoring.DB_CONNECT_SECONDS.observe(time.perf_counter() - start)
+        logger.debug("Database connected successfully")
         return conn
         
     except psycopg2.Error as e:
-        logger.error(f"Database connection failed: {str(e)}")
+        monitoring.DB_CONNECT_ERRORS.inc()
+        logger.error("Database connection failed: %s", e)
         raise
 
 
@@ -80,7 +141,7 @@ def test_connection() -> bool:
         result = cursor.fetchone()
         cursor.close()
         conn.close()
-        logger.info("Database connection test successful")
+        logger.debug("Database connection test successful")
         return True
     except Exception as e:
         logger.error(f"Database connection test failed: {str(e)}")
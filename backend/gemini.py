@@ -0,0 +1,212 @@
+"""
+Google Gemini 客户端统一管理模块
+按 API Key 复用长期存活的客户端；大体积媒体通过 Files API 上传，
+并按内容哈希缓存已上传的文件句柄，重复分析同一帖子时无需再次上传
+"""
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional
+
+import monitoring
+from ttlcache import TTLCache
+
+# google-genai 导入较慢，延迟到第一次调用 Gemini 时再加载（缩短应用启动时间）
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# 超过该大小（解码后字节数）的媒体走 Files API 上传，否则内联发送
+INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Files API 上传的文件保留 48 小时，本地句柄提前 1 小时过期
+UPLOADED_FILE_TTL = 47 * 3600
+
+# 等待视频文件处理完成（PROCESSING -> ACTIVE）的最长时间（秒）
+FILE_ACTIVE_TIMEOUT = 300
+
+# 每个 API Key 同时进行的 generate_content 调用上限（批量分析时避免触发 429）
+MAX_CONCURRENCY_PER_KEY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+_key_semaphores = {}
+
+# (api_key, 媒体哈希) -> 已上传文件句柄
+_uploaded_files = TTLCache(maxsize=512, ttl=UPLOADED_FILE_TTL)
+_upload_locks = {}
+_upload_locks_lock = threading.Lock()
+
+
+def get_client(api_key: str) -> "genai.Client":
+    """
+    获取 API Key 对应的 Gemini 客户端（同一个 Key 复用同一个实例）
+
+    Args:
+        api_key: Google AI API Key
+
+    Returns:
+        genai.Client: 客户端实例
+    """
+    client = _clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            from google import genai
+            client = genai.Client(api_key=api_key)
+            _clients[api_key] = client
+        return client
+
+
+@contextmanager
+def concurrency_slot(api_key: str):
+    """
+    占用该 API Key 的一个并发名额，名额用尽时阻塞等待
+
+    等待和调用期间计入 /metrics 的 gemini 队列深度，占用名额期间的耗时计为 gemini 调用延迟
+
+    用法:
+        with gemini.concurrency_slot(api_key):
+            client.models.generate_content(...)
+    """
+    with _clients_lock:
+        semaphore = _key_semaphores.get(api_key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(MAX_CONCURRENCY_PER_KEY)
+            _key_semaphores[api_key] = semaphore
+
+    with monitoring.queued("gemini"):
+        semaphore.acquire()
+        try:
+            with monitoring.track_call("gemini"):
+                yield
+        finally:
+            semaphore.release()
+
+
+def media_hash(data_base64: str) -> str:
+    """计算 Base64 媒体内容的哈希（直接对 Base64 文本计算，无需解码）"""
+    return hashlib.sha256(data_base64.encode("utf-8")).hexdigest()
+
+
+def estimate_decoded_size(data_base64: str) -> int:
+    """估算 Base64 解码后的字节数"""
+    return len(data_base64) * 3 // 4
+
+
+def _state_name(file) -> str:
+    state = getattr(file, "state", None)
+    return str(getattr(state, "name", state) or "")
+
+
+@contextmanager
+def _upload_lock(key):
+    """
+    同一媒体的上传互斥锁，上传结束后移除（文件句柄已写入缓存，之后的调用直接命中缓存）
+    """
+    with _upload_locks_lock:
+        lock = _upload_locks.get(key)
+        if lock is None:
+            lock = _upload_locks[key] = threading.Lock()
+    try:
+        with lock:
+            yield
+    finally:
+        with _upload_locks_lock:
+            if _upload_locks.get(key) is lock:
+                del _upload_locks[key]
+
+
+def _wait_until_active(client, file):
+    """等待上传的文件处理完成"""
+    deadline = time.monotonic() + FILE_ACTIVE_TIMEOUT
+    while _state_name(file) == "PROCESSING":
+        if time.monotonic() > deadline:
+            raise Exception(f"文件处理超时: {file.name}")
+        time.sleep(2)
+        file = client.files.get(name=file.name)
+
+    if _state_name(file) == "FAILED":
+        raise Exception(f"文件处理失败: {file.name}")
+    return file
+
+
+def upload_media(api_key: str, data_base64: str, mime_type: str, digest: Optional[str] = None):
+    """
+    通过 Files API 上传媒体（按内容哈希缓存，有效期内不会重复上传）
+
+    Args:
+        api_key: Google AI API Key
+        data_base64: Base64 编码的媒体内容
+        mime_type: 媒体类型
+        digest: 媒体哈希，为空时自动计算
+
+    Returns:
+        types.File: 已上传的文件句柄
+    """
+    digest = digest or media_hash(data_base64)
+    cache_key = (api_key, digest)
+
+    cached = _uploaded_files.get(cache_key)
+    if cached is not None:
+        logger.info(f"Reusing uploaded Gemini file {cached.name} for media {digest[:12]}")
+        return cached
+
+    # 同一媒体并发分析时只上传一次
+    with _upload_lock(cache_key):
+        cached = _uploaded_files.get(cache_key)
+        if cached is not None:
+            return cached
+
+        from google.genai import types
+        client = get_client(api_key)
+        data = base64.b64decode(data_base64)
+        start = time.perf_counter()
+        file = client.files.upload(
+            file=io.BytesIO(data),
+            config=types.UploadFileConfig(mime_type=mime_type),
+        )
+        file = _wait_until_active(client, file)
+        logger.info(
+            f"Uploaded {len(data) / 1024 / 1024:.2f} MB to Gemini Files API as {file.name} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+        _uploaded_files.set(cache_key, file)
+        return file
+
+
+def media_part_from_base64(api_key: str, data_base64: str, mime_type: str) -> "types.Part":
+    """
+    根据 Base64 媒体构建请求内容：小文件内联发送，大文件走 Files API
+
+    Args:
+        api_key: Google AI API Key
+        data_base64: Base64 编码的媒体内容
+        mime_type: 媒体类型
+
+    Returns:
+        types.Part: 可直接放入 contents 的媒体部分
+    """
+    from google.genai import types
+    if estimate_decoded_size(data_base64) <= INLINE_MAX_BYTES:
+        return types.Part.from_bytes(data=base64.b64decode(data_base64), mime_type=mime_type)
+
+    file = upload_media(api_key, data_base64, mime_type)
+    return types.Part.from_uri(file_uri=file.uri, mime_type=file.mime_type or mime_type)
+
+
+def get_upload_cache_stats() -> dict:
+    """已上传文件缓存的命中统计"""
+    return _uploaded_files.stats()
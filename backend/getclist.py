@@ -1,67 +1,81 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 import json
 from database import get_db_connection
+import pagination
+import metricstore
+import responsecache
 
 router = APIRouter()
 
+def load_competitors():
+    """查询所有竞品列表（缓存未命中时调用）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT id, input_url, instagram_id, username, url, 
+               full_name, full_name_zh, biography, biography_zh,
+               profile_pic_url, profile_pic_base64,
+               external_urls, external_url, external_url_shimmed,
+               followers_count, follows_count, posts_count,
+               has_channel, highlight_reel_count,
+               created_at, updated_at
+        FROM competitor
+        ORDER BY created_at DESC
+    ''')
+    
+    competitors = cursor.fetchall()
+    
+    # 转换为字典列表
+    result = []
+    for comp in competitors:
+        comp_dict = dict(comp)
+        # 解析 external_urls JSON
+        if comp_dict.get('external_urls'):
+            if isinstance(comp_dict['external_urls'], str):
+                comp_dict['external_urls'] = json.loads(comp_dict['external_urls'])
+        result.append(comp_dict)
+    
+    cursor.close()
+    conn.close()
+    
+    return {
+        "success": True,
+        "data": result,
+        "total": len(result)
+    }
+
 @router.get("/competitors")
-def get_competitors():
-    """获取所有竞品列表"""
+def get_competitors(request: Request):
+    """获取所有竞品列表（响应缓存，竞品变更时失效）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, input_url, instagram_id, username, url, 
-                   full_name, full_name_zh, biography, biography_zh,
-                   profile_pic_url, profile_pic_base64,
-                   external_urls, external_url, external_url_shimmed,
-                   followers_count, follows_count, posts_count,
-                   has_channel, highlight_reel_count,
-                   created_at, updated_at
-            FROM competitor
-            ORDER BY created_at DESC
-        ''')
-        
-        competitors = cursor.fetchall()
-        
-        # 转换为字典列表
-        result = []
-        for comp in competitors:
-            comp_dict = dict(comp)
-            # 解析 external_urls JSON
-            if comp_dict.get('external_urls'):
-                if isinstance(comp_dict['external_urls'], str):
-                    comp_dict['external_urls'] = json.loads(comp_dict['external_urls'])
-            result.append(comp_dict)
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "success": True,
-            "data": result,
-            "total": len(result)
-        }
+        return responsecache.cached_json(request, "competitors", None, load_competitors)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取竞品列表失败: {str(e)}")
 
 @router.get("/competitors/{username}/posts")
-def get_competitor_posts(username: str, post_type: str = None, page: int = 1, page_size: int = 5):
+def get_competitor_posts(username: str, post_type: str = None, page: int = 1, page_size: int = 5, cursor: str = None):
     """获取指定竞品的帖子（支持分页）
     
     Args:
         username: 竞品用户名
         post_type: 可选，按类型筛选 (Image, Video, Sidecar, Sidecar_video)
-        page: 页码，从1开始
+        page: 页码，从1开始（未传 cursor 时使用 OFFSET 分页，兼容旧版前端）
         page_size: 每页数量，默认5条
+        cursor: 可选，上一页返回的 next_cursor，传入后按游标读取下一页
     """
+    if cursor:
+        try:
+            pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
+        db_cursor = conn.cursor()
         
-        # 先查询总数
+        # 总数按查询条件缓存，不再每页执行 COUNT(*)
         count_query = "SELECT COUNT(*) as total FROM post_data WHERE owner_username = %s"
         count_params = [username]
         
@@ -69,16 +83,12 @@ def get_competitor_posts(username: str, post_type: str = None, page: int = 1, pa
             count_query += " AND post_type = %s"
             count_params.append(post_type)
         
-        cursor.execute(count_query, count_params)
-        total_count = cursor.fetchone()['total']
+        total_count = pagination.cached_count(db_cursor, ("competitor", username, post_type), count_query, count_params)
         
         # 计算总页数
         import math
         total_pages = math.ceil(total_count / page_size) if total_count > 0 else 1
         
-        # 计算偏移量
-        offset = (page - 1) * page_size
-        
         # 构建查询条件
         query = '''
             SELECT id, post_id, post_type, short_code, url, input_url,
@@ -107,12 +117,18 @@ def get_competitor_posts(username: str, post_type: str = None, page: int = 1, pa
             query += " AND post_type = %s"
             params.append(post_type)
         
-        query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-        params.extend([page_size, offset])
-        
-        cursor.execute(query, params)
-        
-        posts = cursor.fetchall()
+        if cursor or page <= 1:
+            # 游标分页：沿 (owner_username, post_type, timestamp, id) 复合索引继续读取
+            posts, next_cursor = pagination.fetch_page(db_cursor, query, params, page_size, cursor)
+        else:
+            # 旧版按页码跳转
+            db_cursor.execute(query + pagination.ORDER_BY + " LIMIT %s OFFSET %s",
+                              params + [page_size + 1, (page - 1) * page_size])
+            posts = db_cursor.fetchall()
+            next_cursor = None
+            if len(posts) > page_size:
+                posts = posts[:page_size]
+                next_cursor = pagination.encode_cursor(posts[-1]['timestamp'], posts[-1]['id'])
         
         # 转换为字典列表并解析JSON字段
         result = []
@@ -135,7 +151,7 @@ def get_competitor_posts(username: str, post_type: str = None, page: int = 1, pa
             
             result.append(post_dict)
         
-        cursor.close()
+        db_cursor.close()
         conn.close()
         
         return {
@@ -145,42 +161,30 @@ def get_competitor_posts(username: str, post_type: str = None, page: int = 1, pa
                 "page": page,
                 "page_size": page_size,
                 "total": total_count,
-                "total_pages": total_pages
+                "total_pages": total_pages,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
             },
             "username": username
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取帖子列表失败: {str(e)}")
 
+def load_competitors_stats():
+    """竞品统计数据（由内存指标缓存聚合，不查询数据库）"""
+    return {
+        "success": True,
+        "data": metricstore.store.competitor_stats()
+    }
+
 @router.get("/competitors/stats")
-def get_competitors_stats():
-    """获取竞品统计数据"""
+def get_competitors_stats(request: Request):
+    """获取竞品统计数据（响应缓存，竞品或帖子变更时失效）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_competitors,
-                AVG(followers_count) as avg_followers,
-                AVG(posts_count) as avg_posts
-            FROM competitor
-        ''')
-        
-        stats = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "success": True,
-            "data": {
-                "total_competitors": stats['total_competitors'],
-                "avg_followers": round(stats['avg_followers'] or 0, 0),
-                "avg_posts": round(stats['avg_posts'] or 0, 0)
-            }
-        }
+        return responsecache.cached_json(request, "competitor_stats", None, load_competitors_stats)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取统计数据失败: {str(e)}")
@@ -211,6 +215,9 @@ def delete_post(post_id: str):
             raise HTTPException(status_code=404, detail="帖子不存在")
         
         conn.commit()
+        pagination.invalidate_counts()
+        metricstore.store.mark_posts([result['id']])
+        responsecache.invalidate("competitor_stats", "keyword_stats")
         cursor.close()
         conn.close()
         
@@ -255,6 +262,9 @@ def delete_competitor(competitor_id: int):
         ''', (competitor_id,))
         
         conn.commit()
+        pagination.invalidate_counts()
+        metricstore.store.drop_source(competitor_id=competitor_id)
+        responsecache.invalidate("competitors", "competitor_stats")
         cursor.close()
         conn.close()
         
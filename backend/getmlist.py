@@ -2,11 +2,12 @@
 Get Popular Scripts List Module
 Fetches user's analyzed scripts from popular table
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from typing import List, Optional
 from psycopg2.extras import RealDictCursor
 from pydantic import BaseModel
 from database import get_db_connection
+import responsecache
 
 router = APIRouter(prefix="/api/popular-scripts", tags=["popular-scripts"])
 
@@ -82,10 +83,9 @@ def extract_success_factors(jianyi1: str) -> List[str]:
     
     return factors[:3] if factors else ["AI分析"]
 
-@router.get("/", response_model=List[PopularScript])
-async def get_user_popular_scripts(user_id: int):
+def load_user_popular_scripts(user_id: int) -> List[PopularScript]:
     """
-    Get all popular scripts for a specific user
+    Query all popular scripts for a specific user (called on response cache miss)
     
     Args:
         user_id: User ID
@@ -245,6 +245,23 @@ async def get_user_popular_scripts(user_id: int):
         conn.close()
 
 
+@router.get("/", response_model=List[PopularScript])
+async def get_user_popular_scripts(user_id: int, request: Request):
+    """
+    Get all popular scripts for a specific user
+    
+    Cached per user until the user's popular records change; supports ETag / If-None-Match
+    
+    Args:
+        user_id: User ID
+    
+    Returns:
+        List of popular scripts with analysis
+    """
+    return responsecache.cached_json(request, "popular_scripts", user_id,
+                                     lambda: load_user_popular_scripts(user_id))
+
+
 @router.put("/{script_id}/success")
 async def update_script_success(script_id: int, request: UpdateSuccessRequest):
     """
@@ -278,6 +295,7 @@ async def update_script_success(script_id: int, request: UpdateSuccessRequest):
             """, (request.success, script_id))
             
             conn.commit()
+            responsecache.invalidate("popular_scripts", key=request.user_id)
             
             return {"success": True, "message": "成功归因已更新"}
             
@@ -1,95 +1,93 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 import json
 from database import get_db_connection
+import pagination
+import metricstore
+import responsecache
 
 router = APIRouter()
 
+def load_search_keywords():
+    """查询所有搜索关键词（缓存未命中时调用）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT id, keyword, keyword_zh, search_count, total_posts,
+               created_at, updated_at
+        FROM search
+        ORDER BY created_at DESC
+    ''')
+    
+    keywords = cursor.fetchall()
+    
+    cursor.close()
+    conn.close()
+    
+    return {
+        "success": True,
+        "data": keywords,
+        "total": len(keywords)
+    }
+
 @router.get("/search/keywords")
-def get_search_keywords():
-    """获取所有搜索关键词列表"""
+def get_search_keywords(request: Request):
+    """获取所有搜索关键词列表（响应缓存，关键词变更时失效）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, keyword, keyword_zh, search_count, total_posts,
-                   created_at, updated_at
-            FROM search
-            ORDER BY created_at DESC
-        ''')
-        
-        keywords = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "success": True,
-            "data": keywords,
-            "total": len(keywords)
-        }
+        return responsecache.cached_json(request, "keywords", None, load_search_keywords)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取关键词列表失败: {str(e)}")
 
+def load_search_stats():
+    """搜索统计数据（由内存指标缓存聚合，不查询数据库）"""
+    return {
+        "success": True,
+        "data": metricstore.store.search_stats()
+    }
+
 @router.get("/search/keywords/stats")
-def get_search_stats():
-    """获取搜索统计数据"""
+def get_search_stats(request: Request):
+    """获取搜索统计数据（响应缓存，关键词或帖子变更时失效）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_keywords,
-                SUM(total_posts) as total_posts,
-                AVG(total_posts) as avg_posts_per_keyword
-            FROM search
-        ''')
-        
-        stats = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "success": True,
-            "data": {
-                "total_keywords": stats['total_keywords'] or 0,
-                "total_posts": stats['total_posts'] or 0,
-                "avg_posts_per_keyword": round(stats['avg_posts_per_keyword'] or 0, 0)
-            }
-        }
+        return responsecache.cached_json(request, "keyword_stats", None, load_search_stats)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取统计数据失败: {str(e)}")
 
 @router.get("/search/keywords/{keyword}/posts")
-def get_keyword_posts(keyword: str, post_type: str = None, page: int = 1, page_size: int = 5):
+def get_keyword_posts(keyword: str, post_type: str = None, page: int = 1, page_size: int = 5, cursor: str = None):
     """获取指定关键词的帖子（支持分页）
     
     Args:
         keyword: 搜索关键词
         post_type: 可选，按类型筛选 (Image, Video, Sidecar, Sidecar_video)
-        page: 页码，从1开始
+        page: 页码，从1开始（未传 cursor 时使用 OFFSET 分页，兼容旧版前端）
         page_size: 每页数量，默认5条
+        cursor: 可选，上一页返回的 next_cursor，传入后按游标读取下一页
     """
+    if cursor:
+        try:
+            pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
+        db_cursor = conn.cursor()
         
         # 先获取 search_id
-        cursor.execute('''
+        db_cursor.execute('''
             SELECT id FROM search WHERE keyword = %s
         ''', (keyword,))
         
-        search_result = cursor.fetchone()
+        search_result = db_cursor.fetchone()
         if not search_result:
             raise HTTPException(status_code=404, detail=f"未找到关键词: {keyword}")
         
         search_id = search_result['id']
         
-        # 先查询总数
+        # 总数按查询条件缓存，不再每页执行 COUNT(*)
         count_query = "SELECT COUNT(*) as total FROM post_data WHERE search_id = %s"
         count_params = [search_id]
         
@@ -97,16 +95,12 @@ def get_keyword_posts(keyword: str, post_type: str = None, page: int = 1, page_s
             count_query += " AND post_type = %s"
             count_params.append(post_type)
         
-        cursor.execute(count_query, count_params)
-        total_count = cursor.fetchone()['total']
+        total_count = pagination.cached_count(db_cursor, ("keyword", search_id, post_type), count_query, count_params)
         
         # 计算总页数
         import math
         total_pages = math.ceil(total_count / page_size) if total_count > 0 else 1
         
-        # 计算偏移量
-        offset = (page - 1) * page_size
-        
         # 构建查询条件
         query = '''
             SELECT id, post_id, post_type, short_code, url, input_url,
@@ -135,12 +129,18 @@ def get_keyword_posts(keyword: str, post_type: str = None, page: int = 1, page_s
             query += " AND post_type = %s"
             params.append(post_type)
         
-        query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-        params.extend([page_size, offset])
-        
-        cursor.execute(query, params)
-        
-        posts = cursor.fetchall()
+        if cursor or page <= 1:
+            # 游标分页：沿 (search_id, post_type, timestamp, id) 复合索引继续读取
+            posts, next_cursor = pagination.fetch_page(db_cursor, query, params, page_size, cursor)
+        else:
+            # 旧版按页码跳转
+            db_cursor.execute(query + pagination.ORDER_BY + " LIMIT %s OFFSET %s",
+                              params + [page_size + 1, (page - 1) * page_size])
+            posts = db_cursor.fetchall()
+            next_cursor = None
+            if len(posts) > page_size:
+                posts = posts[:page_size]
+                next_cursor = pagination.encode_cursor(posts[-1]['timestamp'], posts[-1]['id'])
         
         # 转换为字典列表并解析JSON字段
         result = []
@@ -163,7 +163,7 @@ def get_keyword_posts(keyword: str, post_type: str = None, page: int = 1, page_s
             
             result.append(post_dict)
         
-        cursor.close()
+        db_cursor.close()
         conn.close()
         
         return {
@@ -173,7 +173,9 @@ def get_keyword_posts(keyword: str, post_type: str = None, page: int = 1, page_s
                 "page": page,
                 "page_size": page_size,
                 "total": total_count,
-                "total_pages": total_pages
+                "total_pages": total_pages,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
             },
             "keyword": keyword
         }
@@ -209,6 +211,9 @@ def delete_post(post_id: str):
             raise HTTPException(status_code=404, detail="帖子不存在")
         
         conn.commit()
+        pagination.invalidate_counts()
+        metricstore.store.mark_posts([result['id']])
+        responsecache.invalidate("competitor_stats", "keyword_stats")
         cursor.close()
         conn.close()
         
@@ -253,6 +258,9 @@ def delete_keyword(keyword_id: int):
         ''', (keyword_id,))
         
         conn.commit()
+        pagination.invalidate_counts()
+        metricstore.store.drop_source(search_id=keyword_id)
+        responsecache.invalidate("keywords", "keyword_stats")
         cursor.close()
         conn.close()
         
@@ -0,0 +1,180 @@
+"""
+外部 HTTP 调用统一管理模块
+DeepSeek、AIsonnet、Sora2 以及 CDN 媒体下载共用按服务商划分的连接池，
+复用 TCP/TLS 连接（keep-alive），统一超时与重试策略，并记录每个服务商的延迟/状态码分布
+"""
+import threading
+import time
+import logging
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from fastapi import APIRouter
+
+import monitoring
+import tracing
+
+router = APIRouter(prefix="/api/http", tags=["http"])
+logger = logging.getLogger(__name__)
+
+# 服务商配置
+# timeout: (连接超时, 读取超时)，调用方显式传入 timeout 时以调用方为准
+# retries: 连接失败 / 429 / 5xx 的重试次数（POST 只在连接阶段失败时重试，避免重复计费）
+# pool_maxsize: 每个主机保持的最大空闲连接数
+PROVIDERS = {
+    "deepseek": {"timeout": (5, 60), "retries": 2, "pool_maxsize": 16},
+    "aisonnet": {"timeout": (5, 90), "retries": 2, "pool_maxsize": 8},
+    "sora2": {"timeout": (5, 30), "retries": 2, "pool_maxsize": 4},
+    "cdn": {"timeout": (5, 60), "retries": 2, "pool_maxsize": 32},
+}
+
+DEFAULT_PROVIDER = {"timeout": (5, 60), "retries": 1, "pool_maxsize": 8}
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _build_session(config: dict) -> requests.Session:
+    """为服务商创建带连接池和重试策略的 Session"""
+    retry = Retry(
+        total=config["retries"],
+        connect=config["retries"],
+        read=config["retries"],
+        status=config["retries"],
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=config["pool_maxsize"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(provider: str) -> requests.Session:
+    """获取服务商共享的 Session（首次调用时创建）"""
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = _build_session(PROVIDERS.get(provider, DEFAULT_PROVIDER))
+            _sessions[provider] = session
+        return session
+
+
+def _record(provider: str, elapsed: float, status: str):
+    """记录一次调用的延迟和状态（同时计入 /metrics）"""
+    monitoring.observe_outbound(provider, elapsed, status)
+    with _stats_lock:
+        stats = _stats.get(provider)
+        if stats is None:
+            stats = {
+                "count": 0,
+                "total_seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "status": {},
+            }
+            _stats[provider] = stats
+
+        stats["count"] += 1
+        stats["total_seconds"] += elapsed
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                stats["buckets"][idx] += 1
+                break
+        stats["status"][status] = stats["status"].get(status, 0) + 1
+
+
+def request(provider: str, method: str, url: str, **kwargs) -> requests.Response:
+    """
+    通过服务商共享连接池发送请求
+
+    Args:
+        provider: 服务商名称（deepseek / aisonnet / sora2 / cdn）
+        method: HTTP 方法
+        url: 请求地址
+        **kwargs: 透传给 requests 的参数（headers、json、data、params、stream、timeout 等）
+
+    Returns:
+        requests.Response: 响应对象（stream=True 时延迟只统计到响应头返回）
+    """
+    config = PROVIDERS.get(provider, DEFAULT_PROVIDER)
+    kwargs.setdefault("timeout", config["timeout"])
+
+    start = time.perf_counter()
+    try:
+        with tracing.span(f"http.{provider}", method=method, url=url[:200]) as span:
+            response = get_session(provider).request(method, url, **kwargs)
+            if span is not None:
+                span.set(status=response.status_code)
+    except requests.Timeout:
+        _record(provider, time.perf_counter() - start, "timeout")
+        raise
+    except requests.RequestException:
+        _record(provider, time.perf_counter() - start, "error")
+        raise
+
+    _record(provider, time.perf_counter() - start, str(response.status_code))
+    return response
+
+
+def get(provider: str, url: str, **kwargs) -> requests.Response:
+    """GET 请求"""
+    return request(provider, "GET", url, **kwargs)
+
+
+def post(provider: str, url: str, **kwargs) -> requests.Response:
+    """POST 请求"""
+    return request(provider, "POST", url, **kwargs)
+
+
+def get_stats(provider: Optional[str] = None) -> dict:
+    """
+    获取服务商调用统计
+
+    Returns:
+        dict: {provider: {count, avg_seconds, latency_histogram, status}}
+    """
+    with _stats_lock:
+        snapshot = {
+            name: {
+                "count": stats["count"],
+                "avg_seconds": round(stats["total_seconds"] / stats["count"], 4) if stats["count"] else 0,
+                "latency_histogram": {
+                    ("+Inf" if bound == float("inf") else str(bound)): stats["buckets"][idx]
+                    for idx, bound in enumerate(LATENCY_BUCKETS)
+                },
+                "status": dict(stats["status"]),
+            }
+            for name, stats in _stats.items()
+            if provider is None or name == provider
+        }
+    return snapshot
+
+
+@router.get("/stats")
+def get_http_stats(provider: Optional[str] = None):
+    """
+    获取外部服务调用的延迟/状态码分布
+    """
+    return {
+        "success": True,
+        "data": get_stats(provider)
+    }
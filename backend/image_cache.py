@@ -0,0 +1,202 @@
+"""
+生成图片与提示词翻译缓存
+相同提示词 + 比例 + 模型的生成结果直接复用（可通过 force_new 强制生成新图），
+中文提示词的英文翻译按原文哈希缓存，进程内 LRU 在前、数据库持久化在后
+图片缓存按最近使用时间淘汰：超过 IMAGE_CACHE_TTL_DAYS 天未命中的删除，
+总条目数超过 IMAGE_CACHE_MAX_ENTRIES 时删除最久未使用的（写入时最多每小时清理一次）
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from database import get_db_connection
+from ttlcache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 原文哈希 -> 英文翻译
+_translations = TTLCache(maxsize=2048, ttl=24 * 3600)
+
+# 生成图片缓存淘汰策略
+IMAGE_TTL_DAYS = int(os.getenv("IMAGE_CACHE_TTL_DAYS", "30"))
+IMAGE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "2000"))
+PURGE_INTERVAL_SECONDS = 3600
+
+_purge_lock = threading.Lock()
+_last_purge = {"at": 0.0, "deleted": 0}
+
+
+def prompt_hash(prompt: str) -> str:
+    """提示词哈希（忽略首尾空白）"""
+    return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()
+
+
+def get_cached_image(prompt: str, aspect_ratio: str, model: str) -> Optional[str]:
+    """
+    查询已生成的图片
+
+    Returns:
+        Optional[str]: Base64 图片，未命中返回 None
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE generated_image_cache
+            SET hit_count = hit_count + 1,
+                last_hit_at = CURRENT_TIMESTAMP
+            WHERE prompt_hash = %s AND aspect_ratio = %s AND model = %s
+            RETURNING image_base64
+        ''', (prompt_hash(prompt), aspect_ratio, model))
+        row = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Generated image cache lookup failed: {e}")
+        return None
+
+    return row['image_base64'] if row else None
+
+
+def save_image(prompt: str, aspect_ratio: str, model: str, image_base64: str):
+    """保存生成的图片（同一提示词重新生成时覆盖为最新的图片）"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO generated_image_cache (prompt_hash, aspect_ratio, model, prompt, image_base64)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (prompt_hash, aspect_ratio, model) DO UPDATE SET
+                image_base64 = EXCLUDED.image_base64,
+                hit_count = 0,
+                last_hit_at = NULL,
+                created_at = CURRENT_TIMESTAMP
+        ''', (prompt_hash(prompt), aspect_ratio, model, prompt.strip(), image_base64))
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Generated image cache write failed: {e}")
+        return
+
+    if time.time() - _last_purge["at"] >= PURGE_INTERVAL_SECONDS:
+        purge_images()
+
+
+def purge_images() -> int:
+    """
+    淘汰生成图片缓存：先删除超过 TTL 未使用的，再把条目数裁剪到上限（保留最近使用的）
+
+    Returns:
+        int: 删除的条目数
+    """
+    if not _purge_lock.acquire(blocking=False):
+        return 0
+    try:
+        _last_purge["at"] = time.time()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM generated_image_cache
+            WHERE COALESCE(last_hit_at, created_at) < CURRENT_TIMESTAMP - make_interval(days => %s)
+        ''', (IMAGE_TTL_DAYS,))
+        deleted = cursor.rowcount
+        cursor.execute('''
+            DELETE FROM generated_image_cache
+            WHERE id IN (
+                SELECT id FROM generated_image_cache
+                ORDER BY COALESCE(last_hit_at, created_at) DESC
+                OFFSET %s
+            )
+        ''', (IMAGE_MAX_ENTRIES,))
+        deleted += cursor.rowcount
+        conn.commit()
+        cursor.close()
+        conn.close()
+        _last_purge["deleted"] = deleted
+        if deleted:
+            logger.info("Generated image cache purged: %s entries", deleted)
+        return deleted
+    except Exception as e:
+        logger.warning(f"Generated image cache purge failed: {e}")
+        return 0
+    finally:
+        _purge_lock.release()
+
+
+def get_translation(prompt: str) -> Optional[str]:
+    """查询提示词的英文翻译"""
+    digest = prompt_hash(prompt)
+    translated = _translations.get(digest)
+    if translated is not None:
+        return translated
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT translated FROM prompt_translation_cache WHERE source_hash = %s
+        ''', (digest,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Translation cache lookup failed: {e}")
+        return None
+
+    if not row:
+        return None
+    _translations.set(digest, row['translated'])
+    return row['translated']
+
+
+def save_translation(prompt: str, translated: str):
+    """保存提示词的英文翻译"""
+    digest = prompt_hash(prompt)
+    _translations.set(digest, translated)
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO prompt_translation_cache (source_hash, source_text, translated)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (source_hash) DO UPDATE SET
+                translated = EXCLUDED.translated,
+                created_at = CURRENT_TIMESTAMP
+        ''', (digest, prompt.strip(), translated))
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Translation cache write failed: {e}")
+
+
+def get_stats() -> dict:
+    """缓存统计：图片缓存条目与命中次数、翻译缓存条目与进程内命中率"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*) AS entries, COALESCE(SUM(hit_count), 0) AS total_hits
+        FROM generated_image_cache
+    ''')
+    images = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*) AS entries FROM prompt_translation_cache")
+    translations = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    return {
+        "images": {
+            "entries": images['entries'],
+            "total_hits": int(images['total_hits']),
+            "max_entries": IMAGE_MAX_ENTRIES,
+            "ttl_days": IMAGE_TTL_DAYS,
+            "last_purge_at": _last_purge["at"] or None,
+            "last_purge_deleted": _last_purge["deleted"],
+        },
+        "translations": {"entries": translations['entries'], "process": _translations.stats()},
+    }
@@ -7,12 +7,19 @@ from pydantic import BaseModel
 from typing import Optional, List
 import json
 import base64
-import requests
+import httpclient
+import monitoring
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from psycopg2.extras import RealDictCursor
 from database import get_db_connection
+import sse
+import image_cache
+import mediaref
 
 load_dotenv()
 
@@ -29,6 +36,17 @@ def get_deepseek_key():
 
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 
+IMAGE_MODEL = "gemini-2.5-flash-image"
+
+# Max concurrent AIsonnet image generations per worker (shared by single and batch generation)
+IMAGE_GEN_MAX_CONCURRENCY = int(os.getenv("IMAGE_GEN_MAX_CONCURRENCY", "4"))
+_generation_slots = threading.BoundedSemaphore(IMAGE_GEN_MAX_CONCURRENCY)
+
+PROMPT_TRANSLATION_SYSTEM_PROMPT = """你是一个专业的翻译助手，专门翻译 AI 绘画提示词。
+请将用户提供的中文提示词翻译成英文，保持关键词格式。
+只返回翻译结果，不要添加任何解释、引号或额外内容。
+保持逗号分隔的格式。"""
+
 
 # ============================================
 # Request/Response Models
@@ -45,11 +63,22 @@ class UpdatePromptRequest(BaseModel):
     prompt_array: Optional[List[str]] = None
     jianyi2: Optional[str] = None
 
+class TranslatePromptRequest(BaseModel):
+    prompt: str
+
 class GenerateImageRequest(BaseModel):
     user_id: int
     post_id: str
     image_index: Optional[int] = None  # None for display_url, 0-N for images_base64
     aspect_ratio: Optional[str] = "1:1"  # Default aspect ratio
+    force_new: bool = False  # True to skip the cached image and generate a new variation
+
+class GenerateImagesBatchRequest(BaseModel):
+    user_id: int
+    post_id: str
+    indices: Optional[List[int]] = None  # None for every prompt in prompt_array
+    aspect_ratio: Optional[str] = "1:1"
+    force_new: bool = False
 
 
 # ============================================
@@ -61,6 +90,7 @@ class GenerateImageRequest(BaseModel):
 def translate_prompt_to_english(chinese_prompt: str) -> str:
     """
     Translate Chinese prompt to English using DeepSeek API
+    Translations are cached by prompt hash, so repeated prompts skip DeepSeek
     
     Args:
         chinese_prompt: Prompt in Chinese
@@ -72,22 +102,22 @@ def translate_prompt_to_english(chinese_prompt: str) -> str:
         if not chinese_prompt or not chinese_prompt.strip():
             return ""
         
+        cached = image_cache.get_translation(chinese_prompt)
+        if cached:
+            print(f"Translation cache hit: {cached[:100]}...")
+            return cached
+        
         headers = {
             "Authorization": f"Bearer {get_deepseek_key()}",
             "Content-Type": "application/json"
         }
         
-        system_prompt = """你是一个专业的翻译助手，专门翻译 AI 绘画提示词。
-请将用户提供的中文提示词翻译成英文，保持关键词格式。
-只返回翻译结果，不要添加任何解释、引号或额外内容。
-保持逗号分隔的格式。"""
-        
         data = {
             "model": "deepseek-chat",
             "messages": [
                 {
                     "role": "system",
-                    "content": system_prompt
+                    "content": PROMPT_TRANSLATION_SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -100,7 +130,7 @@ def translate_prompt_to_english(chinese_prompt: str) -> str:
         print(f"Translating prompt to English...")
         print(f"Chinese prompt: {chinese_prompt[:100]}...")
         
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=data, timeout=30)
+        response = httpclient.post("deepseek", DEEPSEEK_API_URL, headers=headers, json=data, timeout=30)
         response.raise_for_status()
         
         result = response.json()
@@ -110,6 +140,8 @@ def translate_prompt_to_english(chinese_prompt: str) -> str:
             # Remove quotes if present
             english_prompt = english_prompt.strip('"\'')
             print(f"English prompt: {english_prompt[:100]}...")
+            if english_prompt:
+                image_cache.save_translation(chinese_prompt, english_prompt)
             return english_prompt
         
         print("Translation failed: no valid response")
@@ -122,18 +154,85 @@ def translate_prompt_to_english(chinese_prompt: str) -> str:
         return chinese_prompt  # Fallback to original
 
 
-def generate_image_from_prompt(prompt: str, aspect_ratio: str = "1:1") -> Optional[str]:
+def stream_prompt_translation(chinese_prompt: str):
+    """
+    Stream the English translation of a Chinese prompt from DeepSeek
+    
+    Args:
+        chinese_prompt: Prompt in Chinese
+    
+    Yields:
+        str: Translated text fragments
+    """
+    headers = {
+        "Authorization": f"Bearer {get_deepseek_key()}",
+        "Content-Type": "application/json"
+    }
+    
+    data = {
+        "model": "deepseek-chat",
+        "messages": [
+            {
+                "role": "system",
+                "content": PROMPT_TRANSLATION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": chinese_prompt
+            }
+        ],
+        "temperature": 0.3,
+        "stream": True
+    }
+    
+    response = httpclient.post("deepseek", DEEPSEEK_API_URL, headers=headers, json=data, timeout=30, stream=True)
+    try:
+        response.raise_for_status()
+        
+        # OpenAI 兼容的流式格式：每行 "data: {...}"，以 "data: [DONE]" 结束
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            choices = json.loads(payload).get('choices') or []
+            content = choices[0].get('delta', {}).get('content') if choices else None
+            if content:
+                yield content
+    finally:
+        response.close()
+
+
+def generate_image_from_prompt(prompt: str, aspect_ratio: str = "1:1", force_new: bool = False) -> Optional[str]:
     """
     Generate image using AIsonnet Gemini 2.5 Flash Image API
     Automatically translates Chinese prompt to English before API call
+    Results are cached by (prompt, aspect ratio, model); force_new generates a new
+    variation and replaces the cached image
     
     Args:
         prompt: Text prompt for image generation (can be Chinese or English)
         aspect_ratio: Aspect ratio for the generated image (e.g., "1:1", "16:9")
+        force_new: Skip the cached image and call the API again
     
     Returns:
         Optional[str]: Base64 encoded image or None if failed
     """
+    if not force_new:
+        cached = image_cache.get_cached_image(prompt, aspect_ratio, IMAGE_MODEL)
+        if cached:
+            print(f"Image cache hit ({aspect_ratio}): {prompt[:100]}...")
+            return cached
+    
+    image_base64 = _generate_image(prompt, aspect_ratio)
+    if image_base64:
+        image_cache.save_image(prompt, aspect_ratio, IMAGE_MODEL, image_base64)
+    return image_base64
+
+
+def _generate_image(prompt: str, aspect_ratio: str) -> Optional[str]:
+    """Call AIsonnet and return the generated image as base64 (no caching)"""
     try:
         # Translate Chinese prompt to English
         english_prompt = translate_prompt_to_english(prompt)
@@ -152,7 +251,7 @@ def generate_image_from_prompt(prompt: str, aspect_ratio: str = "1:1") -> Option
         
         # Prepare request data with aspect ratio
         data = {
-            "model": "gemini-2.5-flash-image",
+            "model": IMAGE_MODEL,
             "extra_body": {
                 "imageConfig": {
                     "aspectRatio": aspect_ratio
@@ -182,8 +281,9 @@ def generate_image_from_prompt(prompt: str, aspect_ratio: str = "1:1") -> Option
         print(f"English prompt: {english_prompt[:100]}...")
         print(f"Aspect ratio: {aspect_ratio}")
         
-        # Call the API
-        response = requests.post(api_url, headers=headers, json=data, timeout=90)
+        # Call the API (bounded so batch generation does not flood the provider)
+        with monitoring.queued("image_generation"), _generation_slots:
+            response = httpclient.post("aisonnet", api_url, headers=headers, json=data, timeout=90)
         response.raise_for_status()
         
         result = response.json()
@@ -201,7 +301,7 @@ def generate_image_from_prompt(prompt: str, aspect_ratio: str = "1:1") -> Option
                 print(f"Extracted image URL: {image_url}")
                 
                 # Download image and convert to base64
-                img_response = requests.get(image_url, timeout=30)
+                img_response = httpclient.get("cdn", image_url, timeout=30)
                 img_response.raise_for_status()
                 image_base64 = base64.b64encode(img_response.content).decode('utf-8')
                 print(f"Image downloaded and converted to base64 (length: {len(image_base64)})")
@@ -210,7 +310,7 @@ def generate_image_from_prompt(prompt: str, aspect_ratio: str = "1:1") -> Option
             # If content is a direct URL
             elif content.startswith('http://') or content.startswith('https://'):
                 print(f"Direct image URL: {content}")
-                img_response = requests.get(content, timeout=30)
+                img_response = httpclient.get("cdn", content, timeout=30)
                 img_response.raise_for_status()
                 image_base64 = base64.b64encode(img_response.content).decode('utf-8')
                 print(f"Image downloaded and converted to base64 (length: {len(image_base64)})")
@@ -237,6 +337,31 @@ def generate_image_from_prompt(prompt: str, aspect_ratio: str = "1:1") -> Option
         return None
 
 
+def save_new_image(cur, user_id: int, post_id: str, image_index: int, image_base64: str):
+    """
+    Save a generated image to new_images_base64[image_index] (caller commits)
+    支持对应生成：即使先生成第三张再生成第二张，也能正确保存到对应位置
+    
+    单条 UPDATE 在数据库内补齐数组长度并用 jsonb_set 写入对应位置，不读取整个数组；
+    并发生成不同位置时由行锁串行化，后写入的不会覆盖先写入的其他位置
+    """
+    cur.execute("""
+        UPDATE mypostl
+        SET new_images_base64 = jsonb_set(
+                COALESCE(new_images_base64, '[]'::jsonb) || COALESCE((
+                    SELECT jsonb_agg('null'::jsonb)
+                    FROM generate_series(1, %s - jsonb_array_length(COALESCE(new_images_base64, '[]'::jsonb)))
+                ), '[]'::jsonb),
+                ARRAY[%s::text],
+                to_jsonb(%s::text)
+            ),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = %s AND post_id = %s
+    """, (image_index + 1, image_index, image_base64, user_id, post_id))
+    
+    print(f"Image saved to new_images_base64[{image_index}]")
+
+
 # ============================================
 # API Endpoints
 # ============================================
@@ -268,11 +393,10 @@ async def start_analysis(request: StartAnalysisRequest, background_tasks: Backgr
                     "skip_generation": True
                 }
             
-            # Step 2: Get data from popular table (包含所有字段)
+            # Step 2: Get data from popular table (素材只记录引用，不读取 base64)
             cur.execute("""
                 SELECT 
-                    post_id, post_type, 
-                    display_url_base64, video_url_base64, images_base64,
+                    id, post_id, post_type, 
                     jianyi1, "jianyi1.5", jianyi2, jianyi3, success,
                     prompt, prompt_array
                 FROM popular 
@@ -290,105 +414,54 @@ async def start_analysis(request: StartAnalysisRequest, background_tasks: Backgr
             if post_type not in ['Image', 'Sidecar']:
                 raise HTTPException(status_code=400, detail="Only Image and Sidecar posts are supported")
             
-            # Step 3: Insert or Update mypostl with data from popular
+            # Step 3: Insert or Update mypostl referencing the popular media (see mediaref)
             # Sidecar 类型不需要 display_url_base64 和 prompt
-            if post_type == "Sidecar":
-                if existing:
-                    # Update existing record (Sidecar)
-                    cur.execute("""
-                        UPDATE mypostl
-                        SET video_url_base64 = %s,
-                            images_base64 = %s,
-                            jianyi1 = %s,
-                            jianyi2 = %s,
-                            jianyi3 = %s,
-                            post_type = %s,
-                            prompt_array = %s,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE user_id = %s AND post_id = %s
-                    """, (
-                        popular_data['video_url_base64'],
-                        json.dumps(popular_data['images_base64']) if popular_data['images_base64'] else None,
-                        popular_data['jianyi1'],
-                        popular_data['jianyi2'],
-                        popular_data['jianyi3'],
-                        post_type,
-                        json.dumps(popular_data['prompt_array']) if popular_data['prompt_array'] else None,
-                        request.user_id,
-                        request.post_id
-                    ))
-                    print(f"✅ Updated existing Sidecar record in mypostl for post {request.post_id}")
-                else:
-                    # Insert new record (Sidecar)
-                    cur.execute("""
-                        INSERT INTO mypostl 
-                        (user_id, post_id, video_url_base64, images_base64, 
-                         jianyi1, jianyi2, jianyi3, post_type, prompt_array)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        request.user_id,
-                        request.post_id,
-                        popular_data['video_url_base64'],
-                        json.dumps(popular_data['images_base64']) if popular_data['images_base64'] else None,
-                        popular_data['jianyi1'],
-                        popular_data['jianyi2'],
-                        popular_data['jianyi3'],
-                        post_type,
-                        json.dumps(popular_data['prompt_array']) if popular_data['prompt_array'] else None
-                    ))
-                    print(f"✅ Inserted new Sidecar record into mypostl for post {request.post_id}")
+            prompt = popular_data['prompt'] if post_type == "Image" else None
+            prompt_array = json.dumps(popular_data['prompt_array']) if popular_data['prompt_array'] else None
+            
+            if existing:
+                cur.execute(f"""
+                    UPDATE mypostl
+                    SET source_popular_id = %s,
+                        {mediaref.reset_inherited_sql(post_type)},
+                        jianyi1 = %s,
+                        jianyi2 = %s,
+                        jianyi3 = %s,
+                        post_type = %s,
+                        prompt = COALESCE(%s, prompt),
+                        prompt_array = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = %s AND post_id = %s
+                """, (
+                    popular_data['id'],
+                    popular_data['jianyi1'],
+                    popular_data['jianyi2'],
+                    popular_data['jianyi3'],
+                    post_type,
+                    prompt,
+                    prompt_array,
+                    request.user_id,
+                    request.post_id
+                ))
+                print(f"✅ Updated existing {post_type} record in mypostl for post {request.post_id}")
             else:
-                # Image 类型正常继承所有字段
-                if existing:
-                    # Update existing record (Image)
-                    cur.execute("""
-                        UPDATE mypostl
-                        SET display_url_base64 = %s,
-                            video_url_base64 = %s,
-                            images_base64 = %s,
-                            jianyi1 = %s,
-                            jianyi2 = %s,
-                            jianyi3 = %s,
-                            post_type = %s,
-                            prompt = %s,
-                            prompt_array = %s,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE user_id = %s AND post_id = %s
-                    """, (
-                        popular_data['display_url_base64'],
-                        popular_data['video_url_base64'],
-                        json.dumps(popular_data['images_base64']) if popular_data['images_base64'] else None,
-                        popular_data['jianyi1'],
-                        popular_data['jianyi2'],
-                        popular_data['jianyi3'],
-                        post_type,
-                        popular_data['prompt'],
-                        json.dumps(popular_data['prompt_array']) if popular_data['prompt_array'] else None,
-                        request.user_id,
-                        request.post_id
-                    ))
-                    print(f"✅ Updated existing Image record in mypostl for post {request.post_id}")
-                else:
-                    # Insert new record (Image)
-                    cur.execute("""
-                        INSERT INTO mypostl 
-                        (user_id, post_id, display_url_base64, video_url_base64, images_base64, 
-                         jianyi1, jianyi2, jianyi3, post_type, prompt, prompt_array)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        request.user_id,
-                        request.post_id,
-                        popular_data['display_url_base64'],
-                        popular_data['video_url_base64'],
-                        json.dumps(popular_data['images_base64']) if popular_data['images_base64'] else None,
-                        popular_data['jianyi1'],
-                        popular_data['jianyi2'],
-                        popular_data['jianyi3'],
-                        post_type,
-                        popular_data['prompt'],
-                        json.dumps(popular_data['prompt_array']) if popular_data['prompt_array'] else None
-                    ))
-                    print(f"✅ Inserted new Image record into mypostl for post {request.post_id}")
+                cur.execute("""
+                    INSERT INTO mypostl 
+                    (user_id, post_id, source_popular_id, 
+                     jianyi1, jianyi2, jianyi3, post_type, prompt, prompt_array)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    request.user_id,
+                    request.post_id,
+                    popular_data['id'],
+                    popular_data['jianyi1'],
+                    popular_data['jianyi2'],
+                    popular_data['jianyi3'],
+                    post_type,
+                    prompt,
+                    prompt_array
+                ))
+                print(f"✅ Inserted new {post_type} record into mypostl for post {request.post_id}")
             
             conn.commit()
             
@@ -421,9 +494,9 @@ async def get_analysis_data(user_id: int, post_id: str):
     
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT id, user_id, post_id, display_url_base64, video_url_base64, 
-                       images_base64, jianyi1, jianyi2, jianyi3, post_type, 
+            cur.execute(f"""
+                SELECT id, user_id, post_id, {mediaref.MEDIA_COLUMNS}, 
+                       jianyi1, jianyi2, jianyi3, post_type, 
                        prompt, prompt_array, new_display_url_base64, new_images_base64,
                        created_at, updated_at
                 FROM mypostl
@@ -517,11 +590,50 @@ async def update_prompt(request: UpdatePromptRequest):
         conn.close()
 
 
+@router.post("/translate-prompt/stream")
+def translate_prompt_stream(request: TranslatePromptRequest):
+    """
+    Translate a Chinese image prompt to English, streaming tokens as SSE
+    
+    Events:
+    - delta: {text}
+    - done: {prompt, cached}
+    - error: {detail}
+    """
+    if not request.prompt or not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt is empty")
+    
+    def events():
+        cached = image_cache.get_translation(request.prompt)
+        if cached:
+            yield sse.format_event("delta", {"text": cached})
+            yield sse.format_event("done", {"prompt": cached, "cached": True})
+            return
+        
+        parts = []
+        try:
+            for text in stream_prompt_translation(request.prompt):
+                parts.append(text)
+                yield sse.format_event("delta", {"text": text})
+            
+            english_prompt = "".join(parts).strip().strip('"\'')
+            print(f"English prompt: {english_prompt[:100]}...")
+            if english_prompt:
+                image_cache.save_translation(request.prompt, english_prompt)
+            yield sse.format_event("done", {"prompt": english_prompt, "cached": False})
+        except Exception as e:
+            print(f"Translation failed: {str(e)}")
+            yield sse.format_event("error", {"detail": f"Translation failed: {str(e)}"})
+    
+    return sse.stream(events())
+
+
 @router.post("/generate-image")
-async def generate_image(request: GenerateImageRequest):
+def generate_image(request: GenerateImageRequest):
     """
     Generate image based on prompt
     支持对应生成：即使先生成第三张再生成第二张，也能正确保存到对应位置
+    同步端点：在线程池中执行，等待生成槽位时不阻塞事件循环
     """
     conn = get_db_connection()
     
@@ -529,7 +641,7 @@ async def generate_image(request: GenerateImageRequest):
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             # Get current data
             cur.execute("""
-                SELECT prompt, prompt_array, new_images_base64, post_type
+                SELECT prompt, prompt_array, post_type
                 FROM mypostl
                 WHERE user_id = %s AND post_id = %s
             """, (request.user_id, request.post_id))
@@ -553,7 +665,7 @@ async def generate_image(request: GenerateImageRequest):
                 print(f"Generating image for display_url with prompt: {prompt[:100]}...")
                 
                 # Generate image with aspect ratio
-                generated_image_base64 = generate_image_from_prompt(prompt, request.aspect_ratio)
+                generated_image_base64 = generate_image_from_prompt(prompt, request.aspect_ratio, request.force_new)
                 
                 if not generated_image_base64:
                     raise HTTPException(status_code=500, detail="Image generation failed")
@@ -582,32 +694,12 @@ async def generate_image(request: GenerateImageRequest):
                 print(f"Generating image for images_base64[{request.image_index}] with prompt: {prompt[:100]}...")
                 
                 # Generate image with aspect ratio
-                generated_image_base64 = generate_image_from_prompt(prompt, request.aspect_ratio)
+                generated_image_base64 = generate_image_from_prompt(prompt, request.aspect_ratio, request.force_new)
                 
                 if not generated_image_base64:
                     raise HTTPException(status_code=500, detail="Image generation failed")
                 
-                # Update new_images_base64 array - 关键：确保数组足够大以容纳任意索引
-                new_images = data['new_images_base64'] if data['new_images_base64'] else []
-                
-                # 确保数组长度足够（填充 None）
-                while len(new_images) <= request.image_index:
-                    new_images.append(None)
-                
-                # 在对应位置保存生成的图片
-                new_images[request.image_index] = generated_image_base64
-                
-                print(f"Updating new_images_base64 array at index {request.image_index}")
-                print(f"Array length: {len(new_images)}")
-                
-                cur.execute("""
-                    UPDATE mypostl
-                    SET new_images_base64 = %s::jsonb,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = %s AND post_id = %s
-                """, (json.dumps(new_images), request.user_id, request.post_id))
-                
-                print(f"Image saved to new_images_base64[{request.image_index}]")
+                save_new_image(cur, request.user_id, request.post_id, request.image_index, generated_image_base64)
             
             conn.commit()
             
@@ -629,3 +721,108 @@ async def generate_image(request: GenerateImageRequest):
         conn.close()
 
 
+@router.post("/generate-images/batch")
+def generate_images_batch(request: GenerateImagesBatchRequest):
+    """
+    Generate several prompt_array images concurrently, streaming per-index progress as SSE
+    每张图片生成后立即保存到 new_images_base64 对应位置
+    
+    Events:
+    - start: {indices, total}
+    - image_done: {index, image_base64, elapsed_seconds}
+    - image_failed: {index, error}
+    - done: {succeeded, failed, elapsed_seconds}
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT prompt_array FROM mypostl
+                WHERE user_id = %s AND post_id = %s
+            """, (request.user_id, request.post_id))
+            data = cur.fetchone()
+    finally:
+        conn.close()
+    
+    if not data:
+        raise HTTPException(status_code=404, detail="Data not found")
+    
+    prompt_array = data['prompt_array'] or []
+    if not prompt_array:
+        raise HTTPException(status_code=400, detail="prompt_array is empty, use /generate-image for single images")
+    
+    indices = request.indices if request.indices is not None else list(range(len(prompt_array)))
+    indices = list(dict.fromkeys(indices))
+    invalid = [i for i in indices if i < 0 or i >= len(prompt_array) or not prompt_array[i]]
+    if invalid or not indices:
+        raise HTTPException(status_code=400, detail=f"Invalid image index or prompt not found: {invalid}")
+    
+    def generate_one(index: int):
+        start = time.time()
+        image_base64 = generate_image_from_prompt(prompt_array[index], request.aspect_ratio, request.force_new)
+        if not image_base64:
+            raise Exception("Image generation failed")
+        return image_base64, time.time() - start
+    
+    def events():
+        batch_start = time.time()
+        print(f"Batch generating {len(indices)} images for post {request.post_id}")
+        yield sse.format_event("start", {"indices": indices, "total": len(indices)})
+        
+        succeeded, failed = 0, 0
+        executor = ThreadPoolExecutor(max_workers=min(len(indices), IMAGE_GEN_MAX_CONCURRENCY * 2))
+        futures = {executor.submit(generate_one, index): index for index in indices}
+        remaining = set(futures)
+        try:
+            while remaining:
+                done, remaining = wait(remaining, timeout=15, return_when=FIRST_COMPLETED)
+                if not done:
+                    yield sse.HEARTBEAT
+                    continue
+                
+                for future in done:
+                    index = futures[future]
+                    try:
+                        image_base64, elapsed = future.result()
+                        conn = get_db_connection()
+                        try:
+                            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                                save_new_image(cur, request.user_id, request.post_id, index, image_base64)
+                            conn.commit()
+                        finally:
+                            conn.close()
+                    except Exception as e:
+                        failed += 1
+                        print(f"Image {index} failed: {str(e)}")
+                        yield sse.format_event("image_failed", {"index": index, "error": str(e)})
+                        continue
+                    
+                    succeeded += 1
+                    yield sse.format_event("image_done", {
+                        "index": index,
+                        "image_base64": image_base64,
+                        "elapsed_seconds": round(elapsed, 1)
+                    })
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        elapsed = time.time() - batch_start
+        print(f"Batch generation finished: {succeeded} succeeded, {failed} failed in {elapsed:.1f}s")
+        yield sse.format_event("done", {
+            "succeeded": succeeded,
+            "failed": failed,
+            "elapsed_seconds": round(elapsed, 1)
+        })
+    
+    return sse.stream(events())
+
+
+@router.get("/cache/stats")
+async def get_image_cache_stats():
+    """
+    Generated image / prompt translation cache statistics
+    """
+    try:
+        return {"success": True, "data": image_cache.get_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get cache stats: {str(e)}")
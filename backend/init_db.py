@@ -127,6 +127,9 @@ def init_database():
             )
         """)
         
+        # 项目素材引用 popular 源记录（见 mediaref.py），不再复制 base64
+        cursor.execute("ALTER TABLE mypostl ADD COLUMN IF NOT EXISTS source_popular_id INTEGER")
+        
         logger.info("创建 popular 表...")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS popular (
@@ -207,6 +210,43 @@ def init_database():
             )
         """)
         
+        # 爆款评分（viralscore.py）：按粉丝数归一的互动率、按帖龄校正的账号内 z-score
+        cursor.execute("ALTER TABLE post_data ADD COLUMN IF NOT EXISTS engagement_rate DOUBLE PRECISION")
+        cursor.execute("ALTER TABLE post_data ADD COLUMN IF NOT EXISTS viral_score DOUBLE PRECISION")
+        cursor.execute("ALTER TABLE post_data ADD COLUMN IF NOT EXISTS viral_scored_at TIMESTAMP WITHOUT TIME ZONE")
+        
+        logger.info("创建 post_hashtag 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS post_hashtag (
+                post_data_id INTEGER NOT NULL REFERENCES post_data(id) ON DELETE CASCADE,
+                tag VARCHAR(200) NOT NULL,
+                posted_at TIMESTAMP WITHOUT TIME ZONE,
+                PRIMARY KEY (post_data_id, tag)
+            )
+        """)
+        
+        logger.info("创建 post_mention 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS post_mention (
+                post_data_id INTEGER NOT NULL REFERENCES post_data(id) ON DELETE CASCADE,
+                username VARCHAR(200) NOT NULL,
+                posted_at TIMESTAMP WITHOUT TIME ZONE,
+                PRIMARY KEY (post_data_id, username)
+            )
+        """)
+        
+        logger.info("创建 post_metric_snapshot 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS post_metric_snapshot (
+                id BIGSERIAL PRIMARY KEY,
+                post_data_id INTEGER NOT NULL REFERENCES post_data(id) ON DELETE CASCADE,
+                likes_count INTEGER DEFAULT 0,
+                comments_count INTEGER DEFAULT 0,
+                views_count BIGINT DEFAULT 0,
+                captured_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (NOW() AT TIME ZONE 'UTC')
+            )
+        """)
+        
         logger.info("创建 api_config 表...")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS api_config (
@@ -218,6 +258,57 @@ def init_database():
             )
         """)
         
+        # API Key 版本号（每次更新 +1，各 worker 据此重新加载 Key、重建服务商客户端）
+        cursor.execute("ALTER TABLE api_config ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1")
+        
+        logger.info("创建 analysis_cache 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                id SERIAL PRIMARY KEY,
+                post_id VARCHAR(100) NOT NULL,
+                post_type VARCHAR(50),
+                media_hash VARCHAR(64) NOT NULL,
+                template_version VARCHAR(32) NOT NULL,
+                model VARCHAR(50) NOT NULL,
+                result JSONB NOT NULL,
+                elapsed_seconds NUMERIC(10,3) DEFAULT 0,
+                hit_count INTEGER DEFAULT 0,
+                last_hit_at TIMESTAMP WITHOUT TIME ZONE,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                raw_text TEXT,
+                UNIQUE(post_id, media_hash, template_version, model)
+            )
+        """)
+        
+        # 已有数据库补充原始输出字段（解析器回归测试语料）
+        cursor.execute("ALTER TABLE analysis_cache ADD COLUMN IF NOT EXISTS raw_text TEXT")
+        
+        logger.info("创建 generated_image_cache 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS generated_image_cache (
+                id SERIAL PRIMARY KEY,
+                prompt_hash VARCHAR(64) NOT NULL,
+                aspect_ratio VARCHAR(20) NOT NULL,
+                model VARCHAR(50) NOT NULL,
+                prompt TEXT,
+                image_base64 TEXT NOT NULL,
+                hit_count INTEGER DEFAULT 0,
+                last_hit_at TIMESTAMP WITHOUT TIME ZONE,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(prompt_hash, aspect_ratio, model)
+            )
+        """)
+        
+        logger.info("创建 prompt_translation_cache 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS prompt_translation_cache (
+                source_hash VARCHAR(64) PRIMARY KEY,
+                source_text TEXT NOT NULL,
+                translated TEXT NOT NULL,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
         # ==================== 创建外键约束 ====================
         
         logger.info("创建外键约束...")
@@ -287,6 +378,107 @@ def init_database():
             END $$;
         """)
         
+        cursor.execute("""
+            DO $$ 
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_constraint WHERE conname = 'mypostl_source_popular_id_fkey'
+                ) THEN
+                    ALTER TABLE mypostl 
+                    ADD CONSTRAINT mypostl_source_popular_id_fkey 
+                    FOREIGN KEY (source_popular_id) REFERENCES popular(id) ON DELETE SET NULL;
+                END IF;
+            END $$;
+        """)
+        
+        # ==================== 创建触发器 ====================
+        
+        logger.info("创建触发器...")
+        
+        # popular 素材被修改或删除前，把旧素材物化到引用它的 mypostl 行（写时复制）
+        # 继承规则与 mediaref.INHERITED_FIELDS 保持一致
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION materialize_mypostl_media() RETURNS trigger AS $$
+            BEGIN
+                UPDATE mypostl SET
+                    display_url_base64 = COALESCE(display_url_base64,
+                        CASE WHEN post_type IN ('Image', 'Video') THEN OLD.display_url_base64 #>> '{}' END),
+                    video_url_base64 = COALESCE(video_url_base64,
+                        CASE WHEN post_type IN ('Image', 'Sidecar', 'Video') THEN OLD.video_url_base64 #>> '{}' END),
+                    images_base64 = COALESCE(images_base64,
+                        CASE WHEN post_type IN ('Image', 'Sidecar') THEN OLD.images_base64 END),
+                    source_popular_id = NULL
+                WHERE source_popular_id = OLD.id;
+                
+                IF TG_OP = 'DELETE' THEN
+                    RETURN OLD;
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS popular_media_update ON popular")
+        cursor.execute("""
+            CREATE TRIGGER popular_media_update
+            BEFORE UPDATE OF display_url_base64, video_url_base64, images_base64 ON popular
+            FOR EACH ROW
+            WHEN (OLD.display_url_base64 IS DISTINCT FROM NEW.display_url_base64
+                  OR OLD.video_url_base64 IS DISTINCT FROM NEW.video_url_base64
+                  OR OLD.images_base64 IS DISTINCT FROM NEW.images_base64)
+            EXECUTE FUNCTION materialize_mypostl_media()
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS popular_media_delete ON popular")
+        cursor.execute("""
+            CREATE TRIGGER popular_media_delete
+            BEFORE DELETE ON popular
+            FOR EACH ROW
+            EXECUTE FUNCTION materialize_mypostl_media()
+        """)
+        
+        # 表变更通知（changefeed.py 监听 table_change 频道，分发给进程内缓存和 SSE 订阅者）
+        # 载荷只含表名、操作和 id（可通过触发器参数附带一列，如 popular.user_id），不含行内容
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+            DECLARE
+                rec RECORD;
+                extra TEXT;
+                payload JSONB;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    rec := OLD;
+                ELSE
+                    rec := NEW;
+                END IF;
+                payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'id', rec.id);
+                IF TG_NARGS > 0 THEN
+                    EXECUTE format('SELECT ($1).%I::text', TG_ARGV[0]) USING rec INTO extra;
+                    payload := payload || jsonb_build_object(TG_ARGV[0], extra);
+                END IF;
+                PERFORM pg_notify('table_change', payload::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        # post_data 只在缓存用到的列变化时通知（爆款评分等批量回写不触发）
+        cursor.execute("DROP TRIGGER IF EXISTS post_data_notify ON post_data")
+        cursor.execute("""
+            CREATE TRIGGER post_data_notify
+            AFTER INSERT OR DELETE OR UPDATE OF
+                post_type, owner_username, "timestamp", likes_count, comments_count,
+                video_view_count, video_play_count, caption_zh, competitor_id, search_id
+            ON post_data
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_table_change()
+        """)
+        for table, extra in (("competitor", ""), ("search", ""), ("popular", "'user_id'"), ("api_config", "")):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_notify ON {table}")
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_notify
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW
+                EXECUTE FUNCTION notify_table_change({extra})
+            """)
+        
         # ==================== 创建索引 ====================
         
         logger.info("创建索引...")
@@ -310,6 +502,7 @@ def init_database():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_mypostl_post_id ON mypostl(post_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_mypostl_created_at ON mypostl(created_at DESC)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_mypostl_prompt_array ON mypostl USING gin(prompt_array)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mypostl_source_popular_id ON mypostl(source_popular_id)")
         
         # popular 索引
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_popular_user_id ON popular(user_id)")
@@ -325,9 +518,62 @@ def init_database():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_data_competitor_id ON post_data(competitor_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_data_search_id ON post_data(search_id)")
         
+        # 帖子列表游标分页复合索引（与 pagination.ORDER_BY 的排序一致，按类型筛选与全部类型各一个）
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_post_data_owner_type_ts
+            ON post_data(owner_username, post_type, "timestamp" DESC NULLS LAST, id DESC)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_post_data_owner_ts
+            ON post_data(owner_username, "timestamp" DESC NULLS LAST, id DESC)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_post_data_search_type_ts
+            ON post_data(search_id, post_type, "timestamp" DESC NULLS LAST, id DESC)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_post_data_search_ts
+            ON post_data(search_id, "timestamp" DESC NULLS LAST, id DESC)
+        """)
+        
+        # 帖子组合筛选索引（postquery.py）：评论数、播放量
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_data_comments ON post_data(comments_count DESC)")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_post_data_views
+            ON post_data((GREATEST(video_view_count, video_play_count)) DESC)
+        """)
+        
+        # post_hashtag / post_mention 索引（按标签查帖子、按时间窗口统计热门标签）
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_hashtag_tag_posted_at ON post_hashtag(tag, posted_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_hashtag_posted_at ON post_hashtag(posted_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_mention_username_posted_at ON post_mention(username, posted_at DESC)")
+        
+        # 热门标签增量刷新（trends.py）：按更新时间找新抓取的帖子，按时间读取互动快照
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_data_updated_at ON post_data(updated_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_metric_snapshot_captured_at ON post_metric_snapshot(captured_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_metric_snapshot_post ON post_metric_snapshot(post_data_id, captured_at)")
+        
+        # 爆款排行（viralscore.py）：全局、按账号
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_data_viral_score ON post_data(viral_score DESC NULLS LAST, id DESC)")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_post_data_owner_viral_score
+            ON post_data(owner_username, viral_score DESC NULLS LAST, id DESC)
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_post_data_engagement_rate ON post_data(engagement_rate DESC NULLS LAST)")
+        
         # api_config 索引
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_config_key_name ON api_config(key_name)")
         
+        # analysis_cache 索引
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_created_at ON analysis_cache(created_at)")
+        
+        # generated_image_cache 索引（按最近使用时间淘汰，见 image_cache.purge_images）
+        cursor.execute("DROP INDEX IF EXISTS idx_generated_image_cache_created_at")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_generated_image_cache_last_used
+            ON generated_image_cache ((COALESCE(last_hit_at, created_at)))
+        """)
+        
         # ==================== 插入初始管理员账号 ====================
         
         logger.info("插入管理员账号...")
@@ -363,7 +609,12 @@ def init_database():
         logger.info("  ✅ mypostl (我的项目表)")
         logger.info("  ✅ popular (爆款脚本表)")
         logger.info("  ✅ post_data (帖子数据表)")
+        logger.info("  ✅ post_hashtag / post_mention (话题标签 / 提及索引表)")
+        logger.info("  ✅ post_metric_snapshot (帖子互动数据快照表)")
         logger.info("  ✅ api_config (API密钥配置表)")
+        logger.info("  ✅ analysis_cache (分析结果缓存表)")
+        logger.info("  ✅ generated_image_cache (生成图片缓存表)")
+        logger.info("  ✅ prompt_translation_cache (提示词翻译缓存表)")
         logger.info("")
         logger.info("索引和外键约束已创建")
         logger.info("")
@@ -1,23 +1,27 @@
 import os
 import json
+import logging
 import base64
-import requests
+import httpclient
+import logconfig
+import monitoring
+import tracing
 from datetime import datetime
-from apify_client import ApifyClient
 from dotenv import load_dotenv
 from translate import translate_post_by_id
 from database import get_db_connection
+from posttags import sync_post_tags
+from postmetrics import record_snapshot
+from viralscore import refresh_after_scrape
+from metricstore import store as metric_store
+import responsecache
 
 load_dotenv()
 
-# Apify客户端
-from apiconfig import get_api_key
+logger = logging.getLogger(__name__)
 
-def get_apify_client():
-    token = get_api_key("APIFY_API_TOKEN") or os.getenv("APIFY_API_TOKEN", "")
-    return ApifyClient(token)
-
-client = get_apify_client()
+# Apify客户端（APIFY_API_TOKEN 更新后自动重建，任一 worker 更新均生效）
+from apiconfig import get_api_key, get_apify_client
 
 # DeepSeek API配置
 def get_deepseek_key():
@@ -25,6 +29,7 @@ def get_deepseek_key():
 
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 
+@tracing.traced(attributes=("keyword",))
 def translate_keyword(keyword: str) -> str:
     """
     使用 DeepSeek API 翻译关键词到中文
@@ -39,11 +44,11 @@ def translate_keyword(keyword: str) -> str:
         return ""
     
     if not get_deepseek_key():
-        print("⚠️  DeepSeek API Key not configured, skipping translation")
+        logger.warning("DeepSeek API Key not configured, skipping translation")
         return ""
     
     try:
-        print(f"  🌐 翻译关键词: {keyword}")
+        logger.debug("翻译关键词: %s", keyword)
         
         headers = {
             "Authorization": f"Bearer {get_deepseek_key()}",
@@ -68,21 +73,21 @@ def translate_keyword(keyword: str) -> str:
             "max_tokens": 100
         }
         
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=data, timeout=30)
+        response = httpclient.post("deepseek", DEEPSEEK_API_URL, headers=headers, json=data, timeout=30)
         
         if response.status_code == 200:
             result = response.json()
             translated = result['choices'][0]['message']['content'].strip()
             # 移除可能的引号
             translated = translated.strip('"').strip("'")
-            print(f"  ✅ 翻译完成: {keyword} -> {translated}")
+            logger.info("关键词翻译完成: %s -> %s", keyword, translated)
             return translated
         else:
-            print(f"  ⚠️  翻译失败: {response.status_code}")
+            logger.warning("关键词翻译失败: %s", response.status_code)
             return ""
             
     except Exception as e:
-        print(f"  ❌ 翻译错误: {e}")
+        logger.error("关键词翻译错误: %s", e)
         return ""
 
 def check_search_exists(keyword):
@@ -95,6 +100,7 @@ def check_search_exists(keyword):
     conn.close()
     return result['id'] if result else None
 
+@tracing.traced(attributes=("keyword",))
 def create_or_update_search(keyword):
     """创建或更新搜索标签"""
     conn = get_db_connection()
@@ -123,7 +129,7 @@ def create_or_update_search(keyword):
                     SET keyword_zh = %s
                     WHERE id = %s
                 ''', (keyword_zh, search_id))
-                print(f"  ✅ 已更新关键词翻译")
+                logger.info("已更新关键词翻译: %s", keyword)
     else:
         # 翻译关键词
         keyword_zh = translate_keyword(keyword)
@@ -139,25 +145,29 @@ def create_or_update_search(keyword):
     conn.commit()
     cursor.close()
     conn.close()
+    metric_store.mark_sources()
+    responsecache.invalidate("keywords", "keyword_stats")
     
     return search_id
 
+@tracing.traced("download_image", attributes=("url",))
 def download_image_to_base64(url):
     """下载图片并转换为Base64（复用逻辑）"""
     try:
-        response = requests.get(url, timeout=10)
+        response = httpclient.get("cdn", url, timeout=10)
         if response.status_code == 200:
             return base64.b64encode(response.content).decode('utf-8')
     except Exception as e:
-        print(f"下载图片失败: {url}, 错误: {e}")
+        logger.warning("下载图片失败: %s, 错误: %s", url, e)
     return None
 
+@tracing.traced("download_video", attributes=("url",))
 def download_video_to_base64(url):
     """下载视频并转换为Base64（带超时和大小限制）"""
     try:
-        print(f"  正在下载视频: {url[:80]}...")
+        logger.debug("正在下载视频: %s", url[:80], extra=logconfig.SAMPLED)
         # 设置较长的超时时间（视频文件较大）
-        response = requests.get(url, timeout=120, stream=True)
+        response = httpclient.get("cdn", url, timeout=120, stream=True)
         if response.status_code == 200:
             # 限制视频大小（例如最大100MB）
             max_size = 100 * 1024 * 1024  # 100MB
@@ -170,18 +180,20 @@ def download_video_to_base64(url):
                 
                 # 显示下载进度
                 if downloaded_size % (1024 * 1024) == 0:  # 每1MB显示一次
-                    print(f"    已下载: {downloaded_size / 1024 / 1024:.1f}MB")
+                    logger.debug("已下载: %.1fMB", downloaded_size / 1024 / 1024, extra=logconfig.SAMPLED)
                 
                 if downloaded_size > max_size:
-                    print(f"    ⚠️ 视频过大(>{max_size/1024/1024}MB)，跳过: {url[:80]}")
+                    logger.warning("视频过大(>%dMB)，跳过: %s", max_size // 1024 // 1024, url[:80])
                     return None
             
-            print(f"    ✅ 视频下载完成: {downloaded_size / 1024 / 1024:.2f}MB")
+            tracing.annotate(bytes=downloaded_size)
+            logger.debug("视频下载完成: %.2fMB", downloaded_size / 1024 / 1024, extra=logconfig.SAMPLED)
             return base64.b64encode(video_data).decode('utf-8')
     except Exception as e:
-        print(f"    ❌ 下载视频失败: {url[:80]}, 错误: {e}")
+        logger.warning("下载视频失败: %s, 错误: %s", url[:80], e)
     return None
 
+@tracing.traced(attributes=("keyword", "limit", "results_type"))
 def get_posts_urls_by_hashtag(keyword, limit=10, results_type="posts"):
     """
     第一步：通过标签搜索获取帖子URL列表
@@ -194,9 +206,8 @@ def get_posts_urls_by_hashtag(keyword, limit=10, results_type="posts"):
     Returns:
         list: 帖子URL列表
     """
-    print(f"\n{'='*60}")
-    print(f"第一步：搜索标签 #{keyword}，获取 {limit} 条 {results_type} URL...")
-    print(f"{'='*60}")
+    logger.info("第一步：搜索标签 #%s，获取 %s 条 %s URL", keyword, limit, results_type)
+    client = get_apify_client()
     
     run_input = {
         "hashtags": [keyword],
@@ -207,25 +218,27 @@ def get_posts_urls_by_hashtag(keyword, limit=10, results_type="posts"):
     
     try:
         # 调用 Instagram Hashtag Scraper
-        run = client.actor("reGe1ST3OBgYZSsZJ").call(
-            run_input=run_input,
-            timeout_secs=180
-        )
+        with monitoring.track_call("apify"):
+            run = client.actor("reGe1ST3OBgYZSsZJ").call(
+                run_input=run_input,
+                timeout_secs=180
+            )
         
         # 获取结果
         urls = []
         for item in client.dataset(run["defaultDatasetId"]).iterate_items():
             if item.get('url'):
                 urls.append(item['url'])
-                print(f"  ✅ 找到: {item['url']}")
+                logger.debug("找到: %s", item['url'], extra=logconfig.SAMPLED)
         
-        print(f"\n📊 共找到 {len(urls)} 条URL")
+        logger.info("共找到 %s 条URL", len(urls))
         return urls
         
     except Exception as e:
-        print(f"  ❌ API调用失败: {e}")
+        logger.error("搜索标签失败: %s", e)
         return []
 
+@tracing.traced()
 def get_post_details(urls):
     """
     第二步：根据URL列表获取完整的帖子详情
@@ -239,9 +252,8 @@ def get_post_details(urls):
     if not urls:
         return []
     
-    print(f"\n{'='*60}")
-    print(f"第二步：获取 {len(urls)} 条帖子的完整详情...")
-    print(f"{'='*60}")
+    logger.info("第二步：获取 %s 条帖子的完整详情", len(urls))
+    client = get_apify_client()
     
     run_input = {
         "directUrls": urls,
@@ -254,26 +266,27 @@ def get_post_details(urls):
     
     try:
         # 调用 Instagram Scraper
-        run = client.actor("shu8hvrXbJbY3Eb9W").call(
-            run_input=run_input,
-            timeout_secs=180
-        )
+        with monitoring.track_call("apify"):
+            run = client.actor("shu8hvrXbJbY3Eb9W").call(
+                run_input=run_input,
+                timeout_secs=180
+            )
         
         # 获取完整数据
         posts_data = []
         for item in client.dataset(run["defaultDatasetId"]).iterate_items():
             posts_data.append(item)
-            post_type = item.get('type', 'Unknown')
-            caption = item.get('caption', '')[:50] + '...' if item.get('caption') else 'No caption'
-            print(f"  ✅ 类型: {post_type:10s} | {caption}")
+            logger.debug("类型: %s | %s", item.get('type', 'Unknown'), (item.get('caption') or '')[:50],
+                         extra=logconfig.SAMPLED)
         
-        print(f"\n📊 共获取 {len(posts_data)} 条完整帖子数据")
+        logger.info("共获取 %s 条完整帖子数据", len(posts_data))
         return posts_data
         
     except Exception as e:
-        print(f"  ❌ API调用失败: {e}")
+        logger.error("获取帖子详情失败: %s", e)
         return []
 
+@tracing.traced(attributes=("search_id",))
 def save_posts_to_db(posts, search_id):
     """
     保存帖子到数据库（与 cpostscrape.py 保持高度一致）
@@ -288,14 +301,13 @@ def save_posts_to_db(posts, search_id):
     if not posts:
         return 0
     
-    print(f"\n{'='*60}")
-    print(f"保存 {len(posts)} 条帖子到数据库...")
-    print(f"{'='*60}")
+    logger.info("保存 %s 条帖子到数据库", len(posts))
     
     conn = get_db_connection()
     cursor = conn.cursor()
     
     saved_count = 0
+    scraped_owners = set()
     
     for post in posts:
         try:
@@ -314,7 +326,7 @@ def save_posts_to_db(posts, search_id):
             
             # 下载封面图（displayUrl）
             if post.get('displayUrl'):
-                print(f"  📥 下载封面图: {post['displayUrl'][:50]}...")
+                logger.debug("下载封面图: %s", post['displayUrl'][:50], extra={"post_id": post.get('id'), **logconfig.SAMPLED})
                 display_url_base64 = download_image_to_base64(post['displayUrl'])
             
             # 处理 Sidecar 类型（多图/混合类型）
@@ -322,11 +334,12 @@ def save_posts_to_db(posts, search_id):
                 child_posts = post.get('childPosts', [])
                 has_video = False
                 
-                print(f"  处理 Sidecar 帖子，包含 {len(child_posts)} 个子帖子")
+                logger.debug("处理 Sidecar 帖子，包含 %s 个子帖子", len(child_posts), extra={"post_id": post.get('id'), **logconfig.SAMPLED})
                 
                 for idx, child in enumerate(child_posts):
                     child_type = child.get('type')
-                    print(f"    子帖子 {idx + 1}/{len(child_posts)}: 类型 = {child_type}")
+                    logger.debug("子帖子 %s/%s: 类型 = %s", idx + 1, len(child_posts), child_type,
+                                 extra={"post_id": post.get('id'), **logconfig.SAMPLED})
                     
                     if child_type == "Video":
                         has_video = True
@@ -370,13 +383,13 @@ def save_posts_to_db(posts, search_id):
                 # 如果包含视频，修改post_type为 Sidecar_video
                 if has_video:
                     post_type = "Sidecar_video"
-                    print(f"  ✅ 检测到混合类型，post_type 更改为: Sidecar_video")
+                    logger.debug("检测到混合类型，post_type 更改为: Sidecar_video", extra={"post_id": post.get('id'), **logconfig.SAMPLED})
             
             # 处理纯 Video 类型（单视频）
             elif post_type == "Video":
                 video_url = post.get('videoUrl')
                 if video_url:
-                    print(f"  📥 下载视频: {video_url[:50]}...")
+                    logger.debug("下载视频: %s", video_url[:50], extra={"post_id": post.get('id'), **logconfig.SAMPLED})
                     video_url_base64 = download_video_to_base64(video_url)
                 # 获取视频观看数和播放数
                 video_view_count = post.get('videoViewCount', 0)
@@ -503,19 +516,25 @@ def save_posts_to_db(posts, search_id):
             # 获取插入/更新后的数据库ID
             db_id = cursor.fetchone()['id']
             
+            # 同步话题标签 / 提及索引
+            sync_post_tags(cursor, db_id, post.get('hashtags', []), post.get('mentions', []),
+                           post.get('timestamp'), post.get('caption'))
+            record_snapshot(cursor, db_id, post.get('likesCount', 0), post.get('commentsCount', 0),
+                            video_view_count, video_play_count)
+            
             conn.commit()
             saved_count += 1
+            metric_store.mark_posts([db_id])
+            if post.get('ownerUsername'):
+                scraped_owners.add(post.get('ownerUsername'))
             
-            print(f"  ✅ 保存成功: {post_id} (DB ID: {db_id})")
+            logger.debug("保存成功", extra={"post_id": post_id, "post_db_id": db_id, **logconfig.SAMPLED})
             
             # 触发翻译（使用数据库ID）
-            print(f"  🌐 触发翻译: DB ID {db_id}")
             translate_post_by_id(db_id)
             
         except Exception as e:
-            print(f"  ❌ 保存失败: {post.get('id', 'Unknown')}, 错误: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("保存失败: %s", e, extra={"post_id": post.get('id', 'Unknown')})
             conn.rollback()
             continue
     
@@ -532,9 +551,19 @@ def save_posts_to_db(posts, search_id):
     cursor.close()
     conn.close()
     
-    print(f"\n✅ 成功保存 {saved_count} 条帖子")
+    # search.total_posts 已更新
+    metric_store.mark_sources()
+    responsecache.invalidate("keywords", "keyword_stats")
+    
+    # 重新计算涉及账号的爆款评分
+    if scraped_owners:
+        refresh_after_scrape(scraped_owners)
+    
+    tracing.annotate(posts=len(posts), saved=saved_count)
+    logger.info("成功保存 %s 条帖子", saved_count)
     return saved_count
 
+@tracing.traced("keyword_scrape", root=True, attributes=("keyword", "post_count", "scrape_type"))
 def scrape_by_keyword(keyword, post_count, scrape_type="posts"):
     """
     主函数：根据关键词抓取数据
@@ -547,30 +576,25 @@ def scrape_by_keyword(keyword, post_count, scrape_type="posts"):
     Returns:
         dict: 抓取结果
     """
-    print(f"\n{'='*60}")
-    print(f"开始搜索抓取")
-    print(f"关键词: {keyword}")
-    print(f"数量: {post_count}")
-    print(f"类型: {scrape_type}")
-    print(f"{'='*60}\n")
+    logger.info("开始搜索抓取: %s（数量: %s, 类型: %s）", keyword, post_count, scrape_type)
     
     try:
         # 创建或更新搜索记录
         search_id = create_or_update_search(keyword)
-        print(f"✅ 搜索标签ID: {search_id}")
+        logger.info("搜索标签ID: %s", search_id)
         
         all_posts = []
         
         # 根据类型抓取
         if scrape_type in ["posts", "both"]:
-            print(f"\n📝 抓取 posts 类型...")
+            logger.info("抓取 posts 类型")
             posts_urls = get_posts_urls_by_hashtag(keyword, post_count, "posts")
             if posts_urls:
                 posts_data = get_post_details(posts_urls)
                 all_posts.extend(posts_data)
         
         if scrape_type in ["stories", "both"]:
-            print(f"\n🎥 抓取 stories 类型...")
+            logger.info("抓取 stories 类型")
             stories_urls = get_posts_urls_by_hashtag(keyword, post_count, "stories")
             if stories_urls:
                 stories_data = get_post_details(stories_urls)
@@ -593,9 +617,7 @@ def scrape_by_keyword(keyword, post_count, scrape_type="posts"):
         }
         
     except Exception as e:
-        print(f"\n❌ 抓取失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("抓取失败: %s", e)
         return {
             "success": False,
             "message": f"抓取失败: {str(e)}"
@@ -603,6 +625,7 @@ def scrape_by_keyword(keyword, post_count, scrape_type="posts"):
 
 if __name__ == "__main__":
     # 测试
+    logconfig.setup()
     result = scrape_by_keyword("تعلم_الانجليزية", 2, "posts")
     print(f"\n最终结果: {result}")
 
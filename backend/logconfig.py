@@ -0,0 +1,198 @@
+"""
+结构化日志配置
+各模块统一使用 logging.getLogger(__name__)，应用启动时调用一次 setup()：
+- 日志记录先放入内存队列（QueueHandler），由后台线程（QueueListener）格式化并写到 stdout，
+  抓取 / 翻译线程不会阻塞在控制台输出上；队列满时丢弃并计数
+- LOG_FORMAT=json（默认）每行一个 JSON 对象，text 为便于本地阅读的单行格式
+- LOG_LEVEL 设置全局级别，LOG_LEVELS 按模块覆盖，如 "database=WARNING,ksearch=DEBUG"
+- 每条日志自动附带 job_id（当前作业的 trace id，见 tracing.py）和 log_context() 设置的关联字段
+- 逐条日志（每个帖子 / 子帖子 / 每 MB 下载进度）带 extra=SAMPLED，同一条模板每
+  LOG_SAMPLE_EVERY 条只输出 1 条；WARNING 及以上级别不采样
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import tracing
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "20"))
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# 逐条日志的标记：logger.debug("...", x, extra=logconfig.SAMPLED)
+SAMPLED = {"sampled": True}
+
+_context: contextvars.ContextVar[dict] = contextvars.ContextVar("log_context", default={})
+
+# LogRecord 自带的属性，其余属性视为 extra 字段输出
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "job_id", "context", "sampled", "sample_every",
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_NonBlockingQueueHandler"] = None
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    在代码块内的日志中附带关联字段
+
+    用法:
+        with logconfig.log_context(post_id=post_id):
+            ...
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """在产生日志的线程中读取 job_id 和关联字段（队列另一端的线程读不到 contextvars）"""
+
+    def filter(self, record):
+        record.job_id = tracing.current_trace_id()
+        record.context = _context.get()
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """带 sampled 标记的日志按模板每 N 条保留 1 条"""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sample_every = self.every
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 在调用线程中完成消息格式化，异常信息转成文本（traceback 对象不跨线程传递）
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            data["job_id"] = job_id
+        data.update(getattr(record, "context", None) or {})
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if getattr(record, "sample_every", None):
+            data["sample_every"] = record.sample_every
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = dict(getattr(record, "context", None) or {})
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            fields["job_id"] = job_id[:8]
+        fields.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS})
+        if fields:
+            line += " [" + " ".join(f"{k}={v}" for k, v in fields.items()) + "]"
+        return line
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup():
+    """配置根 logger（重复调用无副作用）"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    _handler = _NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(_SamplingFilter(SAMPLE_EVERY))
+    _handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def stats() -> dict:
+    return {
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+        "format": LOG_FORMAT,
+        "level": LOG_LEVEL,
+        "levels": _parse_levels(LOG_LEVELS),
+        "sample_every": SAMPLE_EVERY,
+    }
@@ -1,3 +1,8 @@
+# 先配置日志（队列输出、JSON 格式、按模块级别），再导入其它模块
+import logconfig
+logconfig.setup()
+
+import logging
 from fastapi import FastAPI, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -13,25 +18,32 @@ from imageanalysis import router as imageanalysis_router
 from videoanalysis import router as videoanalysis_router
 from myproject import router as myproject_router
 from apiconfig import router as apiconfig_router
+from httpclient import router as httpclient_router
+from postquery import router as postquery_router
+from trends import router as trends_router
+from viralscore import router as viral_router
+from metricstore import router as metrics_router
+import responsecache
+import changefeed
+import bootstrap
+import monitoring
+import tracing
 import threading
 import schedule
 import time
-from datetime import datetime
 
 app = FastAPI(title="社媒视频生成平台")
+logger = logging.getLogger(__name__)
 
 # 导入调度器功能
-from scheduler import daily_competitor_scrape
+from scheduler import schedule_jobs
 
 def run_scheduler():
     """在后台线程中运行调度器"""
-    print("🚀 调度器后台线程已启动")
-    print(f"⏰ 每天北京时间 16:30 执行竞品抓取任务")
-    print(f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*80}\n")
+    logger.info("调度器后台线程已启动，每天北京时间 16:30 执行竞品抓取任务")
     
-    # 设置每天 16:30 执行
-    schedule.every().day.at("16:30").do(daily_competitor_scrape)
+    # 设置每天 16:30 执行抓取，04:00 清理过期快照
+    schedule_jobs()
     
     # 持续运行
     while True:
@@ -44,7 +56,9 @@ def startup_event():
     """应用启动时的事件"""
     scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
     scheduler_thread.start()
-    print("✅ FastAPI 应用已启动，调度器后台线程已启动")
+    # 等待数据库可用后在后台执行初始化：加载 API Key、内存指标缓存，监听表变更通知
+    bootstrap.start()
+    logger.info("FastAPI 应用已启动，调度器后台线程已启动")
 
 # CORS配置
 # 支持本地开发、服务器部署和 Railway 部署
@@ -78,6 +92,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求延迟 / 响应大小指标（GET /metrics）
+app.add_middleware(monitoring.MetricsMiddleware)
+
 # 注册auth路由
 app.include_router(auth_router, prefix="/api", tags=["认证"])
 
@@ -108,6 +125,30 @@ app.include_router(myproject_router, tags=["我的项目"])
 # 注册API配置路由
 app.include_router(apiconfig_router, tags=["API配置"])
 
+# 注册外部调用统计路由
+app.include_router(httpclient_router, tags=["外部调用"])
+
+# 注册帖子组合筛选路由
+app.include_router(postquery_router, tags=["帖子筛选"])
+
+# 注册热门标签路由
+app.include_router(trends_router, tags=["热门趋势"])
+
+# 注册爆款评分路由
+app.include_router(viral_router, tags=["爆款评分"])
+
+# 注册指标汇总路由
+app.include_router(metrics_router, tags=["指标汇总"])
+
+# 注册表变更通知路由
+app.include_router(changefeed.router, tags=["变更通知"])
+
+# 注册 Prometheus 指标路由
+app.include_router(monitoring.router, tags=["监控指标"])
+
+# 注册作业链路追踪路由
+app.include_router(tracing.router, tags=["链路追踪"])
+
 class ScrapeRequest(BaseModel):
     username: str
     post_count: int
@@ -132,10 +173,13 @@ def health_check():
         # 测试数据库连接
         from database import test_connection
         db_status = "connected" if test_connection() else "disconnected"
+        # 初始化任务失败（后台仍在重试）时返回 degraded，HTTP 状态码仍为 200
+        startup = bootstrap.status()
         
         return {
-            "status": "healthy",
+            "status": "degraded" if startup["state"] == "degraded" else "healthy",
             "database": db_status,
+            "startup": startup,
             "service": "FastAPI Backend"
         }
     except Exception as e:
@@ -145,6 +189,16 @@ def health_check():
             "service": "FastAPI Backend"
         }
 
+@app.get("/api/response-cache/stats")
+def response_cache_stats():
+    """读接口响应缓存命中率统计"""
+    return {"success": True, "data": responsecache.get_stats()}
+
+@app.get("/api/logging/stats")
+def logging_stats():
+    """日志队列积压 / 丢弃数及当前日志配置"""
+    return {"success": True, "data": logconfig.stats()}
+
 @app.post("/api/scrape")
 def scrape_data(request: ScrapeRequest, background_tasks: BackgroundTasks):
     """竞品数据抓取接口"""
@@ -164,7 +218,7 @@ def scrape_data(request: ScrapeRequest, background_tasks: BackgroundTasks):
         
         # 在后台任务中执行抓取
         background_tasks.add_task(
-            scrape_competitor_data, 
+            monitoring.queued_task("scrape", scrape_competitor_data),
             request.username, 
             posts_count,
             stories_count
@@ -186,7 +240,7 @@ def search_scrape_data(request: SearchScrapeRequest, background_tasks: Backgroun
     try:
         # 在后台任务中执行抓取
         background_tasks.add_task(
-            scrape_by_keyword, 
+            monitoring.queued_task("scrape", scrape_by_keyword),
             request.keyword, 
             request.post_count,
             request.scrape_type
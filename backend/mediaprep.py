@@ -0,0 +1,324 @@
+"""
+多模态分析前的媒体预处理
+图片缩放到最长边不超过 MAX_IMAGE_EDGE 并重新编码；多图帖子可选拼接为带编号的联系表；
+长视频或大视频用 ffmpeg 生成低码率、截短的代理文件。处理结果按原始内容哈希缓存，
+并记录处理前后的字节数、估算 token 数和耗时
+"""
+import base64
+import io
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import logging
+from typing import List, Optional, Tuple
+
+from ttlcache import TTLCache
+import gemini
+
+try:
+    from PIL import Image, ImageDraw, ImageOps
+except ImportError:  # 未安装 Pillow 时图片原样发送
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 图片最长边（像素）、输出格式（JPEG / WEBP）和质量
+MAX_IMAGE_EDGE = int(os.getenv("MEDIA_MAX_IMAGE_EDGE", "1536"))
+IMAGE_FORMAT = os.getenv("MEDIA_IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("MEDIA_IMAGE_QUALITY", "85"))
+
+# 多图帖子图片数超过该值时拼接为联系表（0 表示不拼接）
+CONTACT_SHEET_THRESHOLD = int(os.getenv("MEDIA_CONTACT_SHEET_THRESHOLD", "0"))
+CONTACT_SHEET_TILE = 768
+
+# 视频超过该时长（秒）或大小（字节）时生成代理文件
+VIDEO_MAX_SECONDS = int(os.getenv("MEDIA_VIDEO_MAX_SECONDS", "90"))
+VIDEO_PROXY_MIN_BYTES = int(os.getenv("MEDIA_VIDEO_PROXY_MIN_BYTES", str(20 * 1024 * 1024)))
+VIDEO_PROXY_HEIGHT = int(os.getenv("MEDIA_VIDEO_PROXY_HEIGHT", "480"))
+FFMPEG_TIMEOUT = 300
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+
+# Gemini 计费估算：图片每个 768x768 分块 258 token（两边都不超过 384 时计 258），视频约 263 token/秒
+IMAGE_TILE_TOKENS = 258
+VIDEO_TOKENS_PER_SECOND = 263
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# 原始媒体哈希 -> (处理后的 Base64, mime_type)
+_image_cache = TTLCache(maxsize=512, ttl=6 * 3600)
+_video_cache = TTLCache(maxsize=16, ttl=6 * 3600)
+
+_stats = {
+    "images": 0, "videos": 0, "contact_sheets": 0,
+    "bytes_in": 0, "bytes_out": 0,
+    "tokens_in": 0, "tokens_out": 0,
+    "seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def settings_signature() -> str:
+    """预处理参数签名，参数变化时分析缓存随之失效（图片参数依赖 Pillow，视频参数依赖 ffmpeg）"""
+    images = (
+        f"img{MAX_IMAGE_EDGE}-{IMAGE_FORMAT}{IMAGE_QUALITY}-sheet{CONTACT_SHEET_THRESHOLD}"
+        if Image is not None else "raw"
+    )
+    videos = f"vid{VIDEO_MAX_SECONDS}-{VIDEO_PROXY_MIN_BYTES}-{VIDEO_PROXY_HEIGHT}" if FFMPEG else "vid0"
+    return f"{images}-{videos}"
+
+
+def sniff_image_mime(data: bytes) -> str:
+    """根据文件头识别图片类型（未识别时按 JPEG 处理）"""
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/jpeg"
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """估算单张图片的输入 token 数"""
+    if width <= 384 and height <= 384:
+        return IMAGE_TILE_TOKENS
+    return math.ceil(width / 768) * math.ceil(height / 768) * IMAGE_TILE_TOKENS
+
+
+def _record(kind: str, bytes_in: int, bytes_out: int, tokens_in: int, tokens_out: int, elapsed: float):
+    with _stats_lock:
+        _stats[kind] += 1
+        _stats["bytes_in"] += bytes_in
+        _stats["bytes_out"] += bytes_out
+        _stats["tokens_in"] += tokens_in
+        _stats["tokens_out"] += tokens_out
+        _stats["seconds"] += elapsed
+
+
+def _encode(image) -> bytes:
+    buffer = io.BytesIO()
+    if IMAGE_FORMAT == "JPEG":
+        image.convert("RGB").save(buffer, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+    else:
+        image.save(buffer, format=IMAGE_FORMAT, quality=IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def _open(data: bytes):
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    return image
+
+
+def prepare_image(data_base64: str) -> Tuple[str, str]:
+    """
+    缩放并重新编码单张图片
+
+    Returns:
+        (Base64, mime_type)：处理失败或未安装 Pillow 时返回原图和识别出的类型
+    """
+    digest = gemini.media_hash(data_base64)
+    cached = _image_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    data = base64.b64decode(data_base64)
+    if Image is None:
+        return data_base64, sniff_image_mime(data)
+
+    start = time.perf_counter()
+    try:
+        image = _open(data)
+        original_size = image.size
+        image.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+        encoded = _encode(image)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending original: {e}")
+        return data_base64, sniff_image_mime(data)
+
+    # 重新编码反而更大时（如已高度压缩的小图）保留原图
+    if len(encoded) >= len(data) and image.size == original_size:
+        result = (data_base64, sniff_image_mime(data))
+    else:
+        result = (base64.b64encode(encoded).decode("utf-8"), _MIME_TYPES.get(IMAGE_FORMAT, "image/jpeg"))
+
+    elapsed = time.perf_counter() - start
+    tokens_in = estimate_image_tokens(*original_size)
+    tokens_out = estimate_image_tokens(*image.size)
+    _record("images", len(data), gemini.estimate_decoded_size(result[0]), tokens_in, tokens_out, elapsed)
+    logger.info(
+        f"Image {digest[:12]}: {original_size[0]}x{original_size[1]} {len(data) / 1024:.0f} KB "
+        f"-> {image.size[0]}x{image.size[1]} {gemini.estimate_decoded_size(result[0]) / 1024:.0f} KB, "
+        f"~{tokens_in} -> ~{tokens_out} tokens, {elapsed * 1000:.0f} ms"
+    )
+
+    _image_cache.set(digest, result)
+    return result
+
+
+def build_contact_sheet(images_base64: List[str]) -> Tuple[str, str]:
+    """
+    把多张图片拼接为一张带编号的联系表（按顺序从左到右、从上到下）
+
+    Returns:
+        (Base64, mime_type)
+    """
+    digest = gemini.media_hash("".join(gemini.media_hash(b64) for b64 in images_base64))
+    cached = _image_cache.get(("sheet", digest))
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    columns = math.ceil(math.sqrt(len(images_base64)))
+    rows = math.ceil(len(images_base64) / columns)
+    tile = CONTACT_SHEET_TILE
+    sheet = Image.new("RGB", (columns * tile, rows * tile), "white")
+    draw = ImageDraw.Draw(sheet)
+
+    bytes_in, tokens_in = 0, 0
+    for idx, img_base64 in enumerate(images_base64):
+        data = base64.b64decode(img_base64)
+        bytes_in += len(data)
+        image = _open(data)
+        tokens_in += estimate_image_tokens(*image.size)
+        image.thumbnail((tile, tile), Image.LANCZOS)
+
+        x = (idx % columns) * tile + (tile - image.size[0]) // 2
+        y = (idx // columns) * tile + (tile - image.size[1]) // 2
+        sheet.paste(image.convert("RGB"), (x, y))
+
+        # 左上角标注图片序号，对应提示词中的"第N张"
+        label_x, label_y = (idx % columns) * tile, (idx // columns) * tile
+        draw.rectangle([label_x, label_y, label_x + 44, label_y + 28], fill="black")
+        draw.text((label_x + 8, label_y + 6), str(idx + 1), fill="white")
+
+    sheet.thumbnail((MAX_IMAGE_EDGE * 2, MAX_IMAGE_EDGE * 2), Image.LANCZOS)
+    encoded = _encode(sheet)
+    result = (base64.b64encode(encoded).decode("utf-8"), _MIME_TYPES.get(IMAGE_FORMAT, "image/jpeg"))
+
+    elapsed = time.perf_counter() - start
+    tokens_out = estimate_image_tokens(*sheet.size)
+    _record("contact_sheets", bytes_in, len(encoded), tokens_in, tokens_out, elapsed)
+    logger.info(
+        f"Contact sheet of {len(images_base64)} images: {bytes_in / 1024:.0f} KB -> {len(encoded) / 1024:.0f} KB, "
+        f"~{tokens_in} -> ~{tokens_out} tokens, {elapsed * 1000:.0f} ms"
+    )
+
+    _image_cache.set(("sheet", digest), result)
+    return result
+
+
+def prepare_images(images_base64: List[str]) -> List[Tuple[str, str]]:
+    """
+    处理多图帖子的全部图片（跳过空项）；数量超过 CONTACT_SHEET_THRESHOLD 时拼接为一张联系表
+
+    Returns:
+        list: [(Base64, mime_type), ...]
+    """
+    images_base64 = [b64 for b64 in images_base64 if b64]
+    if Image is not None and CONTACT_SHEET_THRESHOLD and len(images_base64) > CONTACT_SHEET_THRESHOLD:
+        try:
+            return [build_contact_sheet(images_base64)]
+        except Exception as e:
+            logger.warning(f"Contact sheet failed, sending images individually: {e}")
+    return [prepare_image(b64) for b64 in images_base64]
+
+
+def _probe_duration(path: str) -> Optional[float]:
+    if not FFPROBE:
+        return None
+    try:
+        output = subprocess.run(
+            [FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=30, check=True,
+        ).stdout.strip()
+        return float(output) if output else None
+    except Exception:
+        return None
+
+
+def prepare_video(data_base64: str) -> Tuple[str, str]:
+    """
+    长视频（超过 VIDEO_MAX_SECONDS）或大视频（超过 VIDEO_PROXY_MIN_BYTES）转为低码率代理，
+    时长截断到 VIDEO_MAX_SECONDS；未安装 ffmpeg 或转码失败时返回原视频
+
+    Returns:
+        (Base64, mime_type)
+    """
+    if not FFMPEG:
+        return data_base64, "video/mp4"
+
+    digest = gemini.media_hash(data_base64)
+    cached = _video_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "source.mp4")
+        proxy = os.path.join(workdir, "proxy.mp4")
+        with open(source, "wb") as f:
+            f.write(base64.b64decode(data_base64))
+        size_in = os.path.getsize(source)
+
+        duration = _probe_duration(source)
+        if size_in <= VIDEO_PROXY_MIN_BYTES and (duration is None or duration <= VIDEO_MAX_SECONDS):
+            result = (data_base64, "video/mp4")
+            _video_cache.set(digest, result)
+            return result
+
+        try:
+            subprocess.run(
+                [
+                    FFMPEG, "-y", "-v", "error", "-i", source,
+                    "-t", str(VIDEO_MAX_SECONDS),
+                    "-vf", f"scale=-2:'min({VIDEO_PROXY_HEIGHT},ih)'",
+                    "-c:v", "libx264", "-preset", "veryfast", "-crf", "32",
+                    "-c:a", "aac", "-b:a", "64k", "-ac", "1",
+                    "-movflags", "+faststart",
+                    proxy,
+                ],
+                capture_output=True, timeout=FFMPEG_TIMEOUT, check=True,
+            )
+            with open(proxy, "rb") as f:
+                encoded = f.read()
+        except Exception as e:
+            logger.warning(f"Video proxy failed, sending original: {e}")
+            return data_base64, "video/mp4"
+
+    elapsed = time.perf_counter() - start
+    seconds_in = duration or 0
+    seconds_out = min(seconds_in, VIDEO_MAX_SECONDS)
+    tokens_in = int(seconds_in * VIDEO_TOKENS_PER_SECOND)
+    tokens_out = int(seconds_out * VIDEO_TOKENS_PER_SECOND)
+    _record("videos", size_in, len(encoded), tokens_in, tokens_out, elapsed)
+    logger.info(
+        f"Video {digest[:12]}: {seconds_in:.0f}s {size_in / 1024 / 1024:.1f} MB -> "
+        f"{seconds_out:.0f}s {len(encoded) / 1024 / 1024:.1f} MB, ~{tokens_in} -> ~{tokens_out} tokens, "
+        f"{elapsed:.1f}s"
+    )
+
+    result = (base64.b64encode(encoded).decode("utf-8"), "video/mp4")
+    _video_cache.set(digest, result)
+    return result
+
+
+def get_stats() -> dict:
+    """预处理统计：处理前后的字节数、估算 token 数与耗时"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["seconds"] = round(stats["seconds"], 2)
+    stats["bytes_saved_ratio"] = round(1 - stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else 0
+    stats["tokens_saved_ratio"] = round(1 - stats["tokens_out"] / stats["tokens_in"], 4) if stats["tokens_in"] else 0
+    stats["pillow"] = Image is not None
+    stats["ffmpeg"] = bool(FFMPEG)
+    stats["settings"] = settings_signature()
+    return stats
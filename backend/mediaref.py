@@ -0,0 +1,57 @@
+"""
+mypostl 源素材引用
+从 popular 创建项目时只记录 source_popular_id，不再复制 base64 素材；
+读取时 mypostl 自身的素材列优先（用户替换过的素材），为空时回退到 popular 源记录（写时复制）。
+popular 源记录的素材被修改或删除前，触发器会先把素材物化到引用它的 mypostl 行（见 init_db.py）
+"""
+
+# 各类型从 popular 继承的素材列
+INHERITED_FIELDS = {
+    "Image": ("display_url_base64", "video_url_base64", "images_base64"),
+    "Sidecar": ("video_url_base64", "images_base64"),
+    "Video": ("display_url_base64", "video_url_base64"),
+}
+
+# popular 中 display_url_base64 / video_url_base64 是 JSONB 字符串，mypostl 中是 TEXT
+_SOURCE_EXPRESSIONS = {
+    "display_url_base64": "src.display_url_base64 #>> '{}'",
+    "video_url_base64": "src.video_url_base64 #>> '{}'",
+    "images_base64": "src.images_base64",
+}
+
+
+def media_columns(table: str = "mypostl") -> str:
+    """
+    生成读取 mypostl 素材列的 SQL 片段（自身值优先，为空时取 popular 源记录）
+    使用相关子查询而不是 JOIN，因此同样可以用在 UPDATE ... RETURNING 中
+
+    Args:
+        table: mypostl 在查询中的表名或别名
+
+    Returns:
+        str: display_url_base64, video_url_base64, images_base64 三列
+    """
+    columns = []
+    for field, source in _SOURCE_EXPRESSIONS.items():
+        post_types = ", ".join(f"'{t}'" for t, fields in INHERITED_FIELDS.items() if field in fields)
+        columns.append(
+            f"COALESCE({table}.{field}, (SELECT {source} FROM popular src "
+            f"WHERE src.id = {table}.source_popular_id AND {table}.post_type IN ({post_types}))) AS {field}"
+        )
+    return ",\n".join(columns)
+
+
+MEDIA_COLUMNS = media_columns()
+
+
+def reset_inherited_sql(post_type: str) -> str:
+    """
+    生成重新继承时清空自身素材列的 SET 片段（清空后读取回退到 popular 源记录）
+
+    Args:
+        post_type: 帖子类型
+
+    Returns:
+        str: 形如 "display_url_base64 = NULL, video_url_base64 = NULL" 的 SQL 片段
+    """
+    return ", ".join(f"{field} = NULL" for field in INHERITED_FIELDS[post_type])
@@ -0,0 +1,486 @@
+"""
+Metric Store Module
+Columnar in-memory table of numeric post metrics (NumPy structured arrays) so stats
+and analytics endpoints aggregate without touching post_data rows (which carry
+base64 media). Loaded at startup, then kept current through change notifications:
+save/delete paths mark the rows they touched, and a background watermark check picks
+up writes made by other workers.
+"""
+from fastapi import APIRouter, HTTPException
+from typing import Dict, Iterable, List, Optional
+import logging
+import os
+import threading
+import time
+import numpy as np
+from database import get_db_connection
+import bootstrap
+import changefeed
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+# How often the post_data / competitor / search watermark is checked (seconds)
+POLL_SECONDS = int(os.getenv("METRICS_POLL_SECONDS", "30"))
+# The watermark check re-reads posts updated this far behind the last watermark: updated_at is
+# the transaction start time, so a long scrape transaction can commit rows older than the watermark
+WATERMARK_OVERLAP_SECONDS = int(os.getenv("METRICS_WATERMARK_OVERLAP_SECONDS", "3600"))
+# Full reload interval (seconds)
+FULL_RELOAD_SECONDS = int(os.getenv("METRICS_FULL_RELOAD_SECONDS", str(6 * 3600)))
+
+POST_TYPES = ["Image", "Video", "Sidecar", "Sidecar_video"]
+OTHER_TYPE = len(POST_TYPES)
+
+POST_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("owner", np.int32),
+    ("competitor_id", np.int32),  # -1 for keyword posts
+    ("search_id", np.int32),      # -1 for competitor posts
+    ("type", np.int8),
+    ("ts", np.float64),           # epoch seconds, NaN when unknown
+    ("likes", np.int64),
+    ("comments", np.int64),
+    ("views", np.int64),
+])
+
+COMPETITOR_DTYPE = np.dtype([
+    ("id", np.int32),
+    ("followers", np.float64),    # NaN when NULL (ignored by averages, like AVG())
+    ("posts_count", np.float64),
+])
+
+SEARCH_DTYPE = np.dtype([
+    ("id", np.int32),
+    ("total_posts", np.float64),
+])
+
+POST_QUERY = '''
+    SELECT id, owner_username,
+           COALESCE(competitor_id, -1) AS competitor_id,
+           COALESCE(search_id, -1) AS search_id,
+           post_type,
+           EXTRACT(EPOCH FROM "timestamp") AS ts,
+           COALESCE(likes_count, 0) AS likes,
+           COALESCE(comments_count, 0) AS comments,
+           GREATEST(COALESCE(video_view_count, 0), COALESCE(video_play_count, 0)) AS views
+    FROM post_data
+'''
+
+WATERMARK_QUERY = '''
+    SELECT
+        (SELECT MAX(updated_at) FROM post_data) AS post_watermark,
+        (SELECT COUNT(*) FROM post_data) AS post_count,
+        (SELECT COUNT(*) || ':' || COALESCE(MAX(updated_at)::text, '') FROM competitor) AS competitor_version,
+        (SELECT COUNT(*) || ':' || COALESCE(MAX(updated_at)::text, '') FROM search) AS search_version
+'''
+
+
+class MetricStore:
+    """
+    In-memory post metrics
+
+    posts is one structured array (one record per post, unordered); competitors and
+    searches are small structured arrays of their numeric columns. Writers call
+    mark_posts / mark_sources / drop_source; pending changes are applied on the
+    next read by re-selecting only the marked rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self.owners: Dict[str, int] = {}
+        self.owner_names: List[str] = []
+        self.posts = np.empty(0, dtype=POST_DTYPE)
+        self.competitors = np.empty(0, dtype=COMPETITOR_DTYPE)
+        self.searches = np.empty(0, dtype=SEARCH_DTYPE)
+
+        self._pending_posts = set()
+        self._sources_dirty = False
+        self._recent: Dict[int, object] = {}  # id -> updated_at of posts inside the overlap window
+        self.watermark = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.applied_at = 0.0
+        self.version = 0
+        self._results: Dict[tuple, dict] = {}
+        self._results_version = -1
+
+    # ---------- change notifications ----------
+
+    def mark_posts(self, post_ids: Iterable[int]):
+        """Posts inserted, updated or deleted (re-selected on the next read)"""
+        with self._lock:
+            self._pending_posts.update(int(i) for i in post_ids if i is not None)
+
+    def mark_sources(self):
+        """competitor / search rows changed"""
+        self._sources_dirty = True
+
+    def drop_source(self, competitor_id: Optional[int] = None, search_id: Optional[int] = None):
+        """A competitor / keyword was deleted; its posts went with it (ON DELETE CASCADE)"""
+        with self._lock:
+            if competitor_id is not None:
+                self.posts = self.posts[self.posts["competitor_id"] != competitor_id]
+            if search_id is not None:
+                self.posts = self.posts[self.posts["search_id"] != search_id]
+            self._sources_dirty = True
+            self.version += 1
+
+    # ---------- loading ----------
+
+    def _owner_code(self, username: Optional[str]) -> int:
+        username = username or ""
+        code = self.owners.get(username)
+        if code is None:
+            code = self.owners[username] = len(self.owner_names)
+            self.owner_names.append(username)
+        return code
+
+    def _to_array(self, rows) -> np.ndarray:
+        n = len(rows)
+        type_codes = {t: i for i, t in enumerate(POST_TYPES)}
+        posts = np.empty(n, dtype=POST_DTYPE)
+        posts["id"] = np.fromiter((r['id'] for r in rows), dtype=np.int64, count=n)
+        posts["owner"] = np.fromiter((self._owner_code(r['owner_username']) for r in rows), dtype=np.int32, count=n)
+        posts["competitor_id"] = np.fromiter((r['competitor_id'] for r in rows), dtype=np.int32, count=n)
+        posts["search_id"] = np.fromiter((r['search_id'] for r in rows), dtype=np.int32, count=n)
+        posts["type"] = np.fromiter((type_codes.get(r['post_type'], OTHER_TYPE) for r in rows), dtype=np.int8, count=n)
+        posts["ts"] = np.fromiter((np.nan if r['ts'] is None else float(r['ts']) for r in rows), dtype=np.float64, count=n)
+        posts["likes"] = np.fromiter((r['likes'] for r in rows), dtype=np.int64, count=n)
+        posts["comments"] = np.fromiter((r['comments'] for r in rows), dtype=np.int64, count=n)
+        posts["views"] = np.fromiter((r['views'] for r in rows), dtype=np.int64, count=n)
+        return posts
+
+    @staticmethod
+    def _load_sources(cursor):
+        cursor.execute("SELECT id, followers_count, posts_count FROM competitor")
+        competitors = np.array([
+            (r['id'],
+             np.nan if r['followers_count'] is None else r['followers_count'],
+             np.nan if r['posts_count'] is None else r['posts_count'])
+            for r in cursor.fetchall()
+        ], dtype=COMPETITOR_DTYPE)
+        cursor.execute("SELECT id, total_posts FROM search")
+        searches = np.array([
+            (r['id'], np.nan if r['total_posts'] is None else r['total_posts'])
+            for r in cursor.fetchall()
+        ], dtype=SEARCH_DTYPE)
+        return competitors, searches
+
+    def load(self):
+        """
+        Full load (startup, periodic reload, or rows deleted by another worker)
+        """
+        with self._loading:
+            start = time.perf_counter()
+            with self._lock:
+                # Changes marked after this point are applied on top of the loaded rows
+                covered = set(self._pending_posts)
+                self._sources_dirty = False
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(WATERMARK_QUERY)
+                watermark = dict(cursor.fetchone())
+                cursor.execute(POST_QUERY)
+                rows = cursor.fetchall()
+                competitors, searches = self._load_sources(cursor)
+                cursor.close()
+            finally:
+                conn.close()
+
+            with self._lock:
+                self.owners, self.owner_names = {}, []
+                self.posts = self._to_array(rows)
+                self.competitors, self.searches = competitors, searches
+                self._pending_posts -= covered
+                self.watermark = watermark
+                self.loaded_at = self.checked_at = self.applied_at = time.time()
+                self.version += 1
+            logger.info("Metric store loaded: %s posts in %.0f ms", len(rows), (time.perf_counter() - start) * 1000)
+
+    def _apply_pending(self):
+        """Re-select marked posts (missing ones were deleted) and reload dirty source tables"""
+        with self._lock:
+            pending = self._pending_posts
+            self._pending_posts = set()
+            sources_dirty = self._sources_dirty
+            self._sources_dirty = False
+        if not pending and not sources_dirty:
+            return
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            rows = []
+            if pending:
+                cursor.execute(POST_QUERY + " WHERE id = ANY(%s)", (list(pending),))
+                rows = cursor.fetchall()
+            sources = self._load_sources(cursor) if sources_dirty else None
+            cursor.close()
+        finally:
+            conn.close()
+
+        with self._lock:
+            if pending:
+                changed = np.fromiter(pending, dtype=np.int64, count=len(pending))
+                keep = ~np.isin(self.posts["id"], changed)
+                self.posts = np.concatenate([self.posts[keep], self._to_array(rows)])
+            if sources is not None:
+                self.competitors, self.searches = sources
+            self.applied_at = time.time()
+            self.version += 1
+
+    def _check_watermark(self):
+        """Pick up writes made by other workers (background thread)"""
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(WATERMARK_QUERY)
+                watermark = dict(cursor.fetchone())
+                new_posts = []
+                if self.watermark['post_watermark'] is not None:
+                    # Overlap window; rows whose updated_at was already seen are skipped
+                    cursor.execute(
+                        "SELECT id, updated_at FROM post_data WHERE updated_at > %s - make_interval(secs => %s)",
+                        (self.watermark['post_watermark'], WATERMARK_OVERLAP_SECONDS))
+                    recent = {r['id']: r['updated_at'] for r in cursor.fetchall()}
+                    new_posts = [i for i, updated_at in recent.items() if self._recent.get(i) != updated_at]
+                    self._recent = recent
+                elif watermark['post_watermark'] is not None:
+                    cursor.execute("SELECT id FROM post_data")
+                    new_posts = [r['id'] for r in cursor.fetchall()]
+                cursor.close()
+            finally:
+                conn.close()
+
+            self.mark_posts(new_posts)
+            for key in ('competitor_version', 'search_version'):
+                if watermark[key] != self.watermark[key]:
+                    self.mark_sources()
+            self._apply_pending()
+
+            with self._lock:
+                # Deletes leave no watermark: fall back to a full reload when counts disagree
+                count_mismatch = len(self.posts) != watermark['post_count']
+                self.watermark = watermark
+            if count_mismatch or time.time() - self.loaded_at > FULL_RELOAD_SECONDS:
+                self.load()
+        except Exception as e:
+            logger.error("Metric store refresh failed: %s", e)
+
+    def sync(self):
+        """
+        Called before every read: load on first use, apply local change notifications,
+        and start a background watermark check at most every POLL_SECONDS (while no
+        change listener is connected)
+        """
+        if self.loaded_at == 0:
+            if self._loading.locked():
+                # Startup load in progress: wait for it rather than loading twice
+                with self._loading:
+                    pass
+            if self.loaded_at == 0:
+                self.load()
+        if self._pending_posts or self._sources_dirty:
+            self._apply_pending()
+        # With the change listener connected the watermark check only drives the periodic full reload
+        interval = FULL_RELOAD_SECONDS if changefeed.listener.connected else POLL_SECONDS
+        if time.time() - self.checked_at >= interval and not self._loading.locked():
+            self.checked_at = time.time()
+            threading.Thread(target=self._check_watermark, daemon=True).start()
+
+    # ---------- aggregation ----------
+
+    def _memo(self, key: tuple, compute) -> dict:
+        """Aggregates are reused until the next change is applied"""
+        self.sync()
+        with self._lock:
+            if self._results_version != self.version:
+                self._results, self._results_version = {}, self.version
+            cached = self._results.get(key)
+            if cached is not None:
+                return cached
+            version = self.version
+            result = compute()
+            if version == self.version:
+                self._results[key] = result
+            return result
+
+    @staticmethod
+    def _nanmean(values: np.ndarray) -> float:
+        values = values[~np.isnan(values)]
+        return float(values.mean()) if len(values) else 0.0
+
+    @staticmethod
+    def _post_metrics(posts: np.ndarray) -> dict:
+        n = len(posts)
+        if n == 0:
+            return {"total_posts": 0, "avg_likes": 0, "avg_comments": 0, "avg_views": 0}
+        return {
+            "total_posts": n,
+            "avg_likes": round(float(posts["likes"].mean()), 0),
+            "avg_comments": round(float(posts["comments"].mean()), 0),
+            "avg_views": round(float(posts["views"].mean()), 0),
+        }
+
+    def competitor_stats(self) -> dict:
+        return self._memo(("competitors",), self._competitor_stats)
+
+    def _competitor_stats(self) -> dict:
+        competitors = self.competitors
+        posts = self.posts[self.posts["competitor_id"] >= 0]
+        return {
+            "total_competitors": int(len(competitors)),
+            "avg_followers": round(self._nanmean(competitors["followers"]), 0),
+            "avg_posts": round(self._nanmean(competitors["posts_count"]), 0),
+            **self._post_metrics(posts),
+        }
+
+    def search_stats(self) -> dict:
+        return self._memo(("searches",), self._search_stats)
+
+    def _search_stats(self) -> dict:
+        searches = self.searches
+        posts = self.posts[self.posts["search_id"] >= 0]
+        total_posts = searches["total_posts"]
+        return {
+            "total_keywords": int(len(searches)),
+            "total_posts": int(np.nansum(total_posts)),
+            "avg_posts_per_keyword": round(self._nanmean(total_posts), 0),
+            "stored_posts": int(len(posts)),
+            "avg_likes": self._post_metrics(posts)["avg_likes"],
+        }
+
+    def summary(self, owner: Optional[str] = None, competitor_id: Optional[int] = None,
+                search_id: Optional[int] = None, post_type: Optional[str] = None,
+                days: Optional[int] = None) -> dict:
+        """
+        Aggregate metrics for any slice of posts: totals, averages, medians,
+        per-type counts and posts per day
+        """
+        key = ("summary", owner, competitor_id, search_id, post_type, days)
+        return self._memo(key, lambda: self._summary(owner, competitor_id, search_id, post_type, days))
+
+    def _summary(self, owner, competitor_id, search_id, post_type, days) -> dict:
+        posts = self.posts
+        owner_code = self.owners.get(owner) if owner is not None else None
+
+        mask = np.ones(len(posts), dtype=bool)
+        if owner is not None:
+            mask &= posts["owner"] == (owner_code if owner_code is not None else -1)
+        if competitor_id is not None:
+            mask &= posts["competitor_id"] == competitor_id
+        if search_id is not None:
+            mask &= posts["search_id"] == search_id
+        if post_type and post_type != "all":
+            code = POST_TYPES.index(post_type) if post_type in POST_TYPES else OTHER_TYPE
+            mask &= posts["type"] == code
+        if days:
+            mask &= posts["ts"] >= time.time() - days * DAY
+        selected = posts[mask]
+
+        result = self._post_metrics(selected)
+        if len(selected):
+            result.update({
+                "total_likes": int(selected["likes"].sum()),
+                "total_comments": int(selected["comments"].sum()),
+                "total_views": int(selected["views"].sum()),
+                "median_likes": float(np.median(selected["likes"])),
+                "median_comments": float(np.median(selected["comments"])),
+                "p90_likes": float(np.percentile(selected["likes"], 90)),
+            })
+        type_counts = np.bincount(selected["type"], minlength=OTHER_TYPE + 1)
+        result["post_type"] = {t: int(type_counts[i]) for i, t in enumerate(POST_TYPES) if type_counts[i]}
+
+        timestamps = selected["ts"][~np.isnan(selected["ts"])]
+        if days and len(timestamps):
+            day_index = ((timestamps - (time.time() - days * DAY)) // DAY).astype(np.int64)
+            result["posts_per_day"] = np.bincount(np.clip(day_index, 0, days - 1), minlength=days).tolist()
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "posts": int(len(self.posts)),
+            "owners": len(self.owner_names),
+            "competitors": int(len(self.competitors)),
+            "searches": int(len(self.searches)),
+            "memory_bytes": int(self.posts.nbytes + self.competitors.nbytes + self.searches.nbytes),
+            "pending_posts": len(self._pending_posts),
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "applied_at": self.applied_at,
+        }
+
+
+store = MetricStore()
+
+
+def _on_posts_changed(changes: changefeed.TableChanges):
+    if changes.resync:
+        # Notifications were missed: let the next read run a watermark check
+        store.checked_at = 0
+        return
+    store.mark_posts(changes.ids)
+
+
+changefeed.subscribe("post_data", _on_posts_changed)
+changefeed.subscribe("competitor", lambda changes: store.mark_sources())
+changefeed.subscribe("search", lambda changes: store.mark_sources())
+
+# Initial load runs once the database is reachable (see bootstrap.py)
+bootstrap.register("metric_store", store.load)
+
+
+# ============================================
+# API Endpoints
+# ============================================
+
+@router.get("/summary")
+def get_metrics_summary(
+    owner: Optional[str] = None,
+    competitor_id: Optional[int] = None,
+    search_id: Optional[int] = None,
+    post_type: Optional[str] = None,
+    days: Optional[int] = None,
+):
+    """
+    Post metric aggregates for any combination of owner, competitor, keyword,
+    post type and recent days
+    """
+    if days is not None and (days < 1 or days > 3650):
+        raise HTTPException(status_code=400, detail="days must be between 1 and 3650")
+
+    try:
+        start = time.perf_counter()
+        data = store.summary(owner, competitor_id, search_id, post_type, days)
+        return {
+            "success": True,
+            "data": data,
+            "meta": {"elapsed_ms": round((time.perf_counter() - start) * 1000, 3), "version": store.version},
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取指标汇总失败: {str(e)}")
+
+
+@router.post("/reload")
+def reload_metric_store():
+    """
+    Force a full reload
+    """
+    try:
+        store.load()
+        return {"success": True, "data": store.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"重新加载指标缓存失败: {str(e)}")
+
+
+@router.get("/stats")
+def get_metric_store_stats():
+    """
+    Metric store state
+    """
+    return {"success": True, "data": store.stats()}
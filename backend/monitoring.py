@@ -0,0 +1,308 @@
+"""
+Prometheus 指标
+进程内维护计数器 / 仪表 / 直方图，GET /metrics 以 Prometheus 文本格式输出。
+埋点位于各调用汇合处：ASGI 中间件（按路由模板统计延迟和响应大小）、get_db_connection
+（连接与查询）、httpclient / Apify / Gemini 外部调用、抓取 / 翻译 / 分析队列深度、定时任务耗时。
+多 worker 部署时每个进程各自计数，Prometheus 按实例分别抓取
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter(tags=["metrics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 直方图桶上界
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        """(样本名, 标签名, 标签值, 数值)"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self.labels, key, value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, label_names, label_values, value in self.samples():
+            lines.append(f"{name}{_format_labels(label_names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][idx] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        bucket_labels = self.labels + ("le",)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket", bucket_labels, key + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labels, key, total
+            yield f"{self.name}_count", self.labels, key, count
+
+
+def render() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============================================
+# 指标定义
+# ============================================
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"))
+HTTP_RESPONSE_BYTES = Histogram(
+    "http_response_size_bytes", "HTTP response body size by route template",
+    ("method", "route"), buckets=SIZE_BUCKETS)
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being served")
+
+DB_CONNECT_SECONDS = Histogram("db_connect_duration_seconds", "Time to open a database connection")
+DB_CONNECT_ERRORS = Counter("db_connect_errors_total", "Failed database connection attempts")
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Database statement latency by statement type", ("statement",))
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Failed database statements", ("statement",))
+
+OUTBOUND_SECONDS = Histogram(
+    "outbound_request_duration_seconds", "External provider call latency", ("provider",))
+OUTBOUND_REQUESTS = Counter(
+    "outbound_requests_total", "External provider calls by outcome (HTTP status, timeout, error, ok)",
+    ("provider", "outcome"))
+
+QUEUE_DEPTH = Gauge("queue_depth", "Queued plus running jobs (scrape, translation, gemini, image_generation)",
+                    ("queue",))
+
+JOB_SECONDS = Histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time", ("job", "outcome"),
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 14400))
+JOB_LAST_RUN = Gauge("scheduler_job_last_run_timestamp_seconds", "Unix time the job last finished", ("job",))
+
+
+# ============================================
+# 埋点工具
+# ============================================
+
+_STATEMENTS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "ALTER", "LISTEN"}
+
+
+def statement_type(query) -> str:
+    """SQL 的语句类型（作为低基数标签）"""
+    if isinstance(query, bytes):
+        query = query[:256].decode("utf-8", "ignore")
+    elif not isinstance(query, str):
+        return "OTHER"
+    word = query[:256].lstrip(" \t\r\n(").split(None, 1)[:1]
+    word = word[0].upper() if word else ""
+    return word if word in _STATEMENTS else "OTHER"
+
+
+def observe_outbound(provider: str, elapsed: float, outcome: str):
+    """记录一次外部调用（httpclient 与 track_call 共用）"""
+    OUTBOUND_SECONDS.observe(elapsed, provider=provider)
+    OUTBOUND_REQUESTS.inc(provider=provider, outcome=outcome)
+
+
+@contextmanager
+def track_call(provider: str):
+    """
+    统计不经过 httpclient 的外部调用（Apify SDK、Gemini SDK）
+
+    用法:
+        with monitoring.track_call("apify"):
+            run = client.actor(...).call(...)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        observe_outbound(provider, time.perf_counter() - start, "error")
+        raise
+    observe_outbound(provider, time.perf_counter() - start, "ok")
+
+
+@contextmanager
+def queued(queue: str):
+    """排队 + 执行期间计入队列深度"""
+    QUEUE_DEPTH.inc(queue=queue)
+    try:
+        yield
+    finally:
+        QUEUE_DEPTH.dec(queue=queue)
+
+
+def queued_task(queue: str, func: Callable) -> Callable:
+    """
+    后台任务入队时立即计入队列深度，任务执行结束后移出
+
+    用法:
+        background_tasks.add_task(monitoring.queued_task("scrape", scrape_competitor_data), ...)
+    """
+    QUEUE_DEPTH.inc(queue=queue)
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            QUEUE_DEPTH.dec(queue=queue)
+
+    return run
+
+
+def scheduled_job(name: str):
+    """
+    定时任务装饰器：记录耗时、结果和最近一次完成时间
+    任务抛出异常或返回 False 时记为 error（定时任务通常自行捕获异常，以免中断调度循环）
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "error" if result is False else "ok"
+                return result
+            finally:
+                JOB_SECONDS.observe(time.perf_counter() - start, job=name, outcome=outcome)
+                JOB_LAST_RUN.set(time.time(), job=name)
+        return run
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    ASGI 中间件：按路由模板（如 /api/posts/{post_id}）统计延迟、状态码和响应体大小
+    （流式响应按实际发送的字节数统计）
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+        size = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                         method=method, route=route, status=str(status[0]))
+            HTTP_RESPONSE_BYTES.observe(size[0], method=method, route=route)
+
+
+# ============================================
+# API Endpoints
+# ============================================
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus 抓取端点"""
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
@@ -8,6 +8,7 @@ from pydantic import BaseModel
 from datetime import datetime
 from psycopg2.extras import RealDictCursor
 from database import get_db_connection
+import mediaref
 
 router = APIRouter(prefix="/api/my-projects", tags=["my-projects"])
 
@@ -309,10 +310,10 @@ async def get_my_projects(user_id: int):
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             # 查询 Image、Sidecar 和 Video 类型的项目
-            cur.execute("""
+            cur.execute(f"""
                 SELECT 
                     id, user_id, post_id, 
-                    display_url_base64, images_base64, video_url_base64,
+                    {mediaref.MEDIA_COLUMNS},
                     new_display_url_base64, new_images_base64, new_video_url_base64,
                     jianyi1, jianyi2, jianyi3, jianyi4,
                     post_type, prompt, prompt_array,
@@ -406,10 +407,10 @@ async def get_project_detail(project_id: int, user_id: int):
     
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
+            cur.execute(f"""
                 SELECT 
                     id, user_id, post_id, 
-                    display_url_base64, images_base64, video_url_base64,
+                    {mediaref.MEDIA_COLUMNS},
                     new_display_url_base64, new_images_base64, new_video_url_base64,
                     jianyi1, jianyi2, jianyi3, jianyi4,
                     post_type, prompt, prompt_array,
@@ -0,0 +1,116 @@
+"""
+帖子列表游标分页（keyset pagination）
+按 ("timestamp" DESC NULLS LAST, id DESC) 排序，游标记录上一页最后一条的 (timestamp, id)，
+下一页直接从索引位置继续读取，不再使用 OFFSET 逐页跳过；总数按查询条件缓存，避免每页重复 COUNT(*)
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from ttlcache import TTLCache
+
+# 总数缓存有效期（秒），列表总数允许短时间内不精确
+COUNT_CACHE_TTL = int(os.getenv("POST_COUNT_CACHE_TTL", "60"))
+
+_counts = TTLCache(maxsize=1024, ttl=COUNT_CACHE_TTL)
+
+ORDER_BY = ' ORDER BY "timestamp" DESC NULLS LAST, id DESC'
+
+
+def encode_cursor(timestamp: Optional[datetime], row_id: int) -> str:
+    """把最后一条记录的 (timestamp, id) 编码为游标字符串"""
+    payload = json.dumps([timestamp.isoformat() if timestamp else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """
+    解析游标字符串
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return (datetime.fromisoformat(timestamp) if timestamp else None), int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def fetch_page(cursor, query: str, params: list, page_size: int, after: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    读取一页数据
+
+    有 timestamp 的记录与 timestamp 为空的记录分两段读取，每段都是索引上的连续范围扫描：
+    先读 ("timestamp", id) < 游标 的记录，不足一页时再从 timestamp 为空的记录中补齐。
+
+    Args:
+        cursor: 数据库游标
+        query: 不含排序和分页的查询（以 WHERE 条件结尾）
+        params: 查询参数
+        page_size: 每页数量
+        after: 上一页返回的 next_cursor，为空时读取第一页
+
+    Returns:
+        Tuple[List[dict], Optional[str]]: (本页数据, 下一页游标，没有更多数据时为 None)
+    """
+    timestamp, row_id = decode_cursor(after) if after else (None, None)
+    limit = page_size + 1
+    rows = []
+
+    # 第一段：timestamp 非空（游标已进入空值段时跳过）
+    if after is None or timestamp is not None:
+        segment = query + ' AND "timestamp" IS NOT NULL'
+        segment_params = list(params)
+        if after is not None:
+            segment += ' AND ("timestamp", id) < (%s, %s)'
+            segment_params.extend([timestamp, row_id])
+        cursor.execute(segment + ORDER_BY + " LIMIT %s", segment_params + [limit])
+        rows = cursor.fetchall()
+
+    # 第二段：timestamp 为空
+    if len(rows) < limit:
+        segment = query + ' AND "timestamp" IS NULL'
+        segment_params = list(params)
+        if after is not None and timestamp is None:
+            segment += " AND id < %s"
+            segment_params.append(row_id)
+        cursor.execute(segment + ORDER_BY + " LIMIT %s", segment_params + [limit - len(rows)])
+        rows = list(rows) + cursor.fetchall()
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, encode_cursor(last['timestamp'], last['id'])
+    return rows, None
+
+
+def cached_count(cursor, key: tuple, query: str, params: list) -> int:
+    """
+    按查询条件缓存总数
+
+    Args:
+        cursor: 数据库游标
+        key: 缓存键（如 ("competitor", username, post_type)）
+        query: COUNT 查询，结果列名为 total
+        params: 查询参数
+    """
+    total = _counts.get(key)
+    if total is None:
+        cursor.execute(query, params)
+        total = cursor.fetchone()['total']
+        _counts.set(key, total)
+    return total
+
+
+def invalidate_counts():
+    """清空总数缓存（抓取写入新帖子后调用）"""
+    _counts.clear()
+
+
+def get_stats() -> dict:
+    """总数缓存统计"""
+    return {"ttl_seconds": COUNT_CACHE_TTL, "counts": _counts.stats()}
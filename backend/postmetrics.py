@@ -0,0 +1,77 @@
+"""
+帖子互动数据快照
+每次抓取入库时记录一次点赞 / 评论 / 播放数，趋势计算据此得到窗口内的互动增长
+（post_data 中只保留最新值，无法得知增长速度）。互动数与上一条快照相同时不重复记录；
+超过 SNAPSHOT_RETENTION_DAYS 天的快照由定时任务清理（每个帖子保留最新一条）
+"""
+import logging
+import os
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# 快照保留天数，默认与趋势计算的回看窗口（TRENDS_LOOKBACK_DAYS）一致
+SNAPSHOT_RETENTION_DAYS = int(os.getenv("SNAPSHOT_RETENTION_DAYS", os.getenv("TRENDS_LOOKBACK_DAYS", "30")))
+
+
+def record_snapshot(cursor, post_data_id: int, likes_count, comments_count, video_view_count=0, video_play_count=0):
+    """
+    记录一条互动数据快照（与该帖子最新一条快照相同时跳过；调用方提交事务）
+
+    Args:
+        cursor: 数据库游标
+        post_data_id: post_data.id
+        likes_count: 点赞数
+        comments_count: 评论数
+        video_view_count: 视频观看数
+        video_play_count: 视频播放数
+    """
+    cursor.execute('''
+        INSERT INTO post_metric_snapshot (post_data_id, likes_count, comments_count, views_count)
+        SELECT %(post)s, %(likes)s, %(comments)s, %(views)s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM (
+                SELECT likes_count, comments_count, views_count
+                FROM post_metric_snapshot
+                WHERE post_data_id = %(post)s
+                ORDER BY captured_at DESC
+                LIMIT 1
+            ) latest
+            WHERE latest.likes_count = %(likes)s
+              AND latest.comments_count = %(comments)s
+              AND latest.views_count = %(views)s
+        )
+    ''', {
+        "post": post_data_id,
+        "likes": likes_count or 0,
+        "comments": comments_count or 0,
+        "views": max(video_view_count or 0, video_play_count or 0),
+    })
+
+
+def purge_snapshots(retention_days: int = SNAPSHOT_RETENTION_DAYS) -> int:
+    """
+    删除超过保留期的快照（每个帖子的最新一条始终保留，作为之后增长的基线）
+
+    Returns:
+        int: 删除的快照数
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM post_metric_snapshot s
+            WHERE s.captured_at < (NOW() AT TIME ZONE 'UTC') - make_interval(days => %s)
+              AND EXISTS (
+                  SELECT 1 FROM post_metric_snapshot n
+                  WHERE n.post_data_id = s.post_data_id AND n.captured_at > s.captured_at
+              )
+        ''', (retention_days,))
+        deleted = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    logger.info("Purged %s metric snapshots older than %s days", deleted, retention_days)
+    return deleted
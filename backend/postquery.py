@@ -0,0 +1,288 @@
+"""
+Post Query Module
+Faceted post filtering for the Trends page: any combination of competitor, keyword,
+post type, date range, minimum likes/comments/views and hashtag, with facet counts
+returned in the same round trip
+"""
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Optional, List, Tuple
+from datetime import datetime, date, time as dtime
+import json
+import os
+from database import get_db_connection
+from ttlcache import TTLCache
+import pagination
+import posttags
+import changefeed
+
+router = APIRouter(prefix="/api/posts", tags=["posts"])
+
+# Facet counts are cached per filter combination (seconds)
+FACET_CACHE_TTL = int(os.getenv("POST_FACET_CACHE_TTL", "60"))
+FACET_LIMIT = 10
+MAX_PAGE_SIZE = 100
+
+_facets = TTLCache(maxsize=512, ttl=FACET_CACHE_TTL)
+
+
+def _on_posts_changed(changes):
+    _facets.clear()
+    pagination.invalidate_counts()
+
+
+changefeed.subscribe("post_data", _on_posts_changed)
+
+POST_COLUMNS = '''
+    id, post_id, post_type, short_code, url, input_url,
+    caption, caption_zh, alt, alt_zh,
+    hashtags, hashtags_zh, mentions,
+    comments_count, likes_count, is_comments_disabled,
+    first_comment, first_comment_zh,
+    latest_comments, latest_comments_zh,
+    dimensions_height, dimensions_width,
+    display_url, display_url_base64,
+    video_url, video_url_base64, video_duration,
+    video_view_count, video_play_count,
+    images, images_base64, child_posts,
+    videos, videos_base64, child_posts_order,
+    owner_id, owner_username, owner_full_name, owner_full_name_zh,
+    timestamp, is_pinned, is_sponsored, product_type,
+    engagement_rate, viral_score,
+    competitor_id, search_id, created_at, updated_at
+'''
+
+JSON_FIELDS = ['hashtags', 'hashtags_zh', 'mentions',
+               'latest_comments', 'latest_comments_zh',
+               'images', 'images_base64', 'child_posts',
+               'videos', 'videos_base64', 'child_posts_order']
+
+
+# ============================================
+# Request/Response Models
+# ============================================
+
+class PostFilters(BaseModel):
+    competitor: Optional[str] = None  # owner_username
+    keyword: Optional[str] = None
+    post_type: Optional[str] = None  # Image / Video / Sidecar / Sidecar_video, "all" for no filter
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None  # inclusive
+    min_likes: Optional[int] = None
+    min_comments: Optional[int] = None
+    min_views: Optional[int] = None
+    hashtag: Optional[str] = None
+
+
+# ============================================
+# Helper Functions
+# ============================================
+
+def build_conditions(filters: PostFilters, exclude: Optional[str] = None) -> Tuple[List[str], list]:
+    """
+    Build WHERE conditions for the filters (the facet being counted is excluded,
+    so each facet shows the counts the user would get by changing only that filter)
+
+    Returns:
+        Tuple[List[str], list]: (SQL conditions, parameters)
+    """
+    conditions, params = [], []
+
+    if filters.competitor and exclude != 'competitor':
+        conditions.append("owner_username = %s")
+        params.append(filters.competitor)
+
+    if filters.keyword:
+        conditions.append("search_id = (SELECT s.id FROM search s WHERE s.keyword = %s)")
+        params.append(filters.keyword)
+
+    if filters.post_type and filters.post_type != "all" and exclude != 'post_type':
+        conditions.append("post_type = %s")
+        params.append(filters.post_type)
+
+    if filters.date_from:
+        conditions.append('"timestamp" >= %s')
+        params.append(datetime.combine(filters.date_from, dtime.min))
+
+    if filters.date_to:
+        conditions.append('"timestamp" <= %s')
+        params.append(datetime.combine(filters.date_to, dtime.max))
+
+    if filters.min_likes is not None:
+        conditions.append("likes_count >= %s")
+        params.append(filters.min_likes)
+
+    if filters.min_comments is not None:
+        conditions.append("comments_count >= %s")
+        params.append(filters.min_comments)
+
+    if filters.min_views is not None:
+        conditions.append("GREATEST(video_view_count, video_play_count) >= %s")
+        params.append(filters.min_views)
+
+    if filters.hashtag and exclude != 'hashtag':
+        conditions.append("id IN (SELECT ph.post_data_id FROM post_hashtag ph WHERE ph.tag = %s)")
+        params.append(posttags.normalize_tag(filters.hashtag))
+
+    return conditions, params
+
+
+def where_clause(conditions: List[str]) -> str:
+    return " WHERE " + " AND ".join(conditions) if conditions else " WHERE TRUE"
+
+
+def get_facets(cursor, filters: PostFilters) -> dict:
+    """
+    Count total matches and the post_type / competitor / hashtag facets in one statement
+    """
+    key = tuple(sorted(filters.dict().items()))
+    cached = _facets.get(key)
+    if cached is not None:
+        return cached
+
+    total_cond, total_params = build_conditions(filters)
+    type_cond, type_params = build_conditions(filters, exclude='post_type')
+    owner_cond, owner_params = build_conditions(filters, exclude='competitor')
+    tag_cond, tag_params = build_conditions(filters, exclude='hashtag')
+
+    cursor.execute(f'''
+        SELECT
+            (SELECT COUNT(*) FROM post_data{where_clause(total_cond)}) AS total,
+            (SELECT COALESCE(json_object_agg(post_type, n), '{{}}'::json) FROM (
+                SELECT post_type, COUNT(*) AS n FROM post_data{where_clause(type_cond)}
+                  AND post_type IS NOT NULL
+                GROUP BY post_type
+            ) t) AS post_type,
+            (SELECT COALESCE(json_agg(json_build_object('value', owner_username, 'count', n)), '[]'::json) FROM (
+                SELECT owner_username, COUNT(*) AS n FROM post_data{where_clause(owner_cond)}
+                  AND owner_username IS NOT NULL
+                GROUP BY owner_username ORDER BY n DESC LIMIT %s
+            ) t) AS competitor,
+            (SELECT COALESCE(json_agg(json_build_object('value', tag, 'count', n)), '[]'::json) FROM (
+                SELECT h.tag, COUNT(*) AS n
+                FROM post_hashtag h JOIN post_data ON post_data.id = h.post_data_id{where_clause(tag_cond)}
+                GROUP BY h.tag ORDER BY n DESC LIMIT %s
+            ) t) AS hashtag
+    ''', total_params + type_params + owner_params + [FACET_LIMIT] + tag_params + [FACET_LIMIT])
+
+    row = cursor.fetchone()
+    facets = {
+        "total": row['total'],
+        "post_type": row['post_type'],
+        "competitor": row['competitor'],
+        "hashtag": row['hashtag'],
+    }
+    _facets.set(key, facets)
+    return facets
+
+
+def query_posts(filters: PostFilters, page_size: int = 20, cursor: Optional[str] = None,
+                include_facets: bool = True) -> dict:
+    """
+    Run a faceted post query
+
+    Args:
+        filters: Filter combination
+        page_size: Posts per page
+        cursor: next_cursor from the previous page
+        include_facets: Also return total and facet counts
+
+    Returns:
+        dict: {data, pagination, facets}
+    """
+    conn = get_db_connection()
+    try:
+        db_cursor = conn.cursor()
+        conditions, params = build_conditions(filters)
+        query = f"SELECT {POST_COLUMNS} FROM post_data{where_clause(conditions)}"
+        posts, next_cursor = pagination.fetch_page(db_cursor, query, params, page_size, cursor)
+        facets = get_facets(db_cursor, filters) if include_facets else None
+        db_cursor.close()
+    finally:
+        conn.close()
+
+    result = []
+    for post in posts:
+        post_dict = dict(post)
+        for field in JSON_FIELDS:
+            if isinstance(post_dict.get(field), str):
+                try:
+                    post_dict[field] = json.loads(post_dict[field])
+                except ValueError:
+                    pass
+        result.append(post_dict)
+
+    return {
+        "data": result,
+        "pagination": {
+            "page_size": page_size,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+        },
+        "facets": facets,
+    }
+
+
+# ============================================
+# API Endpoints
+# ============================================
+
+@router.get("/query")
+def query_posts_endpoint(
+    competitor: Optional[str] = None,
+    keyword: Optional[str] = None,
+    post_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    min_likes: Optional[int] = None,
+    min_comments: Optional[int] = None,
+    min_views: Optional[int] = None,
+    hashtag: Optional[str] = None,
+    page_size: int = 20,
+    cursor: Optional[str] = None,
+    facets: bool = True,
+):
+    """
+    Filter posts by any combination of competitor, keyword, post_type, date range,
+    minimum likes/comments/views and hashtag
+
+    Returns posts newest first (cursor paginated) plus facet counts:
+    - total: number of matching posts
+    - post_type: {type: count} ignoring the post_type filter
+    - competitor: top competitors ignoring the competitor filter
+    - hashtag: top hashtags ignoring the hashtag filter
+    """
+    if page_size < 1 or page_size > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    if cursor:
+        try:
+            pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    filters = PostFilters(
+        competitor=competitor, keyword=keyword, post_type=post_type,
+        date_from=date_from, date_to=date_to,
+        min_likes=min_likes, min_comments=min_comments, min_views=min_views,
+        hashtag=hashtag,
+    )
+
+    try:
+        return {"success": True, **query_posts(filters, page_size, cursor, include_facets=facets)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询帖子失败: {str(e)}")
+
+
+@router.get("/query/stats")
+def get_query_stats():
+    """
+    Facet / total count cache statistics
+    """
+    return {
+        "success": True,
+        "data": {
+            "facets": _facets.stats(),
+            "facet_ttl_seconds": FACET_CACHE_TTL,
+            **pagination.get_stats(),
+        },
+    }
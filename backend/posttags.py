@@ -0,0 +1,144 @@
+"""
+帖子话题标签 / 提及索引
+post_data.hashtags / mentions 只是 JSONB 数组，按标签查找或统计需要展开每一行；
+这里把规范化后的标签写入 post_hashtag / post_mention 表（抓取入库时同步维护），
+按标签查帖子、统计热门标签都走索引。
+
+已有数据回填：
+    python posttags.py --backfill
+"""
+import argparse
+import json
+import re
+import sys
+import time
+import unicodedata
+from typing import Iterable, List, Optional
+
+from psycopg2.extras import execute_values
+
+from database import get_db_connection
+
+# 标签最大长度（与表字段一致）
+MAX_TAG_LENGTH = 200
+
+# 从正文中提取话题标签（Instagram 标签可包含任意语言的字母、数字、下划线）
+HASHTAG_PATTERN = re.compile(r"#(\w+)", re.UNICODE)
+
+
+def normalize_tag(tag: str) -> str:
+    """
+    规范化标签：去掉 #/@ 前缀和空白，NFKC 统一全角/兼容字符，casefold 忽略大小写
+
+    Returns:
+        str: 规范化后的标签，无效时返回空字符串
+    """
+    if not isinstance(tag, str):
+        return ""
+    tag = unicodedata.normalize("NFKC", tag).strip().lstrip("#@").strip()
+    return tag.casefold()[:MAX_TAG_LENGTH]
+
+
+def normalize_tags(tags: Optional[Iterable]) -> List[str]:
+    """规范化并去重（保持原有顺序）"""
+    if isinstance(tags, str):
+        try:
+            tags = json.loads(tags)
+        except ValueError:
+            tags = [tags]
+    result = []
+    for tag in tags or []:
+        normalized = normalize_tag(tag)
+        if normalized and normalized not in result:
+            result.append(normalized)
+    return result
+
+
+def extract_hashtags(hashtags: Optional[Iterable], caption: Optional[str] = None) -> List[str]:
+    """抓取结果中的 hashtags 为空时，从正文中提取"""
+    tags = normalize_tags(hashtags)
+    if not tags and caption:
+        tags = normalize_tags(HASHTAG_PATTERN.findall(caption))
+    return tags
+
+
+def sync_post_tags(cursor, post_data_id: int, hashtags, mentions, posted_at=None, caption: Optional[str] = None):
+    """
+    同步一条帖子的标签和提及（调用方提交事务）
+
+    Args:
+        cursor: 数据库游标
+        post_data_id: post_data.id
+        hashtags: 抓取结果中的 hashtags
+        mentions: 抓取结果中的 mentions
+        posted_at: 帖子发布时间（冗余存储，按时间窗口统计时无需回表）
+        caption: 帖子正文（hashtags 为空时从中提取）
+    """
+    tags = extract_hashtags(hashtags, caption)
+    usernames = normalize_tags(mentions)
+
+    cursor.execute("DELETE FROM post_hashtag WHERE post_data_id = %s", (post_data_id,))
+    cursor.execute("DELETE FROM post_mention WHERE post_data_id = %s", (post_data_id,))
+
+    if tags:
+        execute_values(cursor, '''
+            INSERT INTO post_hashtag (post_data_id, tag, posted_at) VALUES %s
+            ON CONFLICT (post_data_id, tag) DO NOTHING
+        ''', [(post_data_id, tag, posted_at) for tag in tags])
+
+    if usernames:
+        execute_values(cursor, '''
+            INSERT INTO post_mention (post_data_id, username, posted_at) VALUES %s
+            ON CONFLICT (post_data_id, username) DO NOTHING
+        ''', [(post_data_id, username, posted_at) for username in usernames])
+
+
+def backfill(batch_size: int = 1000) -> int:
+    """
+    为已有帖子回填 post_hashtag / post_mention（可重复执行）
+
+    Returns:
+        int: 处理的帖子数量
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    processed, last_id = 0, 0
+    start = time.time()
+    while True:
+        cursor.execute('''
+            SELECT id, hashtags, mentions, caption, "timestamp"
+            FROM post_data
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+        ''', (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        for row in rows:
+            sync_post_tags(cursor, row['id'], row['hashtags'], row['mentions'], row['timestamp'], row['caption'])
+        conn.commit()
+
+        processed += len(rows)
+        last_id = rows[-1]['id']
+        print(f"  已回填 {processed} 条帖子 ({time.time() - start:.0f}s)")
+
+    cursor.close()
+    conn.close()
+    return processed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="post_hashtag / post_mention 回填工具")
+    parser.add_argument("--backfill", action="store_true", help="为已有帖子回填标签和提及")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.print_help()
+        sys.exit(1)
+
+    total = backfill(args.batch_size)
+    print(f"✅ 回填完成，共处理 {total} 条帖子")
@@ -0,0 +1,219 @@
+"""
+静态提示词上下文缓存
+把提示词模板中固定不变的品牌/红线/输出格式说明注册为 Gemini 缓存上下文（CachedContent），
+请求只发送变化的文案和媒体；缓存创建失败（如 token 数不足最低要求）时退化为 system_instruction，
+固定前缀放在请求最前面，仍可命中 Gemini 的隐式前缀缓存。同时记录 token 与延迟统计
+"""
+import hashlib
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional
+
+from ttlcache import TTLCache
+
+# google-genai 延迟到第一次生成请求时加载（缩短应用启动时间）
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# 显式缓存的有效期（秒），本地记录提前 5 分钟过期
+CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+# 是否启用显式缓存（关闭时只使用 system_instruction 方式）
+CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+
+# 创建失败后多久重试（秒）；前缀 token 数不足最低要求时按完整有效期记录
+CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "60"))
+
+# (api_key, model, 前缀哈希) -> 缓存名称；创建失败时记为空字符串，避免每次请求都重试
+_cached_contents = TTLCache(maxsize=64, ttl=max(CONTEXT_CACHE_TTL - 300, 60))
+_create_locks = {}
+_create_locks_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _prefix_key(api_key: str, model: str, system_instruction: str) -> tuple:
+    digest = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+    return (api_key, model, digest)
+
+
+@contextmanager
+def _create_lock(key):
+    """同一前缀只创建一次缓存；不同模板 / API Key 互不阻塞，创建结束后移除"""
+    with _create_locks_lock:
+        lock = _create_locks.get(key)
+        if lock is None:
+            lock = _create_locks[key] = threading.Lock()
+    try:
+        with lock:
+            yield
+    finally:
+        with _create_locks_lock:
+            if _create_locks.get(key) is lock:
+                del _create_locks[key]
+
+
+def _is_too_small(error: Exception) -> bool:
+    """前缀未达到显式缓存的最低 token 数（重试也不会成功）"""
+    message = str(error).lower()
+    return "token" in message and ("minimum" in message or "min_total_token_count" in message
+                                   or "too small" in message)
+
+
+def get_cached_content(client, api_key: str, model: str, system_instruction: str, label: str) -> Optional[str]:
+    """
+    获取（必要时创建）固定前缀对应的 Gemini 缓存上下文
+
+    Returns:
+        Optional[str]: 缓存名称，不可用时返回 None
+    """
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+
+    key = _prefix_key(api_key, model, system_instruction)
+    name = _cached_contents.get(key)
+    if name is not None:
+        return name or None
+
+    with _create_lock(key):
+        name = _cached_contents.get(key)
+        if name is not None:
+            return name or None
+
+        try:
+            from google.genai import types
+            cached = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"prompt-{label}",
+                    system_instruction=system_instruction,
+                    ttl=f"{CONTEXT_CACHE_TTL}s",
+                ),
+            )
+            logger.info(f"Registered Gemini context cache {cached.name} for {label}")
+            _cached_contents.set(key, cached.name)
+            return cached.name
+        except Exception as e:
+            # 前缀 token 数不足时在有效期内不再尝试；限流、服务端错误等临时失败稍后重试
+            logger.warning(f"Context cache unavailable for {label}, falling back to system_instruction: {e}")
+            _cached_contents.set(key, "", ttl=None if _is_too_small(e) else CONTEXT_CACHE_RETRY_SECONDS)
+            return None
+
+
+def _record(label: str, mode: str, usage, prefix_chars: int, elapsed: float):
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+    output_tokens = getattr(usage, "candidates_token_count", None) or 0
+
+    with _stats_lock:
+        stats = _stats.setdefault(label, {
+            "requests": 0,
+            "modes": {},
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "static_prefix_chars": 0,
+            "total_seconds": 0.0,
+        })
+        stats["requests"] += 1
+        stats["modes"][mode] = stats["modes"].get(mode, 0) + 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_tokens"] += cached_tokens
+        stats["output_tokens"] += output_tokens
+        stats["static_prefix_chars"] = prefix_chars
+        stats["total_seconds"] += elapsed
+
+
+def structured_output_config(response_schema: Optional[dict] = None, **kwargs) -> "types.GenerateContentConfig":
+    """生成配置；传入 response_schema 时要求模型按 schema 输出 JSON"""
+    from google.genai import types
+    if response_schema:
+        kwargs["response_mime_type"] = "application/json"
+        kwargs["response_schema"] = response_schema
+    return types.GenerateContentConfig(**kwargs)
+
+
+def _build_config(client, api_key: str, model: str, system_instruction: str, label: str,
+                  response_schema: Optional[dict] = None):
+    """有缓存上下文时引用缓存，否则把固定前缀作为 system_instruction 发送"""
+    cache_name = get_cached_content(client, api_key, model, system_instruction, label)
+    if cache_name:
+        return structured_output_config(response_schema, cached_content=cache_name), "cached_content"
+    return structured_output_config(response_schema, system_instruction=system_instruction), "system_instruction"
+
+
+def generate_content(client, api_key: str, model: str, system_instruction: str, contents, label: str,
+                     response_schema: Optional[dict] = None):
+    """
+    以固定前缀 + 变化内容的方式调用 generate_content
+
+    Args:
+        client: genai.Client
+        api_key: 客户端对应的 API Key（用于区分缓存）
+        model: 模型名称
+        system_instruction: 固定不变的提示词前缀
+        contents: 变化的内容（媒体 + 文案）
+        label: 统计标签（如 image_sidecar / video / shot_script）
+        response_schema: 结构化输出的 JSON schema（可选）
+
+    Returns:
+        GenerateContentResponse
+    """
+    config, mode = _build_config(client, api_key, model, system_instruction, label, response_schema)
+
+    start = time.perf_counter()
+    try:
+        response = client.models.generate_content(model=model, contents=contents, config=config)
+    except Exception:
+        if mode == "cached_content":
+            # 缓存可能已在服务端过期，下次请求重新创建
+            _cached_contents.pop(_prefix_key(api_key, model, system_instruction))
+        raise
+
+    _record(label, mode, getattr(response, "usage_metadata", None), len(system_instruction),
+            time.perf_counter() - start)
+    return response
+
+
+def generate_content_stream(client, api_key: str, model: str, system_instruction: str, contents, label: str):
+    """
+    generate_content 的流式版本，逐块返回响应（usage 统计取最后一个带 usage_metadata 的块）
+
+    Yields:
+        GenerateContentResponse: 响应块
+    """
+    config, mode = _build_config(client, api_key, model, system_instruction, label)
+
+    start = time.perf_counter()
+    usage = None
+    try:
+        for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+            if getattr(chunk, "usage_metadata", None) is not None:
+                usage = chunk.usage_metadata
+            yield chunk
+    except Exception:
+        if mode == "cached_content":
+            _cached_contents.pop(_prefix_key(api_key, model, system_instruction))
+        raise
+
+    _record(label, mode, usage, len(system_instruction), time.perf_counter() - start)
+
+
+def get_stats() -> dict:
+    """各模板的 token 与延迟统计，cached_ratio 为命中缓存的输入 token 占比"""
+    with _stats_lock:
+        snapshot = {}
+        for label, stats in _stats.items():
+            item = dict(stats)
+            item["modes"] = dict(stats["modes"])
+            item["avg_seconds"] = round(stats["total_seconds"] / stats["requests"], 2) if stats["requests"] else 0
+            item["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0
+            item["total_seconds"] = round(stats["total_seconds"], 1)
+            snapshot[label] = item
+    return snapshot
@@ -0,0 +1,124 @@
+"""
+读接口响应缓存
+竞品列表、关键词列表、统计数据、爆款脚本等接口只有在抓取 / 分析完成后数据才会变化，
+这里按接口分区缓存序列化后的 JSON 响应（各分区独立的有效期和容量上限），
+由保存 / 删除路径调用 invalidate() 失效，并支持 ETag / If-None-Match 返回 304
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+import changefeed
+from ttlcache import TTLCache
+
+_MISSING = object()
+
+# 分区名 -> (默认有效期秒数, 容量上限)，有效期可通过 RESPONSE_CACHE_TTL_<分区名大写> 覆盖
+REGIONS = {
+    "competitors": (300, 4),
+    "competitor_stats": (60, 4),
+    "keywords": (300, 4),
+    "keyword_stats": (60, 4),
+    "popular_scripts": (300, 256),  # 按 user_id 缓存
+}
+
+# 浏览器每次都携带 If-None-Match 重新验证，数据未变化时只返回 304
+CACHE_CONTROL = "private, no-cache"
+
+_caches: Dict[str, TTLCache] = {
+    name: TTLCache(maxsize=maxsize, ttl=int(os.getenv(f"RESPONSE_CACHE_TTL_{name.upper()}", str(ttl))))
+    for name, (ttl, maxsize) in REGIONS.items()
+}
+_versions: Dict[str, int] = {name: 0 for name in REGIONS}
+_lock = threading.Lock()
+
+
+def invalidate(*regions: str, key: Hashable = _MISSING):
+    """
+    失效缓存分区（写入路径在提交事务后调用）
+
+    Args:
+        regions: 分区名
+        key: 只失效分区内的单个条目（如某个 user_id），不传时清空整个分区
+    """
+    with _lock:
+        for region in regions:
+            _versions[region] += 1
+            if key is _MISSING:
+                _caches[region].clear()
+            else:
+                _caches[region].pop(key)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def cached_json(request: Request, region: str, key: Optional[Hashable], build: Callable[[], Any]) -> Response:
+    """
+    返回缓存的 JSON 响应，未命中时调用 build() 生成
+
+    生成期间分区被失效时，结果只返回给本次请求，不写入缓存（避免缓存旧数据）
+
+    Args:
+        request: 当前请求（读取 If-None-Match）
+        region: 分区名
+        key: 分区内的缓存键
+        build: 生成响应数据的函数
+    """
+    cache = _caches[region]
+    entry = cache.get(key)
+    if entry is None:
+        version = _versions[region]
+        body = json.dumps(jsonable_encoder(build()), ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = (body, etag)
+        with _lock:
+            if version == _versions[region]:
+                cache.set(key, entry)
+
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# 表变更通知（changefeed.py）对应失效的分区（popular 按 user_id 单独处理）
+TABLE_REGIONS = {
+    "competitor": ("competitors", "competitor_stats"),
+    "search": ("keywords", "keyword_stats"),
+    "post_data": ("competitor_stats", "keyword_stats", "popular_scripts"),
+    "popular": ("popular_scripts",),
+}
+
+
+def _on_table_change(changes: changefeed.TableChanges):
+    """其他 worker 的写入也会经变更通知失效本进程的缓存"""
+    user_ids = changes.values.get("user_id")
+    if changes.table == "popular" and user_ids and not changes.resync:
+        for user_id in user_ids:
+            invalidate("popular_scripts", key=int(user_id))
+    else:
+        invalidate(*TABLE_REGIONS[changes.table])
+
+
+for _table in TABLE_REGIONS:
+    changefeed.subscribe(_table, _on_table_change)
+
+
+def get_stats() -> dict:
+    """各分区命中率统计"""
+    return {
+        name: {**cache.stats(), "ttl_seconds": cache.ttl, "version": _versions[name]}
+        for name, cache in _caches.items()
+    }
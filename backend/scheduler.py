@@ -1,8 +1,14 @@
+import logging
 import schedule
 import time
-from datetime import datetime
+import logconfig
+import monitoring
+import tracing
 from cpostscrape import scrape_posts, save_posts_to_db, get_db_connection
 from translate import translate_competitor
+from postmetrics import purge_snapshots
+
+logger = logging.getLogger(__name__)
 
 def get_all_competitors():
     """获取所有竞品用户名"""
@@ -30,6 +36,7 @@ def check_post_exists(post_id):
     
     return result is not None
 
+@tracing.traced("incremental_scrape", root=True, attributes=("username",))
 def incremental_scrape_competitor(username):
     """
     增量抓取竞品数据
@@ -47,10 +54,7 @@ def incremental_scrape_competitor(username):
     Returns:
         dict: 抓取结果统计
     """
-    print(f"\n{'='*60}")
-    print(f"开始增量抓取竞品: {username}")
-    print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*60}\n")
+    logger.info("开始增量抓取竞品: %s", username)
     
     total_new_posts = 0
     total_updated_posts = 0
@@ -58,13 +62,13 @@ def incremental_scrape_competitor(username):
     max_batches = 50  # 最多抓取 50 次（防止无限循环）
     
     for batch_num in range(1, max_batches + 1):
-        print(f"\n📥 第 {batch_num} 轮抓取...")
+        logger.debug("第 %s 轮抓取", batch_num, extra={"username": username})
         
         # 抓取 1 条 posts 类型的帖子
         posts = scrape_posts(username, batch_size, scrape_type="posts")
         
         if not posts:
-            print(f"  ⚠️  未获取到帖子，停止抓取")
+            logger.info("未获取到帖子，停止抓取", extra={"username": username})
             break
         
         # 检查这条帖子是否已存在
@@ -73,19 +77,15 @@ def incremental_scrape_competitor(username):
         exists = check_post_exists(post_id)
         
         if exists:
-            print(f"  ✅ 发现已存在的帖子: {post_id}")
-            print(f"  🔄 覆盖更新并停止抓取...")
+            logger.debug("发现已存在的帖子，覆盖更新并停止抓取", extra={"post_id": post_id})
             
             # 保存（会自动覆盖）
             saved = save_posts_to_db(posts, username)
             if saved > 0:
                 total_updated_posts += saved
-            
-            print(f"  ✅ 已覆盖帖子，停止抓取")
             break
         else:
-            print(f"  🆕 发现新帖子: {post_id}")
-            print(f"  💾 保存并继续抓取...")
+            logger.debug("发现新帖子，保存并继续抓取", extra={"post_id": post_id})
             
             # 保存新帖子
             saved = save_posts_to_db(posts, username)
@@ -95,11 +95,7 @@ def incremental_scrape_competitor(username):
             # 继续下一轮抓取
             continue
     
-    print(f"\n{'='*60}")
-    print(f"抓取完成: {username}")
-    print(f"新增帖子: {total_new_posts} 条")
-    print(f"更新帖子: {total_updated_posts} 条")
-    print(f"{'='*60}\n")
+    logger.info("抓取完成: %s, 新增帖子: %s 条, 更新帖子: %s 条", username, total_new_posts, total_updated_posts)
     
     return {
         "username": username,
@@ -108,22 +104,25 @@ def incremental_scrape_competitor(username):
         "total": total_new_posts + total_updated_posts
     }
 
+@monitoring.scheduled_job("daily_competitor_scrape")
 def daily_competitor_scrape():
-    """每日定时抓取所有竞品"""
-    print(f"\n🕒 开始每日竞品抓取任务")
-    print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*80}\n")
+    """
+    每日定时抓取所有竞品
+
+    Returns:
+        bool: 全部竞品抓取成功时为 True（异常不向外抛出，以免中断调度循环）
+    """
+    logger.info("开始每日竞品抓取任务")
     
     try:
         # 获取所有竞品
         competitors = get_all_competitors()
         
         if not competitors:
-            print("⚠️  没有找到竞品，跳过抓取")
-            return
+            logger.warning("没有找到竞品，跳过抓取")
+            return True
         
-        print(f"📊 共找到 {len(competitors)} 个竞品")
-        print(f"{'='*80}\n")
+        logger.info("共找到 %s 个竞品", len(competitors))
         
         results = []
         
@@ -132,7 +131,7 @@ def daily_competitor_scrape():
             competitor_id = competitor['id']
             username = competitor['username']
             
-            print(f"\n[{idx}/{len(competitors)}] 处理竞品: {username} (ID: {competitor_id})")
+            logger.info("[%s/%s] 处理竞品: %s (ID: %s)", idx, len(competitors), username, competitor_id)
             
             try:
                 result = incremental_scrape_competitor(username)
@@ -140,42 +139,45 @@ def daily_competitor_scrape():
                 
                 # 休息 5 秒，避免请求过快
                 if idx < len(competitors):
-                    print(f"⏳ 等待 5 秒...")
                     time.sleep(5)
                     
             except Exception as e:
-                print(f"❌ 抓取失败: {username}, 错误: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("抓取失败: %s, 错误: %s", username, e)
                 continue
         
         # 统计总结
         total_new = sum(r['new_posts'] for r in results)
         total_updated = sum(r['updated_posts'] for r in results)
         
-        print(f"\n{'='*80}")
-        print(f"✅ 每日抓取任务完成！")
-        print(f"{'='*80}")
-        print(f"处理竞品数: {len(results)}/{len(competitors)}")
-        print(f"新增帖子: {total_new} 条")
-        print(f"更新帖子: {total_updated} 条")
-        print(f"总计: {total_new + total_updated} 条")
-        print(f"{'='*80}\n")
+        logger.info("每日抓取任务完成，处理竞品数: %s/%s, 新增帖子: %s 条, 更新帖子: %s 条",
+                    len(results), len(competitors), total_new, total_updated)
+        return len(results) == len(competitors)
         
     except Exception as e:
-        print(f"❌ 每日抓取任务失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("每日抓取任务失败: %s", e)
+        return False
+
+@monitoring.scheduled_job("purge_metric_snapshots")
+def purge_metric_snapshots():
+    """每日清理过期的互动数据快照"""
+    try:
+        purge_snapshots()
+        return True
+    except Exception as e:
+        logger.exception("清理互动数据快照失败: %s", e)
+        return False
+
+def schedule_jobs():
+    """注册每日定时任务（北京时间）"""
+    schedule.every().day.at("16:30").do(daily_competitor_scrape)
+    schedule.every().day.at("04:00").do(purge_metric_snapshots)
 
 def start_scheduler():
     """启动定时任务调度器"""
-    print("🚀 竞品自动抓取调度器已启动")
-    print(f"⏰ 每天北京时间 16:30 执行抓取任务")
-    print(f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*80}\n")
+    logger.info("竞品自动抓取调度器已启动，每天北京时间 16:30 执行抓取任务")
     
-    # 设置每天 16:30 执行
-    schedule.every().day.at("16:30").do(daily_competitor_scrape)
+    # 设置每天 16:30 执行抓取，04:00 清理过期快照
+    schedule_jobs()
     
     # 可选：立即执行一次（用于测试）
     # print("🧪 测试模式：立即执行一次抓取任务\n")
@@ -188,5 +190,6 @@ def start_scheduler():
 
 if __name__ == "__main__":
     # 直接运行时启动调度器
+    logconfig.setup()
     start_scheduler()
 
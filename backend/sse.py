@@ -0,0 +1,38 @@
+"""
+Server-Sent Events 工具
+批量分析、流式生成等长耗时接口通过 SSE 逐步推送进度，前端用 EventSource / fetch 读取
+"""
+import json
+from typing import Iterable
+
+from fastapi.responses import StreamingResponse
+
+# 心跳注释行，防止代理在长时间无数据时断开连接
+HEARTBEAT = ": keep-alive\n\n"
+
+
+def format_event(event: str, data) -> str:
+    """
+    格式化一条 SSE 事件
+
+    Args:
+        event: 事件名称
+        data: 事件数据（序列化为 JSON）
+
+    Returns:
+        str: SSE 文本帧
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def stream(events: Iterable[str]) -> StreamingResponse:
+    """把事件生成器包装为 SSE 响应（关闭 Nginx 缓冲，保证事件实时到达）"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
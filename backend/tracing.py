@@ -0,0 +1,388 @@
+"""
+作业级链路追踪
+抓取 → 入库 → 翻译是一条很长的后台流水线，这里在作业入口（竞品抓取、关键词抓取、增量抓取）
+开启一个 trace，流水线中的 Apify 调用、媒体下载、每条 SQL（database.py 游标）、外部 HTTP 调用
+（httpclient.py）和逐条翻译都记录为 span。最近的作业保存在内存中，/api/traces/jobs/{trace_id}
+返回瀑布图数据和按 span 名称汇总的耗时；结束的作业按 OTLP/JSON 格式追加到
+TRACE_EXPORT_FILE，或发送到 OpenTelemetry Collector（TRACE_OTLP_ENDPOINT，如
+http://localhost:4318/v1/traces）
+
+不在作业中的调用（普通 API 请求）不产生 span，开销只有一次 contextvar 读取
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException
+
+router = APIRouter(prefix="/api/traces", tags=["traces"])
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# 内存中保留的最近作业数
+KEEP_TRACES = int(os.getenv("TRACE_KEEP", "50"))
+# 单个作业最多记录的 span 数（超出的只计数）
+MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "5000"))
+EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "")
+OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "social-media-backend")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("trace_span", default=None)
+_NULL = nullcontext()
+
+_traces: "OrderedDict[str, Trace]" = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+class Span:
+    """一个计时区间（同时作为上下文管理器使用）"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes",
+                 "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, trace: "Trace", parent: Optional["Span"], name: str, attributes: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        self.trace.finish(self)
+        return False
+
+
+class Trace:
+    """一个作业的全部 span"""
+
+    def __init__(self, name: str, attributes: dict):
+        self.trace_id = os.urandom(16).hex()
+        self.name = name
+        self.attributes = attributes
+        self.root: Optional[Span] = None
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._lock = threading.Lock()
+
+    def finish(self, span: Span):
+        with self._lock:
+            if len(self.spans) < MAX_SPANS or span is self.root:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+        if span is self.root:
+            self.end_ns = span.end_ns
+            _exporter.submit(self)
+
+    def finished_spans(self) -> List[Span]:
+        with self._lock:
+            return list(self.spans)
+
+    def summary(self) -> dict:
+        end_ns = self.end_ns or time.time_ns()
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attributes": self.attributes,
+            "started_at": self.start_ns / 1e9,
+            "duration_ms": round((end_ns - self.start_ns) / 1e6, 1),
+            "running": not self.end_ns,
+            "spans": len(self.spans),
+            "dropped_spans": self.dropped,
+            "error": self.root.error if self.root is not None else None,
+        }
+
+
+# ============================================
+# 埋点 API
+# ============================================
+
+def current_trace_id() -> Optional[str]:
+    """当前作业的 trace id（日志关联字段使用）"""
+    current_span = _current.get()
+    return current_span.trace.trace_id if current_span is not None else None
+
+
+def span(name: str, **attributes):
+    """
+    当前作业中的子 span，不在作业中时返回空上下文
+
+    用法:
+        with tracing.span("download_image", url=url):
+            ...
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NULL
+    return Span(parent.trace, parent, name, attributes)
+
+
+def trace(name: str, **attributes):
+    """开始一个作业（已在作业中时作为子 span）"""
+    parent = _current.get()
+    if parent is not None:
+        return Span(parent.trace, parent, name, attributes)
+    if not ENABLED:
+        return _NULL
+    job = Trace(name, attributes)
+    job.root = Span(job, None, name, attributes)
+    with _traces_lock:
+        _traces[job.trace_id] = job
+        while len(_traces) > KEEP_TRACES:
+            _traces.popitem(last=False)
+    return job.root
+
+
+def annotate(**attributes):
+    """给当前 span 补充属性（不在作业中时忽略）"""
+    current_span = _current.get()
+    if current_span is not None:
+        current_span.attributes.update(attributes)
+
+
+def traced(name: Optional[str] = None, root: bool = False, attributes: tuple = ()):
+    """
+    函数装饰器
+
+    Args:
+        name: span 名称，默认为函数名
+        root: 不在作业中时开启新作业（作业入口函数使用）
+        attributes: 作为 span 属性记录的参数名
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+        signature = inspect.signature(func) if attributes else None
+        start = trace if root else span
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            attrs = {}
+            if signature is not None and (root or _current.get() is not None):
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                attrs = {key: bound[key] for key in attributes if key in bound}
+            with start(span_name, **attrs):
+                return func(*args, **kwargs)
+        return run
+    return decorator
+
+
+def bind(func):
+    """
+    让线程池中执行的函数挂在当前 span 下（线程池线程不继承 contextvars）
+
+    用法:
+        executor.submit(tracing.bind(translate_text), text)
+    """
+    parent = _current.get()
+    if parent is None:
+        return func
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+# ============================================
+# 导出（OTLP/JSON）
+# ============================================
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(job: Trace) -> dict:
+    """OpenTelemetry OTLP/JSON 格式（可直接发送给 Collector 的 /v1/traces）"""
+    spans = []
+    for item in job.finished_spans():
+        data = {
+            "traceId": job.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(item.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in item.attributes.items()],
+            "status": {"code": 2, "message": item.error} if item.error else {"code": 1},
+        }
+        if item.parent_id:
+            data["parentSpanId"] = item.parent_id
+        spans.append(data)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]
+    }
+
+
+class _Exporter:
+    """结束的作业在后台线程中写入文件 / 发送给 Collector，不阻塞抓取流程"""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=100)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.failed = 0
+
+    def submit(self, job: Trace):
+        if not (EXPORT_FILE or OTLP_ENDPOINT):
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="trace-exporter")
+                self._thread.start()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.failed += 1
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            payload = to_otlp(job)
+            try:
+                if EXPORT_FILE:
+                    with open(EXPORT_FILE, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+                if OTLP_ENDPOINT:
+                    import httpclient
+                    httpclient.post("otlp", OTLP_ENDPOINT, json=payload, timeout=(5, 30)).raise_for_status()
+                self.exported += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("导出 trace 失败 (%s): %s", job.trace_id, e)
+
+
+_exporter = _Exporter()
+
+
+# ============================================
+# 瀑布图
+# ============================================
+
+def waterfall(job: Trace) -> dict:
+    """按开始时间排列的 span（相对作业开始的偏移、层级）及按名称汇总的耗时"""
+    spans = sorted(job.finished_spans(), key=lambda s: s.start_ns)
+    parents = {s.span_id: s.parent_id for s in spans}
+    depths: Dict[str, int] = {}
+
+    def depth(span_id: Optional[str]) -> int:
+        if span_id is None or span_id not in parents:
+            return -1
+        if span_id not in depths:
+            depths[span_id] = depth(parents[span_id]) + 1
+        return depths[span_id]
+
+    rows = []
+    breakdown: Dict[str, dict] = {}
+    for item in spans:
+        duration_ms = (item.end_ns - item.start_ns) / 1e6
+        rows.append({
+            "span_id": item.span_id,
+            "parent_id": item.parent_id,
+            "name": item.name,
+            "depth": depth(item.span_id),
+            "offset_ms": round((item.start_ns - job.start_ns) / 1e6, 1),
+            "duration_ms": round(duration_ms, 1),
+            "attributes": item.attributes,
+            "error": item.error,
+        })
+        if item is job.root:
+            continue
+        stats = breakdown.setdefault(item.name, {"name": item.name, "count": 0, "total_ms": 0.0,
+                                                  "max_ms": 0.0, "errors": 0})
+        stats["count"] += 1
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+        stats["errors"] += item.error is not None
+
+    for stats in breakdown.values():
+        stats["total_ms"] = round(stats["total_ms"], 1)
+        stats["max_ms"] = round(stats["max_ms"], 1)
+
+    return {
+        **job.summary(),
+        "breakdown": sorted(breakdown.values(), key=lambda s: s["total_ms"], reverse=True),
+        "waterfall": rows,
+    }
+
+
+def _get_trace(trace_id: str) -> Trace:
+    with _traces_lock:
+        job = _traces.get(trace_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="作业追踪记录不存在或已过期")
+    return job
+
+
+# ============================================
+# API Endpoints
+# ============================================
+
+@router.get("/jobs")
+def list_traces(name: Optional[str] = None):
+    """
+    最近的作业（新的在前）
+
+    Args:
+        name: 可选，只返回该作业类型
+    """
+    with _traces_lock:
+        jobs = list(_traces.values())
+    data = [job.summary() for job in reversed(jobs) if name is None or job.name == name]
+    return {
+        "success": True,
+        "data": data,
+        "meta": {"exported": _exporter.exported, "export_failed": _exporter.failed, "enabled": ENABLED},
+    }
+
+
+@router.get("/jobs/{trace_id}")
+def get_trace_waterfall(trace_id: str):
+    """单个作业的瀑布图（运行中的作业返回已结束的 span）"""
+    return {"success": True, "data": waterfall(_get_trace(trace_id))}
+
+
+@router.get("/jobs/{trace_id}/otlp")
+def get_trace_otlp(trace_id: str):
+    """单个作业的 OTLP/JSON 数据（可导入 Jaeger / Tempo 等）"""
+    return to_otlp(_get_trace(trace_id))
@@ -1,13 +1,20 @@
 import os
 import json
+import logging
 from dotenv import load_dotenv
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import requests
+import httpclient
+import logconfig
+import monitoring
+import tracing
 from database import get_db_connection
+import responsecache
 from apiconfig import get_api_key
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # DeepSeek API配置
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 
@@ -15,6 +22,7 @@ def get_deepseek_key():
     """从apiconfig获取DeepSeek API密钥"""
     return get_api_key("DEEPSEEK_API_KEY") or os.getenv("DEEPSEEK_API_KEY", "")
 
+@tracing.traced()
 def translate_text(text, target_lang="中文", context=""):
     """使用DeepSeek API翻译文本"""
     if not text or not text.strip():
@@ -46,7 +54,8 @@ def translate_text(text, target_lang="中文", context=""):
     }
     
     try:
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=data, timeout=30)
+        with monitoring.queued("translation"):
+            response = httpclient.post("deepseek", DEEPSEEK_API_URL, headers=headers, json=data, timeout=30)
         if response.status_code == 200:
             result = response.json()
             translated = result['choices'][0]['message']['content'].strip()
@@ -54,15 +63,16 @@ def translate_text(text, target_lang="中文", context=""):
             translated = translated.strip('"').strip("'")
             return translated
         else:
-            print(f"翻译失败: {response.status_code}, {response.text}")
+            logger.warning("翻译失败: %s, %s", response.status_code, response.text[:500])
             return ""
     except Exception as e:
-        print(f"翻译错误: {e}")
+        logger.warning("翻译错误: %s", e)
         return ""
 
+@tracing.traced(attributes=("competitor_id",))
 def translate_competitor(competitor_id):
     """翻译竞品信息"""
-    print(f"开始翻译竞品信息，ID: {competitor_id}")
+    logger.info("开始翻译竞品信息，ID: %s", competitor_id)
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -72,20 +82,22 @@ def translate_competitor(competitor_id):
     competitor = cursor.fetchone()
     
     if not competitor:
-        print("竞品不存在")
+        logger.warning("竞品不存在: %s", competitor_id)
         cursor.close()
         conn.close()
         return
     
     # 并发翻译
+    # 线程池中的翻译挂在当前作业的 span 下
+    traced_translate = tracing.bind(translate_text)
     with ThreadPoolExecutor(max_workers=5) as executor:
         futures = {}
         
         if competitor['full_name']:
-            futures['full_name_zh'] = executor.submit(translate_text, competitor['full_name'])
+            futures['full_name_zh'] = executor.submit(traced_translate, competitor['full_name'])
         
         if competitor['biography']:
-            futures['biography_zh'] = executor.submit(translate_text, competitor['biography'])
+            futures['biography_zh'] = executor.submit(traced_translate, competitor['biography'])
         
         # 等待所有翻译完成
         translations = {}
@@ -93,7 +105,7 @@ def translate_competitor(competitor_id):
             try:
                 translations[field] = future.result()
             except Exception as e:
-                print(f"翻译 {field} 失败: {e}")
+                logger.warning("翻译 %s 失败: %s", field, e, extra={"competitor_id": competitor_id})
                 translations[field] = ""
     
     # 更新数据库
@@ -110,12 +122,13 @@ def translate_competitor(competitor_id):
     conn.commit()
     cursor.close()
     conn.close()
+    responsecache.invalidate("competitors")
     
-    print(f"✅ 竞品信息翻译完成")
+    logger.info("竞品信息翻译完成，ID: %s", competitor_id)
 
 def translate_posts(username):
     """翻译帖子内容"""
-    print(f"开始翻译帖子内容，用户: {username}")
+    logger.info("开始翻译帖子内容，用户: %s", username)
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -129,26 +142,28 @@ def translate_posts(username):
     ''', (username,))
     
     posts = cursor.fetchall()
-    print(f"找到 {len(posts)} 条待翻译帖子")
+    logger.info("找到 %s 条待翻译帖子", len(posts))
     
     for post in posts:
-        print(f"翻译帖子: {post['post_id']}")
+        logger.debug("翻译帖子", extra={"post_id": post['post_id'], **logconfig.SAMPLED})
         
         # 并发翻译各个字段
+        # 线程池中的翻译挂在当前作业的 span 下
+        traced_translate = tracing.bind(translate_text)
         with ThreadPoolExecutor(max_workers=10) as executor:
             futures = {}
             
             # 翻译caption
             if post['caption']:
-                futures['caption_zh'] = executor.submit(translate_text, post['caption'])
+                futures['caption_zh'] = executor.submit(traced_translate, post['caption'])
             
             # 翻译alt
             if post['alt']:
-                futures['alt_zh'] = executor.submit(translate_text, post['alt'])
+                futures['alt_zh'] = executor.submit(traced_translate, post['alt'])
             
             # 翻译owner_full_name
             if post['owner_full_name']:
-                futures['owner_full_name_zh'] = executor.submit(translate_text, post['owner_full_name'])
+                futures['owner_full_name_zh'] = executor.submit(traced_translate, post['owner_full_name'])
             
             # 翻译hashtags
             if post['hashtags']:
@@ -157,7 +172,7 @@ def translate_posts(username):
                     for idx, tag in enumerate(hashtags):
                         # 添加上下文说明这是一个标签
                         futures[f'hashtag_{idx}'] = executor.submit(
-                            translate_text, 
+                            traced_translate, 
                             tag, 
                             "中文",
                             "这是一个社交媒体标签(hashtag)，请保持简洁。"
@@ -170,14 +185,14 @@ def translate_posts(username):
                     for idx, comment in enumerate(comments[:10]):  # 只翻译前10条评论
                         if isinstance(comment, dict) and comment.get('text'):
                             futures[f'comment_{idx}'] = executor.submit(
-                                translate_text, 
+                                traced_translate, 
                                 comment['text'],
                                 "中文",
                                 "这是一条社交媒体评论。"
                             )
                         elif isinstance(comment, str):
                             futures[f'comment_{idx}'] = executor.submit(
-                                translate_text,
+                                traced_translate,
                                 comment,
                                 "中文",
                                 "这是一条社交媒体评论。"
@@ -186,7 +201,7 @@ def translate_posts(username):
             # 翻译first_comment
             if post.get('first_comment'):
                 futures['first_comment_zh'] = executor.submit(
-                    translate_text,
+                    traced_translate,
                     post['first_comment'],
                     "中文",
                     "这是该帖子的第一条评论。"
@@ -198,7 +213,7 @@ def translate_posts(username):
                 try:
                     translations[field] = future.result()
                 except Exception as e:
-                    print(f"翻译 {field} 失败: {e}")
+                    logger.warning("翻译 %s 失败: %s", field, e, extra={"post_id": post['post_id']})
                     translations[field] = ""
         
         # 处理hashtags翻译结果
@@ -242,16 +257,17 @@ def translate_posts(username):
         ))
         
         conn.commit()
-        print(f"✅ 帖子 {post['post_id']} 翻译完成")
+        logger.debug("帖子翻译完成", extra={"post_id": post['post_id'], **logconfig.SAMPLED})
     
     cursor.close()
     conn.close()
     
-    print(f"✅ 所有帖子翻译完成")
+    logger.info("所有帖子翻译完成: %s 条，用户: %s", len(posts), username)
 
+@tracing.traced(attributes=("post_db_id",))
 def translate_post_by_id(post_db_id: int):
     """根据 post_data 表中的 id 强制翻译所有 _zh 字段"""
-    print(f"开始翻译单条帖子，DB id: {post_db_id}")
+    logger.debug("开始翻译单条帖子", extra={"post_db_id": post_db_id, **logconfig.SAMPLED})
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -259,21 +275,23 @@ def translate_post_by_id(post_db_id: int):
     cursor.execute('SELECT * FROM post_data WHERE id = %s', (post_db_id,))
     post = cursor.fetchone()
     if not post:
-        print(f"❌ 未找到帖子 id={post_db_id}")
+        logger.warning("未找到帖子", extra={"post_db_id": post_db_id})
         cursor.close()
         conn.close()
         return
 
     # 并发翻译
+    # 线程池中的翻译挂在当前作业的 span 下
+    traced_translate = tracing.bind(translate_text)
     with ThreadPoolExecutor(max_workers=10) as executor:
         futures = {}
 
         if post.get('caption'):
-            futures['caption_zh'] = executor.submit(translate_text, post['caption'])
+            futures['caption_zh'] = executor.submit(traced_translate, post['caption'])
         if post.get('alt'):
-            futures['alt_zh'] = executor.submit(translate_text, post['alt'])
+            futures['alt_zh'] = executor.submit(traced_translate, post['alt'])
         if post.get('owner_full_name'):
-            futures['owner_full_name_zh'] = executor.submit(translate_text, post['owner_full_name'])
+            futures['owner_full_name_zh'] = executor.submit(traced_translate, post['owner_full_name'])
 
         # hashtags
         hashtags = None
@@ -282,7 +300,7 @@ def translate_post_by_id(post_db_id: int):
             if isinstance(hashtags, list) and hashtags:
                 for idx, tag in enumerate(hashtags):
                     futures[f'hashtag_{idx}'] = executor.submit(
-                        translate_text,
+                        traced_translate,
                         tag,
                         "中文",
                         "这是一个社交媒体标签(hashtag)，请保持简洁。"
@@ -296,14 +314,14 @@ def translate_post_by_id(post_db_id: int):
                 for idx, comment in enumerate(latest_comments[:10]):
                     if isinstance(comment, dict) and comment.get('text'):
                         futures[f'comment_{idx}'] = executor.submit(
-                            translate_text,
+                            traced_translate,
                             comment['text'],
                             "中文",
                             "这是一条社交媒体评论。"
                         )
                     elif isinstance(comment, str):
                         futures[f'comment_{idx}'] = executor.submit(
-                            translate_text,
+                            traced_translate,
                             comment,
                             "中文",
                             "这是一条社交媒体评论。"
@@ -312,7 +330,7 @@ def translate_post_by_id(post_db_id: int):
         # first_comment
         if post.get('first_comment'):
             futures['first_comment_zh'] = executor.submit(
-                translate_text,
+                traced_translate,
                 post['first_comment'],
                 "中文",
                 "这是该帖子的第一条评论。"
@@ -324,7 +342,7 @@ def translate_post_by_id(post_db_id: int):
             try:
                 translations[field] = future.result()
             except Exception as e:
-                print(f"翻译 {field} 失败: {e}")
+                logger.warning("翻译 %s 失败: %s", field, e, extra={"post_db_id": post_db_id})
                 translations[field] = ""
 
     # 构造 hashtags_zh
@@ -368,9 +386,12 @@ def translate_post_by_id(post_db_id: int):
     conn.commit()
     cursor.close()
     conn.close()
-    print(f"✅ 单条帖子翻译完成 id={post_db_id}")
+    # 爆款脚本列表展示帖子的中文文案
+    responsecache.invalidate("popular_scripts")
+    logger.debug("单条帖子翻译完成", extra={"post_db_id": post_db_id, **logconfig.SAMPLED})
 
 if __name__ == "__main__":
+    logconfig.setup()
     # 测试翻译
     test_text = "Hello, how are you?"
     result = translate_text(test_text)
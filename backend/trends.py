@@ -0,0 +1,384 @@
+"""
+Trends Module
+Incremental trending-hashtag engine: keeps the recent post_hashtag rows and engagement
+snapshots in NumPy arrays, refreshes them incrementally as posts are scraped, and ranks
+hashtags by posting velocity and engagement growth over sliding windows
+"""
+from fastapi import APIRouter, HTTPException
+from typing import Dict, List
+import logging
+import os
+import threading
+import time
+import numpy as np
+from database import get_db_connection
+import changefeed
+
+router = APIRouter(prefix="/api/trends", tags=["trends"])
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+# How far back rows are kept in memory (must cover two of the largest windows)
+LOOKBACK_DAYS = int(os.getenv("TRENDS_LOOKBACK_DAYS", "30"))
+MAX_WINDOW_DAYS = LOOKBACK_DAYS // 2
+# How often the post_data watermark is checked for newly scraped posts (seconds)
+POLL_SECONDS = int(os.getenv("TRENDS_POLL_SECONDS", "30"))
+# Incremental loads re-read rows this far behind the watermark: updated_at / captured_at are
+# transaction start times, so a long scrape transaction can commit rows older than the watermark
+WATERMARK_OVERLAP_SECONDS = int(os.getenv("TRENDS_WATERMARK_OVERLAP_SECONDS", "3600"))
+# Full reload interval, drops rows of deleted posts (seconds)
+FULL_RELOAD_SECONDS = int(os.getenv("TRENDS_FULL_RELOAD_SECONDS", str(6 * 3600)))
+# Weight of log1p(engagement growth) in the score
+ENGAGEMENT_WEIGHT = float(os.getenv("TRENDS_ENGAGEMENT_WEIGHT", "0.25"))
+
+
+class HashtagTrendEngine:
+    """
+    In-memory hashtag trend state
+
+    Tag rows (one per post/tag pair) and engagement snapshots are held as parallel
+    NumPy arrays; every ranking is a handful of vectorized bincount passes over them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self.vocab: Dict[str, int] = {}
+        self.tags: List[str] = []
+
+        # Tag rows
+        self.row_post = np.empty(0, dtype=np.int64)
+        self.row_tag = np.empty(0, dtype=np.int32)
+        self.row_posted = np.empty(0, dtype=np.float64)  # epoch seconds
+
+        # Engagement snapshots, sorted by (post, captured_at)
+        self.snap_id = np.empty(0, dtype=np.int64)
+        self.snap_post = np.empty(0, dtype=np.int64)
+        self.snap_time = np.empty(0, dtype=np.float64)
+        self.snap_engagement = np.empty(0, dtype=np.float64)
+
+        self.post_watermark = None
+        self.snapshot_watermark = None
+        self.changed = False  # post_data change notification received since the last refresh
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.refreshed_at = 0.0
+        self.generation = 0
+        self._rankings: Dict[int, tuple] = {}
+
+    # ---------- loading ----------
+
+    def _encode(self, tags: List[str]) -> np.ndarray:
+        codes = np.empty(len(tags), dtype=np.int32)
+        for i, tag in enumerate(tags):
+            code = self.vocab.get(tag)
+            if code is None:
+                code = self.vocab[tag] = len(self.tags)
+                self.tags.append(tag)
+            codes[i] = code
+        return codes
+
+    def refresh(self, full: bool = False):
+        """
+        Load tag rows and snapshots changed since the last refresh (or everything when full)
+        """
+        with self._refreshing:
+            full = full or self.loaded_at == 0 or time.time() - self.loaded_at > FULL_RELOAD_SECONDS
+            post_since = None if full else self.post_watermark
+            snapshot_since = None if full else self.snapshot_watermark
+            self.changed = False
+
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT MAX(updated_at) AS wm FROM post_data")
+                post_watermark = cursor.fetchone()['wm']
+                cursor.execute("SELECT MAX(captured_at) AS wm FROM post_metric_snapshot")
+                snapshot_watermark = cursor.fetchone()['wm']
+
+                query = '''
+                    SELECT h.post_data_id, h.tag, EXTRACT(EPOCH FROM h.posted_at) AS posted
+                    FROM post_hashtag h
+                    JOIN post_data p ON p.id = h.post_data_id
+                    WHERE h.posted_at >= (NOW() AT TIME ZONE 'UTC') - make_interval(days => %s)
+                '''
+                params = [LOOKBACK_DAYS]
+                if post_since is not None:
+                    # Overlap window; re-read posts replace their rows below
+                    query += " AND p.updated_at > %s - make_interval(secs => %s)"
+                    params.extend([post_since, WATERMARK_OVERLAP_SECONDS])
+                cursor.execute(query, params)
+                tag_rows = cursor.fetchall()
+
+                query = '''
+                    SELECT id, post_data_id, EXTRACT(EPOCH FROM captured_at) AS captured,
+                           likes_count + comments_count AS engagement
+                    FROM post_metric_snapshot
+                    WHERE captured_at >= (NOW() AT TIME ZONE 'UTC') - make_interval(days => %s)
+                '''
+                params = [LOOKBACK_DAYS]
+                if snapshot_since is not None:
+                    # Overlap window; re-read snapshots are deduplicated by id below
+                    query += " AND captured_at > %s - make_interval(secs => %s)"
+                    params.extend([snapshot_since, WATERMARK_OVERLAP_SECONDS])
+                cursor.execute(query, params)
+                snap_rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+
+            new_post = np.fromiter((r['post_data_id'] for r in tag_rows), dtype=np.int64, count=len(tag_rows))
+            new_posted = np.fromiter((float(r['posted']) for r in tag_rows), dtype=np.float64, count=len(tag_rows))
+            new_snap_id = np.fromiter((r['id'] for r in snap_rows), dtype=np.int64, count=len(snap_rows))
+            new_snap_post = np.fromiter((r['post_data_id'] for r in snap_rows), dtype=np.int64, count=len(snap_rows))
+            new_snap_time = np.fromiter((float(r['captured']) for r in snap_rows), dtype=np.float64, count=len(snap_rows))
+            new_snap_eng = np.fromiter((r['engagement'] for r in snap_rows), dtype=np.float64, count=len(snap_rows))
+
+            with self._lock:
+                if full:
+                    self.vocab, self.tags = {}, []
+                    row_post, row_tag, row_posted = new_post, None, new_posted
+                    snap_id, snap_post, snap_time, snap_eng = new_snap_id, new_snap_post, new_snap_time, new_snap_eng
+                else:
+                    # Re-scraped posts replace their previous tag rows
+                    keep = ~np.isin(self.row_post, new_post)
+                    row_post = np.concatenate([self.row_post[keep], new_post])
+                    row_tag = self.row_tag[keep]
+                    row_posted = np.concatenate([self.row_posted[keep], new_posted])
+                    keep = ~np.isin(self.snap_id, new_snap_id)
+                    snap_id = np.concatenate([self.snap_id[keep], new_snap_id])
+                    snap_post = np.concatenate([self.snap_post[keep], new_snap_post])
+                    snap_time = np.concatenate([self.snap_time[keep], new_snap_time])
+                    snap_eng = np.concatenate([self.snap_engagement[keep], new_snap_eng])
+
+                new_codes = self._encode([r['tag'] for r in tag_rows])
+                row_tag = new_codes if row_tag is None else np.concatenate([row_tag, new_codes])
+
+                # Slide the lookback window
+                horizon = time.time() - LOOKBACK_DAYS * DAY
+                live = row_posted >= horizon
+                self.row_post, self.row_tag, self.row_posted = row_post[live], row_tag[live], row_posted[live]
+
+                live = snap_time >= horizon
+                order = np.lexsort((snap_time[live], snap_post[live]))
+                self.snap_id = snap_id[live][order]
+                self.snap_post = snap_post[live][order]
+                self.snap_time = snap_time[live][order]
+                self.snap_engagement = snap_eng[live][order]
+
+                self.post_watermark = post_watermark
+                self.snapshot_watermark = snapshot_watermark
+                now = time.time()
+                if full:
+                    self.loaded_at = now
+                self.checked_at = self.refreshed_at = now
+                self.generation += 1
+                self._rankings = {}
+
+    def maybe_refresh(self):
+        """
+        Refresh in the background when newly scraped posts are detected
+        (the first call loads synchronously)
+        """
+        if self.loaded_at == 0:
+            self.refresh(full=True)
+            return
+        if time.time() - self.checked_at < POLL_SECONDS or self._refreshing.locked():
+            return
+        self.checked_at = time.time()
+
+        def check():
+            try:
+                conn = get_db_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT MAX(updated_at) AS wm FROM post_data")
+                    watermark = cursor.fetchone()['wm']
+                    cursor.close()
+                finally:
+                    conn.close()
+                stale = time.time() - self.loaded_at > FULL_RELOAD_SECONDS
+                if stale or self.changed or watermark != self.post_watermark:
+                    self.refresh()
+            except Exception as e:
+                logger.error("Trend refresh failed: %s", e)
+
+        threading.Thread(target=check, daemon=True).start()
+
+    # ---------- ranking ----------
+
+    def _engagement_growth(self, cutoff: float):
+        """
+        Engagement gained per post since cutoff
+
+        Growth = latest snapshot - last snapshot at or before cutoff. Posts with no
+        earlier snapshot count from 0 if published after cutoff, otherwise from their
+        first snapshot.
+
+        Returns:
+            (post ids sorted ascending, growth per post)
+        """
+        posts, first = np.unique(self.snap_post, return_index=True)
+        if len(posts) == 0:
+            return posts, np.empty(0)
+        last = np.append(first[1:], len(self.snap_post)) - 1
+        latest = self.snap_engagement[last]
+
+        # Publish time per snapshot post, looked up from the tag rows
+        row_posts, row_first = np.unique(self.row_post, return_index=True)
+        posted = np.zeros(len(posts))
+        if len(row_posts):
+            pos = np.minimum(np.searchsorted(row_posts, posts), len(row_posts) - 1)
+            found = row_posts[pos] == posts
+            posted[found] = self.row_posted[row_first[pos[found]]]
+
+        baseline = self.snap_engagement[first].copy()
+        baseline[posted >= cutoff] = 0
+
+        before = np.flatnonzero(self.snap_time <= cutoff)
+        if len(before):
+            # Snapshots are sorted by (post, time): the last masked index per post is the baseline
+            rev_posts, rev_idx = np.unique(self.snap_post[before][::-1], return_index=True)
+            baseline_idx = before[::-1][rev_idx]
+            baseline[np.searchsorted(posts, rev_posts)] = self.snap_engagement[baseline_idx]
+
+        return posts, np.maximum(latest - baseline, 0)
+
+    def rank(self, window_days: int) -> tuple:
+        """
+        Rank every hashtag for a window
+
+        score = log1p(posts in window) * acceleration + ENGAGEMENT_WEIGHT * log1p(engagement growth)
+        acceleration = (posts/day now + 1/W) / (posts/day in previous window + 1/W)
+        """
+        with self._lock:
+            cached = self._rankings.get(window_days)
+            if cached is not None:
+                return cached
+
+            now = time.time()
+            cutoff = now - window_days * DAY
+            previous_cutoff = now - 2 * window_days * DAY
+            n = len(self.tags)
+
+            current = self.row_posted >= cutoff
+            previous = (self.row_posted >= previous_cutoff) & ~current
+            current_posts = np.bincount(self.row_tag[current], minlength=n)
+            previous_posts = np.bincount(self.row_tag[previous], minlength=n)
+
+            growth_posts, growth = self._engagement_growth(cutoff)
+            row_growth = np.zeros(len(self.row_post))
+            if len(growth_posts):
+                pos = np.minimum(np.searchsorted(growth_posts, self.row_post), len(growth_posts) - 1)
+                matched = growth_posts[pos] == self.row_post
+                row_growth[matched] = growth[pos[matched]]
+            engagement_growth = np.bincount(self.row_tag, weights=row_growth, minlength=n)
+
+            smoothing = 1.0 / window_days
+            rate = current_posts / window_days
+            previous_rate = previous_posts / window_days
+            acceleration = (rate + smoothing) / (previous_rate + smoothing)
+            score = np.log1p(current_posts) * acceleration + ENGAGEMENT_WEIGHT * np.log1p(engagement_growth)
+
+            order = np.argsort(-score, kind="stable")
+            ranking = (order, current_posts, previous_posts, rate, previous_rate,
+                       acceleration, engagement_growth, score)
+            self._rankings[window_days] = ranking
+            return ranking
+
+    def top(self, window_days: int, limit: int, min_posts: int) -> List[dict]:
+        order, current_posts, previous_posts, rate, previous_rate, acceleration, growth, score = self.rank(window_days)
+        order = order[current_posts[order] >= min_posts][:limit]
+        return [
+            {
+                "tag": self.tags[i],
+                "posts": int(current_posts[i]),
+                "previous_posts": int(previous_posts[i]),
+                "posts_per_day": round(float(rate[i]), 3),
+                "previous_posts_per_day": round(float(previous_rate[i]), 3),
+                "acceleration": round(float(acceleration[i]), 3),
+                "engagement_growth": int(growth[i]),
+                "score": round(float(score[i]), 4),
+            }
+            for i in order
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "tags": len(self.tags),
+            "tag_rows": int(len(self.row_post)),
+            "snapshots": int(len(self.snap_post)),
+            "generation": self.generation,
+            "loaded_at": self.loaded_at,
+            "refreshed_at": self.refreshed_at,
+            "lookback_days": LOOKBACK_DAYS,
+        }
+
+
+engine = HashtagTrendEngine()
+
+def _on_posts_changed(changes: changefeed.TableChanges):
+    # Refresh on the next request instead of waiting for POLL_SECONDS; the watermark alone
+    # misses rows committed late by a long transaction (their updated_at is below the maximum)
+    engine.changed = True
+    engine.checked_at = 0.0
+
+
+changefeed.subscribe("post_data", _on_posts_changed)
+
+
+# ============================================
+# API Endpoints
+# ============================================
+
+@router.get("/hashtags")
+def get_trending_hashtags(window_days: int = 7, limit: int = 50, min_posts: int = 3):
+    """
+    Ranked trending hashtags
+
+    Args:
+        window_days: Sliding window (days); velocity is compared against the previous window of the same length
+        limit: Number of hashtags to return
+        min_posts: Minimum posts in the current window
+    """
+    if window_days < 1 or window_days > MAX_WINDOW_DAYS:
+        raise HTTPException(status_code=400, detail=f"window_days must be between 1 and {MAX_WINDOW_DAYS}")
+
+    try:
+        start = time.perf_counter()
+        engine.maybe_refresh()
+        data = engine.top(window_days, max(1, min(limit, 500)), max(0, min_posts))
+        return {
+            "success": True,
+            "data": data,
+            "meta": {
+                "window_days": window_days,
+                "refreshed_at": engine.refreshed_at,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            },
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取热门标签失败: {str(e)}")
+
+
+@router.post("/hashtags/refresh")
+def refresh_trending_hashtags(full: bool = False):
+    """
+    Force an immediate (incremental or full) refresh
+    """
+    try:
+        engine.refresh(full=full)
+        return {"success": True, "data": engine.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"刷新热门标签失败: {str(e)}")
+
+
+@router.get("/hashtags/stats")
+def get_trend_engine_stats():
+    """
+    Trend engine state
+    """
+    return {"success": True, "data": engine.stats()}
@@ -9,6 +9,8 @@ from typing import Optional, List
 from psycopg2.extras import RealDictCursor
 import json
 from database import get_db_connection
+import mediaref
+import responsecache
 
 router = APIRouter(prefix="/api/user-data", tags=["user-data"])
 
@@ -145,6 +147,7 @@ async def create_popular_data(user_id: int, data: PopularCreate):
             
             result = cur.fetchone()
             conn.commit()
+            responsecache.invalidate("popular_scripts", key=user_id)
             
             result_dict = dict(result)
             result_dict['created_at'] = result_dict['created_at'].isoformat()
@@ -227,6 +230,7 @@ async def update_popular_data(user_id: int, post_id: str, data: PopularUpdate):
             
             result = cur.fetchone()
             conn.commit()
+            responsecache.invalidate("popular_scripts", key=user_id)
             
             result_dict = dict(result)
             result_dict['created_at'] = result_dict['created_at'].isoformat()
@@ -259,6 +263,7 @@ async def delete_popular_data(user_id: int, post_id: str):
             
             result = cur.fetchone()
             conn.commit()
+            responsecache.invalidate("popular_scripts", key=user_id)
             
             if not result:
                 raise HTTPException(status_code=404, detail="Data not found or no permission")
@@ -326,9 +331,9 @@ async def get_user_mypostl_data(user_id: int):
     conn = get_db_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT id, user_id, post_id, post_type, display_url_base64, video_url_base64, 
-                       images_base64, jianyi1, jianyi2, jianyi3, prompt, 
+            cur.execute(f"""
+                SELECT id, user_id, post_id, post_type, {mediaref.MEDIA_COLUMNS}, 
+                       jianyi1, jianyi2, jianyi3, prompt, 
                        new_display_url_base64, new_images_base64, created_at, updated_at
                 FROM mypostl
                 WHERE user_id = %s
@@ -356,9 +361,9 @@ async def get_mypostl_by_id(user_id: int, post_id: str):
     conn = get_db_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT id, user_id, post_id, post_type, display_url_base64, video_url_base64, 
-                       images_base64, jianyi1, jianyi2, jianyi3, prompt, 
+            cur.execute(f"""
+                SELECT id, user_id, post_id, post_type, {mediaref.MEDIA_COLUMNS}, 
+                       jianyi1, jianyi2, jianyi3, prompt, 
                        new_display_url_base64, new_images_base64, created_at, updated_at
                 FROM mypostl
                 WHERE user_id = %s AND post_id = %s
@@ -494,8 +499,8 @@ async def update_mypostl_data(user_id: int, post_id: str, data: MyPostlUpdate):
                 UPDATE mypostl 
                 SET {', '.join(update_fields)}
                 WHERE user_id = %s AND post_id = %s
-                RETURNING id, user_id, post_id, post_type, display_url_base64, video_url_base64, 
-                          images_base64, jianyi1, jianyi2, jianyi3, prompt, 
+                RETURNING id, user_id, post_id, post_type, {mediaref.MEDIA_COLUMNS}, 
+                          jianyi1, jianyi2, jianyi3, prompt, 
                           new_display_url_base64, new_images_base64, created_at, updated_at
             """, update_values)
             
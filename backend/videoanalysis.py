@@ -7,13 +7,15 @@ from pydantic import BaseModel
 from typing import Optional
 import json
 import os
-from google import genai
-from google.genai import types
 import time
-import requests
+import httpclient
 import base64
 from psycopg2.extras import RealDictCursor
 from database import get_db_connection
+import gemini
+import prompt_cache
+import sse
+import mediaref
 
 router = APIRouter(prefix="/api/video-analysis", tags=["video-analysis"])
 
@@ -67,7 +69,8 @@ def translate_to_english_with_deepseek(text: str) -> str:
             "temperature": 0.3
         }
         
-        response = requests.post(
+        response = httpclient.post(
+            "deepseek",
             "https://api.deepseek.com/v1/chat/completions",
             headers=headers,
             json=data,
@@ -91,53 +94,17 @@ def translate_to_english_with_deepseek(text: str) -> str:
 # get_db_connection 已从 database.py 导入，无需重复定义
 
 
-def build_shot_script_prompt(jianyi1: str, jianyi3: str) -> str:
-    """
-    构建分镜头脚本生成提示词
-    
-    Args:
-        jianyi1: 包含脚本主题、内容风格、关键词、特殊要求的字段
-        jianyi3: 视频分析内容
-    
-    Returns:
-        完整的提示词
-    """
-    # 解析 jianyi1 中的各个字段
-    script_topic = ""
-    content_style = ""
-    keywords = ""
-    special_requirements = ""
-    
-    if jianyi1:
-        lines = jianyi1.split('\n')
-        for line in lines:
-            if line.startswith('脚本主题：'):
-                script_topic = line.replace('脚本主题：', '').strip()
-            elif line.startswith('内容风格：'):
-                content_style = line.replace('内容风格：', '').strip()
-            elif line.startswith('关键词：'):
-                keywords = line.replace('关键词：', '').strip()
-            elif line.startswith('特殊要求：'):
-                special_requirements = line.replace('特殊要求：', '').strip()
-    
-    # 构建完整提示词
-    prompt = f"""## (C) Capacity & Role (能力与角色)
+# 分镜头脚本提示词中固定不变的部分（角色、视觉多样性要求、任务、输出格式），
+# 作为 system_instruction / 缓存上下文发送，每次请求只发送 build_shot_script_prompt() 生成的输入部分
+SHOT_SCRIPT_SYSTEM_PROMPT = """## (C) Capacity & Role (能力与角色)
 
 你是一位顶级的病毒式内容策略师兼金牌编剧。你的核心专长是"爆款结构迁移"，即精准分析任何成功短视频（Reels/Shorts/TikTok）的叙事结构、钩子、节奏和转化策略，然后将这套"成功公式"无缝地应用到全新的主题和品牌上，创作出一个兼具病毒传播潜力和品牌价值的完整"内容包"（视频脚本 + 社媒文案）。你特别擅长通过多元化的视觉呈现来体现品牌的国际化特色。
 
 ## (I) Insight & Context (背景信息与洞察)
 
-**1. 爆款参考脚本分析 (The Proven Formula):**
+**1. 爆款参考脚本分析 (The Proven Formula) 与 2. 新内容创意简报 (The New Creative Brief):**
 
-{jianyi3}
-
-**2. 新内容创意简报 (The New Creative Brief):**
-
-*   **[INPUT-2: 脚本主题]:** {script_topic}
-*   **[INPUT-3: 内容风格]:** {content_style}
-*   **[INPUT-4: 核心关键词]:** {keywords}
-*   **[INPUT-5: 额外要求]:** {special_requirements}
-*   **[INPUT-6: 品牌/公司信息]: 我们是一家全球知名在线英语教育品牌"51 Talk"，主要提供针对青少年（3-18岁）的一对一外教在线英语课程。**
+*   在用户消息中提供（[INPUT-1] 至 [INPUT-6]）。
 
 **3. 视觉多样性要求:**
 
@@ -203,15 +170,62 @@ def build_shot_script_prompt(jianyi1: str, jianyi3: str) -> str:
 1.  **主动澄清:** 如果 [INPUT] 中的信息存在模糊或矛盾之处，请主动提出不超过2个关键问题来进行澄清，以便更好地完成任务。
 2.  **提供备选方案:** 在完成核心任务后，请在输出的末尾以 `【备选方案】` 的形式，额外提供1-2个不同的"钩子(Hook)"或"行动号召(CTA)"的创意，供用户参考和选择。"""
 
+
+def build_shot_script_prompt(jianyi1: str, jianyi3: str) -> str:
+    """
+    构建分镜头脚本生成提示词中随帖子变化的部分（参考脚本分析 + 新创意简报）
+    
+    Args:
+        jianyi1: 包含脚本主题、内容风格、关键词、特殊要求的字段
+        jianyi3: 视频分析内容
+    
+    Returns:
+        用户消息中的输入部分（固定部分见 SHOT_SCRIPT_SYSTEM_PROMPT）
+    """
+    # 解析 jianyi1 中的各个字段
+    script_topic = ""
+    content_style = ""
+    keywords = ""
+    special_requirements = ""
+    
+    if jianyi1:
+        lines = jianyi1.split('\n')
+        for line in lines:
+            if line.startswith('脚本主题：'):
+                script_topic = line.replace('脚本主题：', '').strip()
+            elif line.startswith('内容风格：'):
+                content_style = line.replace('内容风格：', '').strip()
+            elif line.startswith('关键词：'):
+                keywords = line.replace('关键词：', '').strip()
+            elif line.startswith('特殊要求：'):
+                special_requirements = line.replace('特殊要求：', '').strip()
+    
+    # 构建输入部分
+    prompt = f"""## (I) Insight & Context (背景信息与洞察)
+
+**1. 爆款参考脚本分析 (The Proven Formula):**
+
+{jianyi3}
+
+**2. 新内容创意简报 (The New Creative Brief):**
+
+*   **[INPUT-2: 脚本主题]:** {script_topic}
+*   **[INPUT-3: 内容风格]:** {content_style}
+*   **[INPUT-4: 核心关键词]:** {keywords}
+*   **[INPUT-5: 额外要求]:** {special_requirements}
+*   **[INPUT-6: 品牌/公司信息]: 我们是一家全球知名在线英语教育品牌"51 Talk"，主要提供针对青少年（3-18岁）的一对一外教在线英语课程。**
+"""
+
     return prompt
 
 
-def generate_with_google_ai(prompt: str) -> str:
+def generate_with_google_ai(prompt: str, system_instruction: Optional[str] = None) -> str:
     """
     使用 Google AI (Gemini 2.5 Pro) 生成分镜头脚本
     
     Args:
-        prompt: 提示词
+        prompt: 提示词（传入 system_instruction 时只包含变化部分）
+        system_instruction: 固定不变的提示词前缀，作为缓存上下文发送
     
     Returns:
         生成的脚本内容
@@ -220,8 +234,8 @@ def generate_with_google_ai(prompt: str) -> str:
         if not get_google_key():
             raise Exception("Google AI API密钥未配置")
         
-        # 创建客户端
-        client = genai.Client(api_key=get_google_key())
+        # 复用该 API Key 的客户端
+        client = gemini.get_client(get_google_key())
         
         print(f"正在使用 Gemini 2.5 Pro 生成分镜头脚本...")
         print(f"提示词长度: {len(prompt)} 字符")
@@ -233,10 +247,17 @@ def generate_with_google_ai(prompt: str) -> str:
         for attempt in range(max_retries):
             try:
                 print(f"尝试 {attempt + 1}/{max_retries}...")
-                response = client.models.generate_content(
-                    model='gemini-2.5-pro',
-                    contents=prompt,
-                )
+                with gemini.concurrency_slot(get_google_key()):
+                    if system_instruction:
+                        response = prompt_cache.generate_content(
+                            client, get_google_key(), 'gemini-2.5-pro',
+                            system_instruction, prompt, "shot_script"
+                        )
+                    else:
+                        response = client.models.generate_content(
+                            model='gemini-2.5-pro',
+                            contents=prompt,
+                        )
                 
                 print(f"✅ 生成完成: {len(response.text)} 字符")
                 return response.text.strip()
@@ -257,6 +278,43 @@ def generate_with_google_ai(prompt: str) -> str:
         raise Exception(f"Google AI 生成失败: {str(e)}")
 
 
+def stream_with_google_ai(prompt: str, system_instruction: str):
+    """
+    generate_with_google_ai 的流式版本，逐块返回生成的文本
+    （只有在尚未输出任何内容时失败才会重试）
+    
+    Yields:
+        str: 文本片段
+    """
+    google_key = get_google_key()
+    if not google_key:
+        raise Exception("Google AI API密钥未配置")
+    
+    client = gemini.get_client(google_key)
+    print(f"正在使用 Gemini 2.5 Pro 流式生成分镜头脚本...")
+    
+    max_retries = 3
+    for attempt in range(max_retries):
+        emitted = False
+        try:
+            with gemini.concurrency_slot(google_key):
+                for chunk in prompt_cache.generate_content_stream(
+                    client, google_key, 'gemini-2.5-pro',
+                    system_instruction, prompt, "shot_script"
+                ):
+                    if chunk.text:
+                        emitted = True
+                        yield chunk.text
+            return
+        except Exception as retry_error:
+            print(f"❌ 尝试 {attempt + 1} 失败: {str(retry_error)}")
+            if emitted or attempt == max_retries - 1:
+                raise Exception(f"Google AI 生成失败: {str(retry_error)}")
+            wait_time = (attempt + 1) * 2
+            print(f"⏳ 等待 {wait_time} 秒后重试...")
+            time.sleep(wait_time)
+
+
 # ============================================
 # Request/Response Models
 # ============================================
@@ -315,11 +373,10 @@ async def start_video_analysis(request: StartVideoAnalysisRequest, background_ta
                     "skip_generation": True
                 }
             
-            # Step 2: Get data from popular table
+            # Step 2: Get data from popular table (素材只记录引用，不读取 base64)
             cur.execute("""
                 SELECT 
-                    post_id, post_type, 
-                    display_url_base64, video_url_base64,
+                    id, post_id, post_type, 
                     jianyi3, success
                 FROM popular 
                 WHERE user_id = %s AND post_id = %s
@@ -345,21 +402,20 @@ async def start_video_analysis(request: StartVideoAnalysisRequest, background_ta
 
 特殊要求："""
             
-            # Step 4: Insert or Update mypostl with Video data from popular
+            # Step 4: Insert or Update mypostl referencing the popular media (see mediaref)
             if existing:
                 # Update existing record
-                cur.execute("""
+                cur.execute(f"""
                     UPDATE mypostl
-                    SET display_url_base64 = %s,
-                        video_url_base64 = %s,
+                    SET source_popular_id = %s,
+                        {mediaref.reset_inherited_sql(post_type)},
                         jianyi1 = %s,
                         jianyi3 = %s,
                         post_type = %s,
                         updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s AND post_id = %s
                 """, (
-                    popular_data['display_url_base64'],
-                    popular_data['video_url_base64'],
+                    popular_data['id'],
                     jianyi1_template,
                     popular_data['jianyi3'],
                     post_type,
@@ -371,14 +427,13 @@ async def start_video_analysis(request: StartVideoAnalysisRequest, background_ta
                 # Insert new record
                 cur.execute("""
                     INSERT INTO mypostl 
-                    (user_id, post_id, display_url_base64, video_url_base64, 
+                    (user_id, post_id, source_popular_id, 
                      jianyi1, jianyi3, post_type)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    VALUES (%s, %s, %s, %s, %s, %s)
                 """, (
                     request.user_id,
                     request.post_id,
-                    popular_data['display_url_base64'],
-                    popular_data['video_url_base64'],
+                    popular_data['id'],
                     jianyi1_template,
                     popular_data['jianyi3'],
                     post_type
@@ -415,8 +470,8 @@ async def get_video_analysis_data(user_id: int, post_id: str):
     
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT id, user_id, post_id, display_url_base64, video_url_base64, 
+            cur.execute(f"""
+                SELECT id, user_id, post_id, {mediaref.MEDIA_COLUMNS}, 
                        jianyi1, jianyi3, jianyi4, post_type, new_video_url_base64,
                        created_at, updated_at
                 FROM mypostl
@@ -621,7 +676,7 @@ async def generate_shot_script(request: GenerateShotScriptRequest):
             
             # Step 3: 调用 Google AI 生成
             print(f"\nStep 2: 调用 Google AI 生成...")
-            jianyi4_content = generate_with_google_ai(prompt)
+            jianyi4_content = generate_with_google_ai(prompt, system_instruction=SHOT_SCRIPT_SYSTEM_PROMPT)
             print(f"✅ 生成完成，长度: {len(jianyi4_content)} 字符")
             
             # Step 4: 保存到 mypostl 的 jianyi4 字段
@@ -658,6 +713,70 @@ async def generate_shot_script(request: GenerateShotScriptRequest):
         conn.close()
 
 
+@router.post("/generate-shot-script/stream")
+def generate_shot_script_stream(request: GenerateShotScriptRequest):
+    """
+    生成分镜头脚本（SSE 流式返回），流结束后保存到 mypostl 的 jianyi4 字段
+    
+    事件:
+    - delta: {text}
+    - done: {jianyi4, skipped}
+    - error: {detail}
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT jianyi1, jianyi3, jianyi4
+                FROM mypostl 
+                WHERE user_id = %s AND post_id = %s
+            """, (request.user_id, request.post_id))
+            data = cur.fetchone()
+    finally:
+        conn.close()
+    
+    if not data:
+        raise HTTPException(status_code=404, detail="Data not found")
+    if not data['jianyi3']:
+        raise HTTPException(status_code=400, detail="jianyi3 is empty, cannot generate shot script")
+    
+    def events():
+        # jianyi4 已存在时与非流式接口一致，直接返回
+        if data['jianyi4'] and data['jianyi4'].strip():
+            yield sse.format_event("done", {"jianyi4": data['jianyi4'], "skipped": True})
+            return
+        
+        try:
+            prompt = build_shot_script_prompt(data['jianyi1'], data['jianyi3'])
+            parts = []
+            for text in stream_with_google_ai(prompt, SHOT_SCRIPT_SYSTEM_PROMPT):
+                parts.append(text)
+                yield sse.format_event("delta", {"text": text})
+            
+            jianyi4_content = "".join(parts).strip()
+            print(f"✅ 流式生成完成，长度: {len(jianyi4_content)} 字符")
+            
+            conn = get_db_connection()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE mypostl
+                        SET jianyi4 = %s,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE user_id = %s AND post_id = %s
+                    """, (jianyi4_content, request.user_id, request.post_id))
+                conn.commit()
+            finally:
+                conn.close()
+            
+            yield sse.format_event("done", {"jianyi4": jianyi4_content, "skipped": False})
+        except Exception as e:
+            print(f"\n❌ 生成失败: {str(e)}\n")
+            yield sse.format_event("error", {"detail": f"Generation failed: {str(e)}"})
+    
+    return sse.stream(events())
+
+
 @router.post("/update-jianyi4")
 async def update_jianyi4(request: UpdateJianyi4Request):
     """
@@ -738,7 +857,7 @@ class Sora2API:
         print(f"视频配置: {aspect_ratio}, {duration}秒, {size}")
         print(f"{'='*60}\n")
         
-        response = requests.post(self.submit_url, headers=headers, data=data, timeout=30)
+        response = httpclient.post("sora2", self.submit_url, headers=headers, data=data, timeout=30)
         result = response.json()
         
         if result.get("code") in [0, 200] and "data" in result and "id" in result["data"]:
@@ -753,7 +872,7 @@ class Sora2API:
         headers = {"Authorization": self.api_key}
         params = {"id": task_id}
         
-        response = requests.get(self.detail_url, headers=headers, params=params, timeout=30)
+        response = httpclient.get("sora2", self.detail_url, headers=headers, params=params, timeout=30)
         result = response.json()
         
         if result.get("code") in [0, 200] and "data" in result:
@@ -801,7 +920,7 @@ def translate_to_english_deepseek(text: str) -> str:
             "temperature": 0.3
         }
         
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
+        response = httpclient.post("deepseek", url, headers=headers, json=payload, timeout=60)
         response.raise_for_status()
         
         result = response.json()
@@ -828,7 +947,7 @@ def download_video_to_base64(video_url: str) -> str:
     print(f"\n📥 开始下载视频: {video_url}")
     
     try:
-        response = requests.get(video_url, timeout=60)
+        response = httpclient.get("cdn", video_url, timeout=60)
         response.raise_for_status()
         
         video_data = response.content
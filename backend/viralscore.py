@@ -0,0 +1,305 @@
+"""
+Viral Score Module
+Scores every post against its own account: engagement rate (likes + comments per
+follower) and a per-account z-score of engagement adjusted for post age, so a week-old
+post is compared with what the account's week-old posts usually get. Scores are
+batch-computed with NumPy, stored in indexed post_data columns and refreshed for the
+scraped accounts after each scrape.
+
+Full recompute:
+    python viralscore.py --refresh
+"""
+from fastapi import APIRouter, HTTPException
+from typing import Iterable, Optional
+from datetime import date
+import argparse
+import json
+import logging
+import os
+import time
+import numpy as np
+from psycopg2.extras import execute_values
+from database import get_db_connection
+import logconfig
+import postquery
+
+router = APIRouter(prefix="/api/viral", tags=["viral"])
+logger = logging.getLogger(__name__)
+
+# Accounts with fewer scored posts get no z-score (too few samples for a baseline)
+MIN_POSTS = int(os.getenv("VIRAL_MIN_POSTS", "5"))
+# Default threshold for the outliers endpoint (standard deviations above the account baseline)
+OUTLIER_Z = float(os.getenv("VIRAL_OUTLIER_Z", "2.0"))
+WRITE_BATCH = 5000
+MAX_LIMIT = 200
+
+_last_refresh = {"full_at": None, "posts": 0, "elapsed_ms": 0.0}
+
+SCORE_SOURCE_QUERY = '''
+    SELECT p.id, p.owner_username,
+           EXTRACT(EPOCH FROM p."timestamp") AS posted,
+           COALESCE(p.likes_count, 0) + COALESCE(p.comments_count, 0) AS engagement,
+           COALESCE(c.followers_count, (
+               SELECT MAX(c2.followers_count) FROM competitor c2 WHERE c2.username = p.owner_username
+           )) AS followers
+    FROM post_data p
+    LEFT JOIN competitor c ON c.id = p.competitor_id
+    WHERE p.owner_username IS NOT NULL AND p."timestamp" IS NOT NULL
+'''
+
+OUTLIER_COLUMNS = '''
+    id, post_id, post_type, short_code, url,
+    caption, caption_zh, hashtags,
+    display_url, display_url_base64,
+    likes_count, comments_count, video_view_count, video_play_count,
+    owner_username, owner_full_name, timestamp,
+    engagement_rate, viral_score, viral_scored_at,
+    competitor_id, search_id
+'''
+
+
+# ============================================
+# Scoring
+# ============================================
+
+def compute_scores(owners: np.ndarray, age_hours: np.ndarray, engagement: np.ndarray,
+                   followers: np.ndarray, min_posts: int = MIN_POSTS):
+    """
+    Vectorized scoring over all posts at once
+
+    Per account, log1p(engagement) is regressed on log1p(age in hours) (older posts
+    have accumulated more engagement); a post's z-score is its residual divided by the
+    account's residual standard deviation.
+
+    Args:
+        owners: Account code per post (0..n_accounts-1)
+        age_hours: Post age in hours
+        engagement: likes + comments
+        followers: Account followers per post (0 when unknown)
+
+    Returns:
+        (engagement_rate, z_score): float arrays, NaN where undefined
+    """
+    n_owners = int(owners.max()) + 1 if len(owners) else 0
+    x = np.log1p(np.maximum(age_hours, 1.0))
+    y = np.log1p(np.maximum(engagement, 0.0))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(followers > 0, engagement / followers, np.nan)
+
+    count = np.bincount(owners, minlength=n_owners).astype(np.float64)
+    safe_count = np.maximum(count, 1)
+    mean_x = np.bincount(owners, weights=x, minlength=n_owners) / safe_count
+    mean_y = np.bincount(owners, weights=y, minlength=n_owners) / safe_count
+    dx = x - mean_x[owners]
+    dy = y - mean_y[owners]
+
+    var_x = np.bincount(owners, weights=dx * dx, minlength=n_owners)
+    cov = np.bincount(owners, weights=dx * dy, minlength=n_owners)
+    slope = np.divide(cov, var_x, out=np.zeros(n_owners), where=var_x > 1e-9)
+
+    residual = dy - slope[owners] * dx
+    dof = np.maximum(count - 2, 1)
+    std = np.sqrt(np.bincount(owners, weights=residual * residual, minlength=n_owners) / dof)
+
+    valid = (count >= min_posts) & (std > 1e-6)
+    z = np.full(len(owners), np.nan)
+    scored = valid[owners]
+    z[scored] = residual[scored] / std[owners[scored]]
+    return rate, z
+
+
+def _load(cursor, owners: Optional[list]):
+    query, params = SCORE_SOURCE_QUERY, []
+    if owners is not None:
+        query += " AND p.owner_username = ANY(%s)"
+        params.append(owners)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def _write(cursor, ids: np.ndarray, rate: np.ndarray, z: np.ndarray):
+    values = [
+        (int(post_id),
+         None if np.isnan(r) else round(float(r), 6),
+         None if np.isnan(s) else round(float(s), 4))
+        for post_id, r, s in zip(ids, rate, z)
+    ]
+    for start in range(0, len(values), WRITE_BATCH):
+        execute_values(cursor, '''
+            UPDATE post_data p
+            SET engagement_rate = v.rate, viral_score = v.score,
+                viral_scored_at = NOW() AT TIME ZONE 'UTC'
+            FROM (VALUES %s) AS v(id, rate, score)
+            WHERE p.id = v.id
+        ''', values[start:start + WRITE_BATCH],
+            template="(%s, %s::double precision, %s::double precision)",
+            page_size=1000)
+
+
+def refresh_scores(owners: Optional[Iterable[str]] = None) -> int:
+    """
+    Recompute scores for the given accounts (all accounts when None)
+
+    An account's baseline depends on all of its posts, so every post of a re-scraped
+    account is rescored, not only the new ones.
+
+    Returns:
+        int: Number of posts scored
+    """
+    if owners is not None:
+        owners = sorted({o for o in owners if o})
+        if not owners:
+            return 0
+
+    start = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        rows = _load(cursor, owners)
+        if rows:
+            n = len(rows)
+            ids = np.fromiter((r['id'] for r in rows), dtype=np.int64, count=n)
+            _, owner_codes = np.unique([r['owner_username'] for r in rows], return_inverse=True)
+            posted = np.fromiter((float(r['posted']) for r in rows), dtype=np.float64, count=n)
+            engagement = np.fromiter((r['engagement'] for r in rows), dtype=np.float64, count=n)
+            followers = np.fromiter((r['followers'] or 0 for r in rows), dtype=np.float64, count=n)
+
+            age_hours = (time.time() - posted) / 3600
+            rate, z = compute_scores(owner_codes, age_hours, engagement, followers)
+            _write(cursor, ids, rate, z)
+            conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    elapsed = round((time.perf_counter() - start) * 1000, 1)
+    if owners is None:
+        _last_refresh.update({"full_at": time.time(), "posts": len(rows), "elapsed_ms": elapsed})
+    logger.info("Viral scores refreshed: %s posts, %s accounts, %s ms",
+                len(rows), len(owners) if owners else "all", elapsed)
+    return len(rows)
+
+
+def refresh_after_scrape(owners: Iterable[str]):
+    """
+    Rescore the scraped accounts (errors are logged, never raised into the scrape)
+    """
+    try:
+        refresh_scores(owners)
+    except Exception as e:
+        logger.error("Viral score refresh failed: %s", e)
+
+
+# ============================================
+# API Endpoints
+# ============================================
+
+@router.get("/outliers")
+def get_top_outliers(
+    competitor: Optional[str] = None,
+    keyword: Optional[str] = None,
+    post_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    min_score: float = OUTLIER_Z,
+    limit: int = 50,
+):
+    """
+    Posts performing furthest above their own account's baseline
+
+    Args:
+        competitor / keyword / post_type / date_from / date_to: Same filters as /api/posts/query
+        min_score: Minimum viral z-score
+        limit: Number of posts to return
+    """
+    if limit < 1 or limit > MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_LIMIT}")
+
+    filters = postquery.PostFilters(
+        competitor=competitor, keyword=keyword, post_type=post_type,
+        date_from=date_from, date_to=date_to,
+    )
+    conditions, params = postquery.build_conditions(filters)
+    conditions.append("viral_score >= %s")
+    params.append(min_score)
+
+    try:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {OUTLIER_COLUMNS} FROM post_data{postquery.where_clause(conditions)}
+                ORDER BY viral_score DESC NULLS LAST, id DESC
+                LIMIT %s
+            ''', params + [limit])
+            posts = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        result = []
+        for post in posts:
+            post_dict = dict(post)
+            if isinstance(post_dict.get('hashtags'), str):
+                try:
+                    post_dict['hashtags'] = json.loads(post_dict['hashtags'])
+                except ValueError:
+                    pass
+            result.append(post_dict)
+
+        return {"success": True, "data": result, "meta": {"min_score": min_score, "count": len(result)}}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取爆款帖子失败: {str(e)}")
+
+
+@router.post("/refresh")
+def refresh_viral_scores(competitor: Optional[str] = None):
+    """
+    Recompute scores for one account (competitor = owner_username) or for all posts
+    """
+    try:
+        posts = refresh_scores([competitor] if competitor else None)
+        return {"success": True, "data": {"posts": posts}}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"刷新爆款评分失败: {str(e)}")
+
+
+@router.get("/stats")
+def get_viral_stats():
+    """
+    Scoring coverage and last full refresh
+    """
+    try:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) AS posts,
+                       COUNT(viral_score) AS scored,
+                       COUNT(engagement_rate) AS with_rate,
+                       COUNT(*) FILTER (WHERE viral_score >= %s) AS outliers,
+                       MAX(viral_scored_at) AS last_scored_at
+                FROM post_data
+            ''', (OUTLIER_Z,))
+            row = dict(cursor.fetchone())
+            cursor.close()
+        finally:
+            conn.close()
+        return {"success": True, "data": {**row, "last_full_refresh": _last_refresh, "min_posts": MIN_POSTS}}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取爆款评分统计失败: {str(e)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Viral score batch computation")
+    parser.add_argument("--refresh", action="store_true", help="recompute scores for all posts")
+    args = parser.parse_args()
+
+    if not args.refresh:
+        parser.print_help()
+        raise SystemExit(1)
+
+    logconfig.setup()
+    total = refresh_scores()
+    print(f"✅ 评分完成，共 {total} 条帖子")
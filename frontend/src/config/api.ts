@@ -60,6 +60,7 @@ export const API_ENDPOINTS = {
   imageAnalysisData: (userId: number, postId: string) => `/api/image-analysis/data?user_id=${userId}&post_id=${postId}`,
   imageAnalysisUpdatePrompt: '/api/image-analysis/update-prompt',
   imageAnalysisGenerateImages: '/api/image-analysis/generate-image',  // 修正：单数 image
+  imageAnalysisGenerateImagesBatch: '/api/image-analysis/generate-images/batch',  // SSE 流式返回
   
   // ========== 视频分析 ==========
   videoAnalysisStart: '/api/video-analysis/start',  // 修正：使用 start 而不是 inherit
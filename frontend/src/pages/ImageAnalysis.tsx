@@ -207,6 +207,12 @@ const ImageAnalysis = () => {
     }
   };
 
+  // 该位置是否已有生成图（已有时再次生成需要跳过缓存，生成新的变体）
+  const hasGeneratedImage = (imageIndex?: number) =>
+    imageIndex === undefined || imageIndex === null
+      ? !!data?.new_display_url_base64
+      : !!data?.new_images_base64?.[imageIndex];
+
   const handleGenerateImage = async (imageIndex?: number) => {
     if (!data) return;
 
@@ -220,6 +226,7 @@ const ImageAnalysis = () => {
           post_id: postId,
           image_index: imageIndex,
           aspect_ratio: aspectRatio,
+          force_new: hasGeneratedImage(imageIndex),
         }),
       });
 
@@ -254,6 +261,77 @@ const ImageAnalysis = () => {
     }
   };
 
+  // 批量生成多图：逐张以 SSE 事件返回，每张完成后直接写入对应位置，全部完成后刷新一次数据
+  const handleGenerateAllImages = async () => {
+    if (!data?.prompt_array?.length) return;
+
+    try {
+      setGenerating(true);
+      const response = await fetch(getApiUrl(API_ENDPOINTS.imageAnalysisGenerateImagesBatch), {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          user_id: parseInt(userId!),
+          post_id: postId,
+          aspect_ratio: aspectRatio,
+          force_new: data.prompt_array.some((_, idx) => hasGeneratedImage(idx)),
+        }),
+      });
+
+      if (!response.ok || !response.body) {
+        throw new Error("生成失败");
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let result = { succeeded: 0, failed: 0 };
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const payload = raw.match(/^data: (.*)$/m)?.[1];
+          if (!event || !payload) continue;
+
+          if (event === "image_done") {
+            const { index, image_base64 } = JSON.parse(payload);
+            setImageMode("generated");
+            setData((prev) => {
+              if (!prev) return prev;
+              const images = [...(prev.new_images_base64 || [])];
+              images[index] = image_base64;
+              return { ...prev, new_images_base64: images };
+            });
+          } else if (event === "done") {
+            result = JSON.parse(payload);
+          }
+        }
+      }
+
+      await fetchAnalysisData(true);
+
+      toast({
+        title: result.failed ? "部分生成失败" : "生成成功",
+        description: `成功 ${result.succeeded} 张，失败 ${result.failed} 张`,
+        variant: result.failed ? "destructive" : "default",
+      });
+    } catch (error) {
+      toast({
+        title: "生成失败",
+        description: "图片生成出错，请稍后重试",
+        variant: "destructive",
+      });
+    } finally {
+      setGenerating(false);
+    }
+  };
+
   const handleDownloadImage = (base64Data: string, filename: string) => {
     const link = document.createElement("a");
     link.href = `data:image/png;base64,${base64Data}`;
@@ -458,7 +536,7 @@ const ImageAnalysis = () => {
                       ) : (
                         <Wand2 className="h-4 w-4 mr-2" />
                       )}
-                      按照提示词生成图片
+                      {hasGeneratedImage() ? "重新生成图片" : "按照提示词生成图片"}
                     </Button>
                   </div>
                 </div>
@@ -657,7 +735,20 @@ const ImageAnalysis = () => {
                       ) : (
                         <Wand2 className="h-4 w-4 mr-2" />
                       )}
-                      按照提示词生成图片
+                      {hasGeneratedImage(currentImageIndex) ? "重新生成图片" : "按照提示词生成图片"}
+                    </Button>
+                    <Button
+                      variant="outline"
+                      className="w-full"
+                      onClick={handleGenerateAllImages}
+                      disabled={generating || !data.prompt_array?.length}
+                    >
+                      {generating ? (
+                        <Loader2 className="h-4 w-4 mr-2 animate-spin" />
+                      ) : (
+                        <Wand2 className="h-4 w-4 mr-2" />
+                      )}
+                      生成全部图片
                     </Button>
                   </div>
                 </div>